@@ -16,8 +16,10 @@ from mvpa.support.copy import deepcopy
 
 from mvpa.measures.base import DatasetMeasure
 from mvpa.datasets.base import Dataset
-from mvpa.datasets.splitters import NoneSplitter
-from mvpa.base import warning
+from mvpa.datasets.splitters import NoneSplitter, NFoldSplitter
+from mvpa.clfs.transerror import TransferError
+from mvpa.kernels.base import precache_kernel
+from mvpa.base import externals, warning
 from mvpa.misc.state import ConditionalAttribute, Harvestable
 from mvpa.misc.transformers import grand_mean
 
@@ -35,6 +37,12 @@ class CrossValidatedTransferError(DatasetMeasure, Harvestable):
     function (used to compute an error value for each cross-validation fold)
     and a combiner function that aggregates all computed error values across
     cross-validation folds.
+
+    Classifiers tagged 'fast_cv' (e.g. `RidgeReg`, `BLR`, `GPR`) can
+    compute exact predictions for held-out samples from a single training
+    on the full dataset.  If such a classifier is cross-validated with a
+    plain `NFoldSplitter` and plain `TransferError`, all folds can be
+    computed at the cost of a single training if `fast_cv` is enabled.
     """
 
     results = ConditionalAttribute(enabled=False, doc=
@@ -60,6 +68,8 @@ class CrossValidatedTransferError(DatasetMeasure, Harvestable):
                  harvest_attribs=None,
                  copy_attribs='copy',
                  samples_idattr='origids',
+                 nproc=1,
+                 fast_cv=False,
                  **kwargs):
         """
         Parameters
@@ -87,6 +97,22 @@ class CrossValidatedTransferError(DatasetMeasure, Harvestable):
         samples_idattr : str, optional
           What samples attribute to use to identify and store samples_errors
           conditional attribute
+        nproc : None or int, optional
+          How many processes to use for running cross-validation folds.
+          Folds are processed in child processes which operate on the
+          (read-only) source dataset and their results are merged in the
+          order of the splits.  Requires `pprocess` external module.  If
+          None -- all available cores will be used.
+        fast_cv : bool, optional
+          Either to compute all folds from a single training of
+          classifiers tagged 'fast_cv' whenever the splitter and enabled
+          conditional attributes permit (see `train_cv()` of the
+          classifier).  The classifier then remains trained on the full
+          dataset.  Requested conditional attributes which require the
+          actual splits ('splits', 'transerrors', 'training_confusion',
+          'samples_error', 'harvested') disable it.  Disabled by default
+          since the classifier gets trained on the full dataset instead of
+          on each of the splits.
         **kwargs
           All additional arguments are passed to the
           :class:`~mvpa.measures.base.DatasetMeasure` base class.
@@ -94,6 +120,16 @@ class CrossValidatedTransferError(DatasetMeasure, Harvestable):
         DatasetMeasure.__init__(self, **kwargs)
         Harvestable.__init__(self, harvest_attribs, copy_attribs)
 
+        if nproc != 1 and not externals.exists('pprocess'):
+            if nproc is None:
+                nproc = 1
+            else:
+                raise RuntimeError("The 'pprocess' module is required for "
+                                   "multiprocess cross-validation. Please "
+                                   "either install python-pprocess, or "
+                                   "reduce `nproc` to 1 (got nproc=%i)"
+                                   % nproc)
+
         if splitter is None:
             self.__splitter = NoneSplitter()
         else:
@@ -102,6 +138,8 @@ class CrossValidatedTransferError(DatasetMeasure, Harvestable):
         self.__transerror = transerror
         self.__expose_testdataset = expose_testdataset
         self.__samples_idattr = samples_idattr
+        self.__nproc = nproc
+        self.__fast_cv = fast_cv
 
 # TODO: put back in ASAP
 #    def __repr__(self):
@@ -128,7 +166,6 @@ class CrossValidatedTransferError(DatasetMeasure, Harvestable):
         # local bindings
         ca = self.ca
         clf = self.__transerror.clf
-        expose_testdataset = self.__expose_testdataset
 
         # what ca to enable in terr
         terr_enable = []
@@ -138,7 +175,6 @@ class CrossValidatedTransferError(DatasetMeasure, Harvestable):
 
         # charge ca with initial values
         summaryClass = clf.__summary_class__
-        clf_hastestdataset = hasattr(clf, 'testdataset')
 
         self.ca.confusion = summaryClass()
         self.ca.training_confusion = summaryClass()
@@ -149,6 +185,13 @@ class CrossValidatedTransferError(DatasetMeasure, Harvestable):
             self.ca.samples_error = dict(
                 [(id_, []) for id_ in dataset.sa[self.__samples_idattr].value])
 
+        # all folds at once if the classifier can do it
+        folds = self._get_fast_cv_folds(dataset)
+        if folds is not None:
+            fast_results = self._call_fast_cv(dataset, folds)
+            if fast_results is not None:
+                return fast_results
+
         # enable requested ca in child TransferError instance (restored
         # again below)
         if len(terr_enable):
@@ -160,12 +203,55 @@ class CrossValidatedTransferError(DatasetMeasure, Harvestable):
         if ca.is_enabled("transerrors"):
             self.__transerror.untrain()
 
+        # compute the kernel (if cached) only once for all the splits
+        precache_kernel(clf, dataset)
+
         # collect sum info about the split that where made for the resulting
         # dataset
         splitinfo = []
 
-        # splitter
-        for split in self.__splitter(dataset):
+        nproc = self.__nproc
+        if nproc is None:
+            import pprocess
+            try:
+                nproc = pprocess.get_number_of_cores() or 1
+            except AttributeError:
+                warning("pprocess version %s has no API to figure out maximal "
+                        "number of cores. Using 1"
+                        % externals.versions['pprocess'])
+                nproc = 1
+
+        if nproc > 1:
+            # all splits have to be known in advance to be dispatched
+            splits = list(self.__splitter(dataset))
+            # every child process works on its own (forked) copy of
+            # transerror, so there is nothing to gain from the 'mother'
+            import pprocess
+            p_results = pprocess.Map(limit=nproc)
+            if __debug__:
+                debug("CROSSC", "Starting off child processes for nproc=%i"
+                      % nproc)
+            compute = p_results.manage(
+                        pprocess.MakeParallel(self._proc_split))
+            # variables of this call (e.g. 'dataset') to harvest from
+            harvest_vars = locals().copy()
+            for split in splits:
+                compute(split, self.__transerror, True, harvest_vars)
+            # pprocess.Map returns results in the order of the calls,
+            # so merging below is deterministic (in order of the splits)
+            folds = p_results
+        else:
+            splits = self.__splitter(dataset)
+            folds = None
+
+        transerror = self.__transerror
+        # retrainable classifiers can be cheaply retrained whenever
+        # consecutive splits differ only in the targets (e.g. splitter
+        # with permute_attr and nrunspersplit > 1)
+        use_retrain = clf.params.retrainable \
+                      and not ca.is_enabled("transerrors")
+        prevsplit = None
+        for isplit, split in enumerate(splits):
             splitinfo.append(
                 "%s->%s"
                 % (','.join([str(c)
@@ -178,55 +264,55 @@ class CrossValidatedTransferError(DatasetMeasure, Harvestable):
             if ca.is_enabled("splits"):
                 self.ca.splits.append(split)
 
-            if ca.is_enabled("transerrors"):
-                # copy first and then train, as some classifiers cannot be copied
-                # when already trained, e.g. SWIG'ed stuff
-                lastsplit = None
-                for ds in split:
-                    if ds is not None:
-                        lastsplit = ds.a.lastsplit
-                        break
-                if lastsplit:
-                    # only if we could deduce that it was last split
-                    # use the 'mother' transerror
-                    transerror = self.__transerror
-                else:
-                    # otherwise -- deep copy
-                    transerror = deepcopy(self.__transerror)
+            if folds is not None:
+                fold = folds[isplit]
+                if ca.is_enabled("harvested") and 'harvested' in fold:
+                    if not ca.is_set('harvested'):
+                        ca.harvested = fold['harvested']
+                    else:
+                        for k, v in fold['harvested'].iteritems():
+                            ca.harvested[k] += v
             else:
-                transerror = self.__transerror
-
-            # assign testing dataset if given classifier can digest it
-            if clf_hastestdataset and expose_testdataset:
-                transerror.clf.testdataset = split[1]
-
-            # run the beast
-            result = transerror(split[1], split[0])
-
-            # unbind the testdataset from the classifier
-            if clf_hastestdataset and expose_testdataset:
-                transerror.clf.testdataset = None
-
-            # next line is important for 'self._harvest' call
-            self._harvest(locals())
+                if ca.is_enabled("transerrors"):
+                    # copy first and then train, as some classifiers cannot
+                    # be copied when already trained, e.g. SWIG'ed stuff
+                    lastsplit = None
+                    for ds in split:
+                        if ds is not None:
+                            lastsplit = ds.a.lastsplit
+                            break
+                    if lastsplit:
+                        # only if we could deduce that it was last split
+                        # use the 'mother' transerror
+                        transerror = self.__transerror
+                    else:
+                        # otherwise -- deep copy
+                        transerror = deepcopy(self.__transerror)
+                if use_retrain:
+                    transerror.only_targets_changed = \
+                        _same_samples(prevsplit, split)
+                    prevsplit = split
+                fold = self._proc_split(split, transerror,
+                                        harvest_vars=locals())
+
+            result = fold['result']
 
             # XXX Look below -- may be we should have not auto added .?
             #     then transerrors also could be deprecated
             if ca.is_enabled("transerrors"):
+                transerror = fold['transerror']
                 self.ca.transerrors.append(transerror)
 
             # XXX: could be merged with next for loop using a utility class
             # that can add dict elements into a list
             if ca.is_enabled("samples_error"):
-                for k, v in \
-                  transerror.ca.samples_error.iteritems():
+                for k, v in fold['samples_error'].iteritems():
                     self.ca.samples_error[k].append(v)
 
             # pull in child ca
             for state_var in ['confusion', 'training_confusion']:
                 if ca.is_enabled(state_var):
-                    ca[state_var].value.__iadd__(
-                        transerror.ca[state_var].value)
+                    ca[state_var].value.__iadd__(fold[state_var])
 
             if __debug__:
                 debug("CROSSC", "Split #%d: result %s" \
@@ -235,6 +321,7 @@ class CrossValidatedTransferError(DatasetMeasure, Harvestable):
 
         # Since we could have operated with a copy -- bind the last used one back
         self.__transerror = transerror
+        transerror.only_targets_changed = False
 
         # put ca of child TransferError back into original config
         if len(terr_enable):
@@ -246,7 +333,159 @@ class CrossValidatedTransferError(DatasetMeasure, Harvestable):
         return results
 
 
+    def _proc_split(self, split, transerror, harvest_fold=False,
+                    harvest_vars=None):
+        """Little helper to capture the parts of the computation that can be
+        parallelized
+
+        Returns a dictionary with the transfer error result of the split
+        along with the values of the enabled conditional attributes of
+        `transerror`, so they could be merged by the caller even if
+        computation was done in a child process.  `harvest_vars` provides
+        the variables of the caller (e.g. 'dataset') to be available for
+        harvesting along with the ones of the split (e.g. 'split',
+        'transerror', 'result').
+        """
+        # local bindings
+        ca = self.ca
+        clf = transerror.clf
+        expose_testdataset = self.__expose_testdataset \
+                             and hasattr(clf, 'testdataset')
+
+        # assign testing dataset if given classifier can digest it
+        if expose_testdataset:
+            clf.testdataset = split[1]
+
+        # run the beast
+        result = transerror(split[1], split[0])
+
+        # unbind the testdataset from the classifier
+        if expose_testdataset:
+            clf.testdataset = None
+
+        # harvest only what belongs to this split, if it has to be merged
+        # by the caller afterwards
+        if harvest_fold and ca.is_set('harvested'):
+            ca.reset('harvested')
+
+        # next line is important for 'self._harvest' call
+        if harvest_vars is None:
+            harvest_vars = locals()
+        else:
+            harvest_vars = dict(harvest_vars, **locals())
+        self._harvest(harvest_vars)
+
+        fold = {'result': result}
+        for state_var in ['confusion', 'training_confusion', 'samples_error']:
+            if ca.is_enabled(state_var):
+                fold[state_var] = transerror.ca[state_var].value
+        if ca.is_enabled('transerrors'):
+            fold['transerror'] = transerror
+        if harvest_fold and ca.is_set('harvested'):
+            fold['harvested'] = ca.harvested
+        return fold
+
+
+    def _get_fast_cv_folds(self, dataset):
+        """Masks of the testing samples of each split if all the splits
+        could be computed from a single training of the classifier.
+
+        Returns None if not possible.
+        """
+        ca = self.ca
+        splitter = self.__splitter
+        transerror = self.__transerror
+        if not self.__fast_cv \
+               or not 'fast_cv' in transerror.clf.__tags__ \
+               or not isinstance(splitter, NFoldSplitter) \
+               or transerror.__class__ is not TransferError \
+               or transerror.null_dist is not None:
+            return None
+        # splitter must provide the complementary samples for training
+        if splitter.npertarget != 'all' or splitter.nrunspersplit != 1 \
+               or splitter.permute_attr is not None \
+               or splitter.discard_boundary or splitter.reverse:
+            return None
+        for state_var in ['splits', 'transerrors', 'training_confusion',
+                          'samples_error', 'harvested']:
+            if ca.is_enabled(state_var):
+                return None
+
+        splitattr_data = dataset.sa[splitter.splitattr].value
+        folds = []
+        for split in splitter.splitcfg(dataset):
+            fold = np.array([i in split[1] for i in splitattr_data],
+                            dtype='bool')
+            if not fold.any() or fold.all():
+                # degenerate split
+                return None
+            folds.append(fold)
+        return folds
+
+
+    def _call_fast_cv(self, dataset, folds):
+        """Cross-validation from a single training of the classifier.
+
+        Returns None if the classifier failed to provide the held-out
+        predictions, so the splits have to be processed one by one.
+        """
+        ca = self.ca
+        transerror = self.__transerror
+        clf = transerror.clf
+        splitattr_data = dataset.sa[self.__splitter.splitattr].value
+        targets = dataset.sa[clf.params.targets_attr].value
+
+        if __debug__:
+            debug("CROSSC", "Computing %d splits from a single training of %s"
+                  % (len(folds), clf))
+        try:
+            predictions = clf.train_cv(dataset, folds)
+        except np.linalg.LinAlgError, e:
+            warning("Failed to compute held-out predictions of %s (%s). "
+                    "Processing splits one by one" % (clf, e))
+            return None
+
+        results = []
+        splitinfo = []
+        for fold, fold_predictions in zip(folds, predictions):
+            splitinfo.append(
+                "%s->%s"
+                % (','.join([str(c)
+                    for c in np.unique(splitattr_data[~fold])]),
+                   ','.join([str(c)
+                    for c in np.unique(splitattr_data[fold])])))
+            fold_targets = targets[fold]
+            if ca.is_enabled('confusion'):
+                ca['confusion'].value.__iadd__(
+                    clf.__summary_class__(targets=fold_targets,
+                                          predictions=fold_predictions,
+                                          estimates=fold_predictions))
+            result = transerror.errorfx(fold_predictions, fold_targets)
+            if __debug__:
+                debug("CROSSC", "Split #%d: result %s" \
+                      % (len(results), `result`))
+            results.append(result)
+
+        self.ca.results = results
+        return Dataset(results, sa={'cv_fold': splitinfo})
+
+
     splitter = property(fget=lambda self:self.__splitter,
                         doc="Access to the Splitter instance.")
     transerror = property(fget=lambda self:self.__transerror,
                         doc="Access to the TransferError instance.")
+
+
+
+def _same_samples(split1, split2):
+    """Either training and testing datasets of two splits have same samples
+    """
+    if split1 is None or split2 is None:
+        return False
+    for ds1, ds2 in zip(split1, split2):
+        if ds1 is None or ds2 is None:
+            return False
+        if not ds1.samples is ds2.samples \
+           and not np.array_equal(ds1.samples, ds2.samples):
+            return False
+    return True
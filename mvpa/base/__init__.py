@@ -199,7 +199,9 @@ if __debug__:
     debug.register('DG',   "Data generators")
     debug.register('LAZY', "Miscelaneous 'lazy' evaluations")
     debug.register('LOOP', "Support's loop construct")
+    debug.register('CACHE', "On-disk cache of results")
     debug.register('PLR',  "PLR call")
+    debug.register('PLR_', "PLR verbose")
     debug.register('NBH',  "Neighborhood estimations")
     debug.register('SLC',  "Searchlight call")
     debug.register('SLC_', "Searchlight call (verbose)")
@@ -287,6 +289,8 @@ if __debug__:
 
     debug.register('GNB',     "GNB - Gaussian Naive Bayes")
 
+    debug.register('KNN',     "kNN - k Nearest Neighbors")
+
     debug.register('GPR',     "GPR")
     debug.register('GPR_WEIGHTS', "Track progress of GPRWeights computation")
     debug.register('KRN',     "Kernels module (mvpa.kernels)")
@@ -556,6 +556,59 @@ class Classifier(ClassWithCollections):
         raise NotImplementedError
 
 
+    def train_cv(self, dataset, folds):
+        """Train classifier and get held-out predictions for `folds`.
+
+        Only available for classifiers tagged 'fast_cv', whose
+        predictions for samples held out from training can be computed
+        exactly from a single fit to the full `dataset` (e.g. from the
+        hat matrix of a linear smoother).  The classifier remains trained
+        on the full `dataset`.
+
+        Parameters
+        ----------
+        dataset : Dataset
+          Full dataset.
+        folds : sequence of ndarrays
+          Boolean masks of the samples held out in each fold.
+
+        Returns
+        -------
+        list of ndarrays
+          Predictions for the held-out samples of each fold, as if the
+          classifier was trained on all other samples.
+        """
+        if not 'fast_cv' in self.__tags__:
+            raise NotImplementedError, \
+                  "%s provides no closed form held-out predictions" % self
+        self.train(dataset)
+        return self._get_cv_predictions(dataset, folds)
+
+
+    def _get_cv_predictions(self, dataset, folds):
+        """Held-out predictions of the classifier trained on `dataset`
+        """
+        raise NotImplementedError
+
+
+    @staticmethod
+    def _get_holdout_predictions(M, residuals, targets, folds):
+        """Held-out predictions of a (regularized) linear smoother.
+
+        For a fit which residuals are `M` times the targets, residuals of
+        the samples B when those were held out from the fit are
+        ``inv(M[B, B]) residuals[B]`` (e.g. ``M = I - H`` for the hat
+        matrix ``H``).
+        """
+        predictions = []
+        for fold in folds:
+            idx = np.where(fold)[0]
+            predictions.append(
+                targets[idx] - np.linalg.solve(M[np.ix_(idx, idx)],
+                                               residuals[idx]))
+        return predictions
+
+
     #
     # Methods which are needed for retrainable classifiers
     #
@@ -33,7 +33,7 @@ class BLR(Classifier):
         doc="Log Marginal Likelihood")
 
 
-    __tags__ = [ 'blr', 'regression', 'linear' ]
+    __tags__ = [ 'blr', 'regression', 'linear', 'fast_cv' ]
 
     def __init__(self, sigma_p = None, sigma_noise=1.0, **kwargs):
         """Initialize a BLR regression analysis.
@@ -116,6 +116,18 @@ class BLR(Classifier):
         pass
 
 
+    def _get_cv_predictions(self, data, folds):
+        """Held-out predictions from the hat matrix of the posterior mean
+        """
+        train_labels = self._attrmap.to_numeric(
+            data.sa[self.params.targets_attr].value)
+        Z = self.samples_train
+        H = 1.0/(self.sigma_noise**2) * np.dot(Z, np.dot(self.A_inv, Z.T))
+        M = np.eye(len(H)) - H
+        return self._get_holdout_predictions(M, np.dot(M, train_labels),
+                                             train_labels, folds)
+
+
     @accepts_dataset_as_samples
     def _predict(self, data):
         """
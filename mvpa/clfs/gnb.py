@@ -98,6 +98,10 @@ class GNB(Classifier):
              disabled by default since does not impact classification output.
              """)
 
+    _predict_block_elements = 2**22
+    """Maximal size of temporary classes x samples x features arrays
+    computed at once while predicting"""
+
     def __init__(self, **kwargs):
         """Initialize an GNB classifier.
         """
@@ -117,6 +121,9 @@ class GNB(Classifier):
 
         # Define internal state of classifier
         self._norm_weight = None
+        # sufficient statistics for incremental training
+        self._nsamples_per_class = None
+        self._sqdevs = None
 
     def _get_priors(self, nlabels, nsamples, nsamples_per_class):
         """Return prior probabilities given data
@@ -135,55 +142,127 @@ class GNB(Classifier):
                   % self.params.prior
         return priors
 
+    def _get_stats(self, dataset):
+        """Sufficient statistics of `dataset` per each class.
+
+        Returns
+        -------
+        (ulabels, nsamples_per_class, means, sqdevs) : tuple
+          Unique labels, number of samples, means, and sums of squared
+          deviations from the means of the samples of each class.
+          Degenerate dimensions are added to `nsamples_per_class` for
+          easy broadcasting.
+        """
+        X = np.asanyarray(dataset.samples)
+        ulabels, codes = np.unique(
+            dataset.sa[self.params.targets_attr].value, return_inverse=True)
+        nlabels = len(ulabels)
+        s_shape = X.shape[1:]           # shape of a single sample
+        X_ = X.reshape((len(X), -1))
+
+        # reduce samples per class by a product with class indicators
+        indicators = (codes == np.arange(nlabels)[:, np.newaxis]).astype(float)
+        nsamples_per_class = indicators.sum(axis=1)
+        means = np.dot(indicators, X_) / nsamples_per_class[:, np.newaxis]
+        sqdevs = np.dot(indicators, (X_ - means[codes])**2)
+
+        return ulabels, \
+               nsamples_per_class.reshape((nlabels,) + (1,)*len(s_shape)), \
+               means.reshape((nlabels,) + s_shape), \
+               sqdevs.reshape((nlabels,) + s_shape)
+
+
     def _train(self, dataset):
         """Train the classifier using `dataset` (`Dataset`).
         """
-        params = self.params
-        targets_sa_name = params.targets_attr
-        targets_sa = dataset.sa[targets_sa_name]
+        self.ulabels, self._nsamples_per_class, self.means, self._sqdevs = \
+                      self._get_stats(dataset)
+        self._update_estimates()
 
-        # get the dataset information into easy vars
-        X = dataset.samples
-        labels = targets_sa.value
-        self.ulabels = ulabels = targets_sa.unique
-        nlabels = len(ulabels)
-        label2index = dict((l, il) for il, l in enumerate(ulabels))
+        if __debug__ and 'GNB' in debug.active:
+            X = dataset.samples
+            debug('GNB', "training finished on data.shape=%s " % (X.shape, )
+                  + "min:max(data)=%f:%f" % (np.min(X), np.max(X)))
 
-        # set the feature dimensions
-        nsamples = len(X)
-        s_shape = X.shape[1:]           # shape of a single sample
 
-        self.means = means = \
-                     np.zeros((nlabels, ) + s_shape)
-        self.variances = variances = \
-                     np.zeros((nlabels, ) + s_shape)
-        # degenerate dimension are added for easy broadcasting later on
-        nsamples_per_class = np.zeros((nlabels,) + (1,)*len(s_shape))
-
-        # Estimate means and number of samples per each label
-        for s, l in zip(X, labels):
-            il = label2index[l]         # index of the label
-            nsamples_per_class[il] += 1
-            means[il] += s
-
-        ## Actually compute the means
-        non0labels = (nsamples_per_class.squeeze() != 0)
-        means[non0labels] /= nsamples_per_class[non0labels]
-
-        # Estimate variances
-        # better loop than repmat! ;)
-        for s, l in zip(X, labels):
-            il = label2index[l]         # index of the label
-            variances[il] += (s - means[il])**2
-
-        ## Actually compute the variances
+    def partial_fit(self, dataset):
+        """Update the classifier with additional training samples.
+
+        Per-class number of samples, means, and sums of squared deviations
+        from the means are kept as sufficient statistics, so the estimates
+        get updated from `dataset` alone and are identical to the ones of
+        a classifier trained on all samples seen so far.  Samples of
+        previously unseen classes are allowed.  If the classifier was not
+        trained yet, it simply gets trained on `dataset`.
+
+        Conditional attributes `trained_targets` and `trained_nsamples`
+        describe all samples seen so far, whereas `training_confusion` and
+        `trained_dataset` are not updated.
+
+        Parameters
+        ----------
+        dataset : Dataset
+          Additional training samples.
+        """
+        if not self.trained:
+            return self.train(dataset)
+        if dataset.samples.shape[1:] != self.means.shape[1:]:
+            raise ValueError, \
+                  "Classifier %s was trained on samples of shape %s, " \
+                  "thus can't be updated with samples of shape %s" \
+                  % (self, self.means.shape[1:], dataset.samples.shape[1:])
+
+        ulabels, nsamples_per_class, means, sqdevs = self._get_stats(dataset)
+
+        # extend the estimates to the union of the classes
+        all_ulabels = np.unique(np.concatenate((self.ulabels, ulabels)))
+        old = np.searchsorted(all_ulabels, self.ulabels)
+        new = np.searchsorted(all_ulabels, ulabels)
+        def _expand(x, idx):
+            res = np.zeros((len(all_ulabels),) + x.shape[1:])
+            res[idx] = x
+            return res
+        n_a = _expand(self._nsamples_per_class, old)
+        n_b = _expand(nsamples_per_class, new)
+        means_a, means_b = _expand(self.means, old), _expand(means, new)
+        sqdevs_a, sqdevs_b = _expand(self._sqdevs, old), _expand(sqdevs, new)
+
+        # pooled statistics (Chan et al., 1979)
+        n = n_a + n_b
+        delta = means_b - means_a
+        self.ulabels = all_ulabels
+        self._nsamples_per_class = n
+        self.means = means_a + delta * (n_b / n)
+        self._sqdevs = sqdevs_a + sqdevs_b + delta**2 * (n_a * n_b / n)
+        self._update_estimates()
+
+        ca = self.ca
+        if ca.is_enabled('trained_targets'):
+            ca.trained_targets = all_ulabels
+        ca.trained_nsamples = int(n.sum())
+
+        if __debug__ and 'GNB' in debug.active:
+            debug('GNB', "updated with data.shape=%s, trained on %i samples "
+                  "total" % (dataset.samples.shape, n.sum()))
+
+
+    def _update_estimates(self):
+        """Compute variances, priors and normalization from the statistics
+        """
+        params = self.params
+        nsamples_per_class = self._nsamples_per_class
+        nlabels = len(self.ulabels)
+        nsamples = nsamples_per_class.sum()
+
         if params.common_variance:
             # we need to get global std
-            cvar = np.sum(variances, axis=0)/nsamples # sum across labels
+            cvar = np.sum(self._sqdevs, axis=0)/nsamples # sum across labels
             # broadcast the same variance across labels
+            self.variances = variances = np.empty(self._sqdevs.shape)
             variances[:] = cvar
         else:
-            variances[non0labels] /= nsamples_per_class[non0labels]
+            self.variances = variances = self._sqdevs \
+                                         / nsamples_per_class
 
         # Store prior probabilities
         self.priors = self._get_priors(nlabels, nsamples, nsamples_per_class)
@@ -195,10 +274,6 @@ class GNB(Classifier):
         else:
             self._norm_weight = 1.0/np.sqrt(2*np.pi*variances)
 
-        if __debug__ and 'GNB' in debug.active:
-            debug('GNB', "training finished on data.shape=%s " % (X.shape, )
-                  + "min:max(data)=%f:%f" % (np.min(X), np.max(X)))
-
 
     def untrain(self):
         """Untrain classifier and reset all learnt params
@@ -207,6 +282,8 @@ class GNB(Classifier):
         self.variances = None
         self.ulabels = None
         self.priors = None
+        self._nsamples_per_class = None
+        self._sqdevs = None
         super(GNB, self).untrain()
 
 
@@ -215,48 +292,50 @@ class GNB(Classifier):
         """Predict the output for the provided data.
         """
         params = self.params
-        # argument of exponentiation
-        scaled_distances = \
-            -0.5 * (((data - self.means[:, np.newaxis, ...])**2) \
-                          / self.variances[:, np.newaxis, ...])
+        nlabels = len(self.ulabels)
+        # flatten samples, so features could be processed in blocks
+        data_ = np.asanyarray(data).reshape((len(data), -1))
+        means = self.means.reshape((nlabels, -1))[:, np.newaxis]
+        variances = self.variances.reshape((nlabels, -1))[:, np.newaxis]
+        norm_weight = self._norm_weight.reshape((nlabels, -1))[:, np.newaxis]
+
+        # Naive part -- just a product of probabilities (sum of
+        # log-probabilities) across features, accumulated over blocks of
+        # features to keep classes x samples x features temporaries bounded
+        nfeatures = data_.shape[1]
+        block_size = max(1, self._predict_block_elements
+                            // max(1, nlabels * len(data_)))
         if params.logprob:
-            # if self.params.common_variance:
-            # XXX YOH:
-            # For decision there is no need to actually compute
-            # properly scaled p, ie 1/sqrt(2pi * sigma_i) could be
-            # simply discarded since it is common across features AND
-            # classes
-            # For completeness -- computing everything now even in logprob
-            lprob_csfs = self._norm_weight[:, np.newaxis, ...] \
-                         + scaled_distances
-
-            # XXX for now just cut/paste with different operators, but
-            #     could just bind them and reuse in the same equations
-            # Naive part -- just a product of probabilities across features
-            ## First we need to reshape to get class x samples x features
-            lprob_csf = lprob_csfs.reshape(
-                lprob_csfs.shape[:2] + (-1,))
-            ## Now -- sum across features
-            lprob_cs = lprob_csf.sum(axis=2)
-
-            # Incorporate class probabilities:
-            prob_cs_cp = lprob_cs + np.log(self.priors[:, np.newaxis])
+            prob_cs = np.zeros((nlabels, len(data_)))
+        else:
+            prob_cs = np.ones((nlabels, len(data_)))
+        for start in xrange(0, nfeatures, block_size):
+            block = slice(start, start + block_size)
+            # argument of exponentiation
+            scaled_distances = \
+                -0.5 * (((data_[:, block] - means[..., block])**2) \
+                              / variances[..., block])
+            if params.logprob:
+                # if self.params.common_variance:
+                # XXX YOH:
+                # For decision there is no need to actually compute
+                # properly scaled p, ie 1/sqrt(2pi * sigma_i) could be
+                # simply discarded since it is common across features AND
+                # classes
+                # For completeness -- computing everything now even in
+                # logprob
+                prob_cs += (norm_weight[..., block]
+                            + scaled_distances).sum(axis=2)
+            else:
+                # Just a regular Normal distribution with per
+                # feature/class mean and variances
+                prob_cs *= (norm_weight[..., block]
+                            * np.exp(scaled_distances)).prod(axis=2)
 
+        # Incorporate class probabilities:
+        if params.logprob:
+            prob_cs_cp = prob_cs + np.log(self.priors[:, np.newaxis])
         else:
-            # Just a regular Normal distribution with per
-            # feature/class mean and variances
-            prob_csfs = \
-                 self._norm_weight[:, np.newaxis, ...] \
-                 * np.exp(scaled_distances)
-
-            # Naive part -- just a product of probabilities across features
-            ## First we need to reshape to get class x samples x features
-            prob_csf = prob_csfs.reshape(
-                prob_csfs.shape[:2] + (-1,))
-            ## Now -- product across features
-            prob_cs = prob_csf.prod(axis=2)
-
-            # Incorporate class probabilities:
             prob_cs_cp = prob_cs * self.priors[:, np.newaxis]
 
         # Normalize by evidence P(data)
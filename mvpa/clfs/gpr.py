@@ -28,6 +28,7 @@ from mvpa.datasets import Dataset, dataset_wizard
 if externals.exists("scipy", raise_=True):
     from scipy.linalg import cho_solve as SLcho_solve
     from scipy.linalg import cholesky as SLcholesky
+    from scipy.linalg import solve_triangular as SLsolve_triangular
     import scipy.linalg as SL
     # Some local binding for bits of speed up
     SLAError = SL.basic.LinAlgError
@@ -100,7 +101,7 @@ class GPR(Classifier):
     log_marginal_likelihood_gradient = ConditionalAttribute(enabled=False,
         doc="Log Marginal Likelihood Gradient")
 
-    __tags__ = [ 'gpr', 'regression', 'retrainable' ]
+    __tags__ = [ 'gpr', 'regression', 'retrainable', 'fast_cv' ]
 
 
     # NOTE XXX Parameters of the classifier. Values available as
@@ -128,6 +129,12 @@ class GPR(Classifier):
         Increase this when the kernel matrix is not positive definite. If None,
         some regularization will be provided upon necessity""")
 
+    block_size = Parameter(None, min=1, allowedtype='None or int',
+        doc="""Number of samples to predict at once.
+        Limits memory required for the kernel matrix between training
+        and testing samples.  If None, all samples are predicted at once.
+        Has no effect for retrainable GPR""")
+
 
     def __init__(self, kernel=None, **kwargs):
         """Initialize a GPR regression analysis.
@@ -184,6 +191,9 @@ class GPR(Classifier):
         self._alpha = None
         self._L = None
         self._LL = None
+        # low-rank solution (see _train_low_rank())
+        self._train_features = None
+        self._weights = None
         # XXX EO: useful for model selection but not working in general
         # self.__kernel.reset()
         pass
@@ -202,10 +212,13 @@ class GPR(Classifier):
         """
         if __debug__:
             debug("GPR", "Computing log_marginal_likelihood")
-        self.ca.log_marginal_likelihood = \
-                                 -0.5*Ndot(self._train_labels, self._alpha) - \
-                                  Nlog(self._L.diagonal()).sum() - \
-                                  self._km_train_train.shape[0] * _halflog2pi
+        n = len(self._alpha)
+        lml = -0.5*Ndot(self._train_labels, self._alpha) - \
+              Nlog(self._L.diagonal()).sum() - n * _halflog2pi
+        if self._weights is not None:
+            # low-rank: det(F F' + s2 I) = s2^(n-m) det(F' F + s2 I)
+            lml -= 0.5 * (n - len(self._L)) * Nlog(self._low_rank_noise)
+        self.ca.log_marginal_likelihood = lml
         return self.ca.log_marginal_likelihood
 
 
@@ -214,6 +227,10 @@ class GPR(Classifier):
         version use a more compact formula provided by Williams and
         Rasmussen book.
         """
+        if self._weights is not None:
+            raise NotImplementedError, \
+                  "Gradient of log marginal likelihood is not available " \
+                  "for low-rank kernels"
         # XXX EO: check whether the precomputed self.alpha self.Kinv
         # are actually the ones corresponding to the hyperparameters
         # used to compute this gradient!
@@ -250,6 +267,10 @@ class GPR(Classifier):
         hyperparameters are in logscale. This version use a more
         compact formula provided by Williams and Rasmussen book.
         """
+        if self._weights is not None:
+            raise NotImplementedError, \
+                  "Gradient of log marginal likelihood is not available " \
+                  "for low-rank kernels"
         # Kinv = np.linalg.inv(self._C)
         # Faster:
         Kinv = SLcho_solve(self._LL, np.eye(self._L.shape[0]))
@@ -326,6 +347,11 @@ class GPR(Classifier):
         train_labels = data.sa[params.targets_attr].value
         self._train_labels = train_labels
 
+        if self.__kernel.low_rank and not retrainable:
+            self._train_low_rank(train_fv, train_labels)
+            return
+        self._train_features = self._weights = None
+
         if not retrainable or _changedData['traindata'] \
                or _changedData.get('kernel_params', False):
             if __debug__:
@@ -423,6 +449,42 @@ class GPR(Classifier):
         pass
 
 
+    def _train_low_rank(self, train_fv, train_labels):
+        """Train using explicit features of a `LowRankKernel`
+
+        With `m` features F of `n` training samples the covariance
+        ``C = F F' + s2 I`` is inverted through the `m x m` matrix
+        ``A = F' F + s2 I`` (matrix inversion lemma), so no `n x n`
+        matrix is ever built.
+        """
+        params = self.params
+        if __debug__:
+            debug("GPR", "Computing train features")
+        self._train_features = F = self.__kernel.features(train_fv)
+        # regularization is just an additional noise here
+        self._low_rank_noise = s2 = params.sigma_noise ** 2 + (params.lm or 0)
+        A = Ndot(F.T, F) + s2 * np.identity(F.shape[1], 'd')
+        try:
+            if params.lm is not None:
+                self._L = SLcholesky(A, lower=True)
+            else:
+                self._L = _SLcholesky_autoreg(A, nsteps=None, lower=True)
+        except SLAError:
+            raise SLAError("Kernel matrix is not positive, definite. "
+                           "Try increasing the lm parameter.")
+        self._LL = (self._L, True)
+        # weights of the features
+        self._weights = SLcho_solve(self._LL, Ndot(F.T, train_labels))
+        # alpha = inv(C) y
+        self._alpha = (train_labels - Ndot(F, self._weights)) / s2
+
+        if self.ca.is_enabled('log_marginal_likelihood'):
+            self.compute_log_marginal_likelihood()
+
+        if __debug__:
+            debug("GPR", "Done training using %d features" % F.shape[1])
+
+
     @accepts_dataset_as_samples
     def _predict(self, data):
         """
@@ -430,54 +492,71 @@ class GPR(Classifier):
         """
         retrainable = self.params.retrainable
         ca = self.ca
-
-        if not retrainable or self._changedData['testdata'] \
-               or self._km_train_test is None:
-            if __debug__:
-                debug('GPR', "Computing train test kernel matrix")
-            self.__kernel.compute(self._train_fv, data)
-            km_train_test = asarray(self.__kernel)
-            if retrainable:
-                self._km_train_test = km_train_test
+        compute_variances = ca.is_enabled('predicted_variances')
+
+        if self._weights is not None:
+            block_size = self.params.block_size or len(data)
+            predictions, variances = [], []
+            for start in xrange(0, len(data), block_size):
+                features = self.__kernel.features(
+                    data[start:start + block_size])
+                predictions.append(Ndot(features, self._weights))
+                if compute_variances:
+                    # s2 * phi' inv(A) phi from a triangular solve
+                    v = SLsolve_triangular(self._L, features.T, lower=True)
+                    variances.append(self._low_rank_noise * (v ** 2).sum(0)
+                                     + self.params.sigma_noise ** 2)
+            predictions = np.concatenate(predictions)
+            if compute_variances:
+                variances = np.concatenate(variances)
+        elif retrainable:
+            # kernel matrices are stored for repredict, hence all samples
+            # are processed at once
+            if self._changedData['testdata'] or self._km_train_test is None:
+                if __debug__:
+                    debug('GPR', "Computing train test kernel matrix")
+                self.__kernel.compute(self._train_fv, data)
+                self._km_train_test = asarray(self.__kernel)
                 ca.repredicted = False
+            else:
+                if __debug__:
+                    debug('GPR', "Not recomputing train test kernel matrix")
+                ca.repredicted = True
+            km_test_diag = None
+            if compute_variances:
+                if self._km_test_diag is None \
+                       or self._changedData['testdata']:
+                    if __debug__:
+                        debug('GPR', "Computing test test kernel diagonal")
+                    self._km_test_diag = self.__kernel.diag(data)
+                km_test_diag = self._km_test_diag
+            predictions, variances = self._predict_block(
+                self._km_train_test, km_test_diag)
         else:
-            if __debug__:
-                debug('GPR', "Not recomputing train test kernel matrix")
-            km_train_test = self._km_train_test
-            ca.repredicted = True
-
-
-        predictions = Ndot(km_train_test.transpose(), self._alpha)
-
-        if ca.is_enabled('predicted_variances'):
-            # do computation only if conditional attribute was enabled
-            if not retrainable or self._km_test_test is None \
-                   or self._changedData['testdata']:
+            block_size = self.params.block_size or len(data)
+            predictions, variances = [], []
+            for start in xrange(0, len(data), block_size):
+                block = data[start:start + block_size]
                 if __debug__:
-                    debug('GPR', "Computing test test kernel matrix")
-                self.__kernel.compute(data)
-                km_test_test = asarray(self.__kernel)
-                if retrainable:
-                    self._km_test_test = km_test_test
+                    debug('GPR', "Computing train test kernel matrix for "
+                          "samples %d:%d" % (start, start + len(block)))
+                self.__kernel.compute(self._train_fv, block)
+                km_test_diag = None
+                if compute_variances:
+                    km_test_diag = self.__kernel.diag(block)
+                block_predictions, block_variances = self._predict_block(
+                    asarray(self.__kernel), km_test_diag)
+                predictions.append(block_predictions)
+                variances.append(block_variances)
+            if len(predictions) == 1:
+                predictions, variances = predictions[0], variances[0]
             else:
-                if __debug__:
-                    debug('GPR', "Not recomputing test test kernel matrix")
-                km_test_test = self._km_test_test
+                predictions = np.concatenate(predictions)
+                if compute_variances:
+                    variances = np.concatenate(variances)
 
-            if __debug__:
-                debug("GPR", "Computing predicted variances")
-            L = self._L
-            # v = NLAsolve(L, km_train_test)
-            # Faster:
-            piv = np.arange(L.shape[0])
-            v = SL.lu_solve((L.T, piv), km_train_test, trans=1)
-            # self.predicted_variances = \
-            #     Ndiag(km_test_test - Ndot(v.T, v)) \
-            #     + self.sigma_noise**2
-            # Faster formula: np.diag(Ndot(v.T, v)) = (v**2).sum(0):
-            ca.predicted_variances = Ndiag(km_test_test) - (v ** 2).sum(0) \
-                                       + self.params.sigma_noise ** 2
-            pass
+        if compute_variances:
+            ca.predicted_variances = variances
 
         if __debug__:
             debug("GPR", "Done predicting")
@@ -485,13 +564,64 @@ class GPR(Classifier):
         return predictions
 
 
+    def _predict_block(self, km_train_test, km_test_diag=None):
+        """Predictions (and variances if `km_test_diag` is provided)
+        """
+        predictions = Ndot(km_train_test.transpose(), self._alpha)
+        if km_test_diag is None:
+            return predictions, None
+        if __debug__:
+            debug("GPR", "Computing predicted variances")
+        # L^-1 k_*  by a triangular solve with the stored Cholesky factor
+        v = SLsolve_triangular(self._L, km_train_test, lower=True)
+        # Faster formula: np.diag(Ndot(v.T, v)) = (v**2).sum(0):
+        variances = km_test_diag - (v ** 2).sum(0) \
+                    + self.params.sigma_noise ** 2
+        return predictions, variances
+
+
+    def _get_cv_predictions(self, data, folds):
+        """Held-out predictions from the inverse of the regularized kernel.
+
+        Residuals of the held-out samples B are
+        ``inv(inv(C)[B, B]) alpha[B]`` (see Rasmussen & Williams, 2006,
+        Section 5.4.2).
+        """
+        if __debug__:
+            debug("GPR", "Computing held-out predictions for %i folds"
+                  % len(folds))
+        if self._weights is not None:
+            return self._get_low_rank_cv_predictions(folds)
+        Cinv = SLcho_solve(self._LL, np.eye(len(self._alpha)))
+        return self._get_holdout_predictions(
+            Cinv, self._alpha, np.asarray(self._train_labels, dtype=float),
+            folds)
+
+
+    def _get_low_rank_cv_predictions(self, folds):
+        """Held-out predictions only using blocks of the inverse of `C`
+
+        ``inv(C)[B, B] = (I - F_B inv(A) F_B') / s2``
+        """
+        F, s2 = self._train_features, self._low_rank_noise
+        targets = np.asarray(self._train_labels, dtype=float)
+        predictions = []
+        for fold in folds:
+            idx = np.where(fold)[0]
+            v = SLsolve_triangular(self._L, F[idx].T, lower=True)
+            Cinv = (np.eye(len(idx)) - Ndot(v.T, v)) / s2
+            predictions.append(targets[idx]
+                               - NLAsolve(Cinv, self._alpha[idx]))
+        return predictions
+
+
     ##REF: Name was automagically refactored
     def _set_retrainable(self, value, force=False):
-        """Internal function : need to set _km_test_test
+        """Internal function : need to set _km_test_diag
         """
         super(GPR, self)._set_retrainable(value, force)
         if force or (value and value != self.params.retrainable):
-            self._km_test_test = None
+            self._km_test_diag = None
 
 
     def untrain(self):
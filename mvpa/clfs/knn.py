@@ -10,13 +10,9 @@
 
 __docformat__ = 'restructuredtext'
 
-import sys
-# not worthy of externals checking
-_dict_has_key = sys.version_info >= (2, 5)
-
 import numpy as np
 
-from mvpa.base import warning
+from mvpa.base import warning, externals
 from mvpa.datasets.base import Dataset
 from mvpa.misc.support import indent_doc
 from mvpa.misc.state import ConditionalAttribute
@@ -50,8 +46,15 @@ class kNN(Classifier):
     If enabled, kNN stores the votes per class in the 'values' state after
     calling predict().
 
+    For Euclidean distances in low-dimensional spaces, neighbors can be
+    found with a KD-tree built during training instead of computing all
+    distances between training and test samples (see `search`).  The
+    strategy in use is reported by `summary()`.
     """
 
+    _kdtree_max_nfeatures = 20
+    """Maximal dimensionality to automatically choose KD-tree search for"""
+
     distances = ConditionalAttribute(enabled=False,
         doc="Distances computed for each sample")
 
@@ -60,7 +63,8 @@ class kNN(Classifier):
                       'notrain2predict' ]
 
     def __init__(self, k=2, dfx=squared_euclidean_distance,
-                 voting='weighted', **kwargs):
+                 voting='weighted', chunk_size=1000, search='auto',
+                 **kwargs):
         """
         Parameters
         ----------
@@ -74,6 +78,18 @@ class kNN(Classifier):
           Possible values are 'majority' (simple majority of classes
           determines vote) and 'weighted' (votes are weighted according to the
           relative frequencies of each class in the training data).
+        chunk_size : int
+          Number of test samples to compute distances for at once.  Limits
+          the memory demand of the prediction for large testing datasets
+          (unless conditional attribute `distances` is enabled).
+        search : {'auto', 'brute', 'kdtree'}
+          Strategy to find nearest neighbors.  'brute' computes distances
+          to all training samples using `dfx`.  'kdtree' builds a KD-tree
+          (requires scipy) of the training samples and is only applicable
+          for `squared_euclidean_distance`.  'auto' chooses 'kdtree' if it
+          is applicable and the data has no more than 20 features.  Brute
+          force search is used whenever conditional attribute `distances`
+          is enabled.
         **kwargs
           Additonal arguments are passed to the base class.
         """
@@ -84,16 +100,30 @@ class kNN(Classifier):
         self.__k = k
         self.__dfx = dfx
         self.__voting = voting
+        self.__chunk_size = chunk_size
+        if not search in ('auto', 'brute', 'kdtree'):
+            raise ValueError, "Unknown neighbor search %r" % (search,)
+        if search == 'kdtree':
+            externals.exists('scipy', raise_=True)
+            if not dfx is squared_euclidean_distance:
+                raise ValueError, "KD-tree search is only applicable to " \
+                      "euclidean distances, got dfx=%s" % dfx
+        self.__search = search
+        self.__search_used = None
+        self.__tree = None
         self.__data = None
 
 
     def __repr__(self, prefixes=[]):
         """Representation of the object
         """
-        return super(kNN, self).__repr__(
-            ["k=%d" % self.__k, "dfx=%s" % self.__dfx,
-             "voting=%s" % repr(self.__voting)]
-            + prefixes)
+        prefixes_ = ["k=%d" % self.__k, "dfx=%s" % self.__dfx,
+                     "voting=%s" % repr(self.__voting)]
+        if self.__chunk_size != 1000:
+            prefixes_.append("chunk_size=%r" % self.__chunk_size)
+        if self.__search != 'auto':
+            prefixes_.append("search=%r" % self.__search)
+        return super(kNN, self).__repr__(prefixes_ + prefixes)
 
 
     def __str__(self):
@@ -114,12 +144,34 @@ class kNN(Classifier):
                         "Overflow on arithmetic operations might result in"+\
                         " errors. Please convert dataset's samples into" +\
                         " floating datatype if any error is reported.")
-        self.__weights = None
 
-        # create dictionary with an item for each condition
-        uniquelabels = data.sa[self.params.targets_attr].unique
-        self.__votes_init = dict(zip(uniquelabels,
-                                     [0] * len(uniquelabels)))
+        # integer codes of the labels of the training samples, so votes
+        # could be counted for all test samples at once
+        labels = data.sa[self.params.targets_attr].value
+        self.__uniquelabels, self.__codes = \
+                             np.unique(labels, return_inverse=True)
+
+        # class weights: relative proportion of samples belonging to
+        # each class
+        Nlabels = len(labels)
+        counts = np.bincount(self.__codes,
+                             minlength=len(self.__uniquelabels))
+        self.__weights = 1.0 - (counts / Nlabels)
+
+        # spatial index for the neighbor search
+        search = self.__search
+        if search == 'auto':
+            if self.__dfx is squared_euclidean_distance \
+               and data.nfeatures <= self._kdtree_max_nfeatures \
+               and externals.exists('scipy'):
+                search = 'kdtree'
+            else:
+                search = 'brute'
+        self.__search_used = search
+        self.__tree = None
+        if __debug__:
+            debug('KNN', "Using %s neighbor search for %s"
+                  % (search, data))
 
 
     @accepts_dataset_as_samples
@@ -140,122 +192,148 @@ class kNN(Classifier):
                 raise ValueError, "Length of data samples (features) does " \
                                   "not match the classifier."
 
-        # compute the distance matrix between training and test data with
-        # distances stored row-wise, ie. distances between test sample [0]
-        # and all training samples will end up in row 0
-        dists = self.__dfx(self.__data.samples, data).T
-        if self.ca.is_enabled('distances'):
+        if not self.__voting in ('majority', 'weighted'):
+            raise ValueError, "kNN told to perform unknown voting '%s'." \
+                  % self.__voting
+
+        store_distances = self.ca.is_enabled('distances')
+        chunk_size = max(1, self.__chunk_size)
+        all_dists = []
+        votes = []
+        for start in xrange(0, len(data), chunk_size):
+            chunk = data[start:start + chunk_size]
+            if self.__search_used == 'kdtree' and not store_distances:
+                knns = self._query_tree(chunk)
+            else:
+                # compute the distance matrix between training and test
+                # data with distances stored row-wise, ie. distances
+                # between test sample [0] and all training samples will
+                # end up in row 0
+                dists = self.__dfx(self.__data.samples, chunk).T
+                if store_distances:
+                    all_dists.append(dists)
+                knns = self._get_knns(dists)
+            votes.append(self._get_votes(knns, self.__voting == 'weighted'))
+
+        if store_distances:
             # TODO: theoretically we should have used deepcopy for sa
             #       here
+            if len(all_dists):
+                dists = np.vstack(all_dists)
+            else:
+                dists = np.zeros((0, self.__data.nsamples))
             self.ca.distances = Dataset(dists, fa=self.__data.sa.copy())
 
-        # determine the k nearest neighbors per test sample
-        knns = dists.argsort(axis=1)[:, :self.__k]
-
-        # predicted class labels will go here
-        predicted = []
-
-        if self.__voting == 'majority':
-            vfx = self.get_majority_vote
-        elif self.__voting == 'weighted':
-            vfx = self.get_weighted_vote
+        if len(votes):
+            votes = np.vstack(votes)
         else:
-            raise ValueError, "kNN told to perform unknown voting '%s'." \
-                  % self.__voting
+            votes = np.zeros((0, len(self.__uniquelabels)))
 
-        # perform voting
-        results = [vfx(knn) for knn in knns]
-
-        # extract predictions
-        predicted = [r[0] for r in results]
+        # find the class with most votes
+        predicted = list(self.__uniquelabels[votes.argmax(axis=1)])
 
         # store the predictions in the state. Relies on State._setitem to do
         # nothing if the relevant state member is not enabled
         self.ca.predictions = predicted
-        self.ca.estimates = np.array([r[1] for r in results])
+        self.ca.estimates = votes
 
         return predicted
 
 
-    ##REF: Name was automagically refactored
-    def get_majority_vote(self, knn_ids):
-        """Simple voting by choosing the majority of class neighbors.
+    def _query_tree(self, data):
+        """Indices of the k nearest neighbors for each sample in `data`
+        """
+        if self.__tree is None:
+            # built on first use, since it does not get stored along with
+            # the classifier
+            from scipy.spatial import cKDTree
+            self.__tree = cKDTree(self.__data.samples)
+        k = min(self.__k, self.__data.nsamples)
+        knns = self.__tree.query(data, k=k)[1]
+        # single neighbor comes without the neighbors dimension
+        return knns.reshape((len(data), k))
+
+
+    def _get_knns(self, dists):
+        """Indices of the k nearest neighbors for each row of `dists`
         """
-        # local bindings
-        _data = self.__data
+        ntrain = dists.shape[1]
+        k = self.__k
+        if k >= ntrain:
+            # all of them
+            return dists.argsort(axis=1)
+        # partial selection of the k smallest distances -- no need to
+        # sort all of them
+        return np.argpartition(dists, k - 1, axis=1)[:, :k]
 
-        targets_sa_name = self.params.targets_attr
-        targets_sa = _data.sa[targets_sa_name]
 
-        labels = targets_sa.value
-        uniquelabels = targets_sa.unique
+    def _get_votes(self, knns, weighted=False):
+        """Votes for each class from the nearest neighbors of test samples
+
+        Parameters
+        ----------
+        knns : ndarray
+          Indices of nearest training samples (test samples x k).
+        weighted : bool
+          Either to weight votes by the class weights.
+
+        Returns
+        -------
+        ndarray
+          Votes (test samples x classes).
+        """
+        nlabels = len(self.__uniquelabels)
+        knns = np.atleast_2d(knns)
+        ntest = len(knns)
+        # count occurrences of each class among the neighbors of all test
+        # samples at once by offsetting the label codes for every sample
+        codes = self.__codes[knns] + \
+                nlabels * np.arange(ntest)[:, np.newaxis]
+        votes = np.bincount(codes.ravel(), minlength=ntest * nlabels) \
+                  .reshape((ntest, nlabels))
+        if weighted:
+            votes = votes * self.__weights
+        return votes
 
-        # number of occerences for each unique class in kNNs
-        votes = self.__votes_init.copy()
-        for nn in knn_ids:
-            votes[labels[nn]] += 1
 
+    ##REF: Name was automagically refactored
+    def get_majority_vote(self, knn_ids):
+        """Simple voting by choosing the majority of class neighbors.
+        """
+        votes = self._get_votes(knn_ids)[0]
         # find the class with most votes
         # return votes as well to store them in the state
-        if _dict_has_key:
-            # approx 5% faster implementation than below
-            maxvotes = max(votes.iteritems(), key=lambda x:x[1])[0]
-        else:
-            # no key keyword for max in elderly versions
-            maxvotes = max([(v, k) for k, v in votes.iteritems()])[1]
-
-        return maxvotes, \
-                [votes[ul] for ul in uniquelabels] # transform into lists
+        return self.__uniquelabels[votes.argmax()], list(votes)
 
 
     ##REF: Name was automagically refactored
     def get_weighted_vote(self, knn_ids):
         """Vote with classes weighted by the number of samples per class.
         """
-        # local bindings
-        _data = self.__data
-        targets_sa_name = self.params.targets_attr
-        targets_sa = _data.sa[targets_sa_name]
-
-        uniquelabels = targets_sa.unique
-
-        # Lazy evaluation
-        if self.__weights is None:
-            #
-            # It seemed to Yarik that this has to be evaluated just once per
-            # training dataset.
-            #
-            self.__labels = labels = targets_sa.value
-            Nlabels = len(labels)
-            Nuniquelabels = len(uniquelabels)
-
-            # TODO: To get proper speed up for the next line only,
-            #       histogram should be computed
-            #       via sorting + counting "same" elements while reducing.
-            #       Guaranteed complexity is NlogN whenever now it is N^2
-            # compute the relative proportion of samples belonging to each
-            # class (do it in one loop to improve speed and reduce readability
-            self.__weights = \
-                [ 1.0 - ((labels == label).sum() / Nlabels) \
-                    for label in uniquelabels ]
-            self.__weights = dict(zip(uniquelabels, self.__weights))
-
-        labels = self.__labels
-        # number of occerences for each unique class in kNNs
-        votes = self.__votes_init.copy()
-        for nn in knn_ids:
-            votes[labels[nn]] += 1
-
-        # weight votes
-        votes = [ self.__weights[ul] * votes[ul] for ul in uniquelabels]
-
+        votes = self._get_votes(knn_ids, weighted=True)[0]
         # find the class with most votes
         # return votes as well to store them in the state
-        return uniquelabels[np.asarray(votes).argmax()], \
-               votes
+        return self.__uniquelabels[votes.argmax()], list(votes)
+
+
+    def summary(self):
+        """Provide quick summary over the kNN classifier"""
+        s = super(kNN, self).summary()
+        if self.trained:
+            s += '\n neighbor search: %s' % self.__search_used
+        return s
+
+
+    def __getstate__(self):
+        # KD-tree is not picklable -- rebuilt upon prediction if needed
+        state = self.__dict__.copy()
+        state['_kNN__tree'] = None
+        return state
 
 
     def untrain(self):
         """Reset trained state"""
         self.__data = None
+        self.__search_used = None
+        self.__tree = None
         super(kNN, self).untrain()
@@ -32,6 +32,8 @@ else:
 
 # wrap the stepwise function
 def stepwise_regression(*args):
+    """Stepwise regression on C-contiguous float64 samples (including the
+    bias term if any)"""
     func = smlrlib.stepwise_regression
     func.argtypes = [C.c_int, C.c_int, c_darray,
                      C.c_int, C.c_int, c_darray,
@@ -53,6 +55,69 @@ def stepwise_regression(*args):
     arglist = extend_args(*args)
     return func(*arglist)
 
+
+def stepwise_regression_strided(w, X, XY, Xw, E, auto_corr,
+                                lambda_over_2_auto_corr, S, M, maxiter,
+                                convergence_tol, resamp_decay, min_resamp,
+                                verbose, seed, has_bias=False, nthreads=1):
+    """Stepwise regression on float32 or float64 samples of any layout.
+
+    Arguments are the same as for `stepwise_regression()`, but `X` is
+    used without copying as long as its elements are aligned.  If
+    `has_bias`, `X` does not contain the bias term, which is fitted by
+    the last row of `w`.  `nthreads` threads are used for the loops over
+    samples if the library was built with OpenMP (0 -- as many as OpenMP
+    chooses).
+    """
+    if not X.dtype in (np.float32, np.float64) \
+           or not X.flags['ALIGNED'] \
+           or np.any(np.mod(X.strides, X.itemsize)):
+        X = np.asarray(X, dtype=np.double)
+    func = smlrlib.stepwise_regression_strided
+    func.argtypes = [C.c_int, C.c_int, c_darray,
+                     C.c_void_p, C.c_int, C.c_int,
+                     C.c_long, C.c_long,
+                     C.c_int,
+                     C.c_int,
+                     C.c_int, C.c_int, c_darray,
+                     C.c_int, C.c_int, c_darray,
+                     C.c_int, C.c_int, c_darray,
+                     C.c_int, c_darray,
+                     C.c_int, c_darray,
+                     C.c_int, c_darray,
+                     C.c_int,
+                     C.c_int,
+                     C.c_double,
+                     C.c_float,
+                     C.c_float,
+                     C.c_int64,
+                     C.c_int]
+    func.restype = C.c_long
+
+    arglist = extend_args(w) \
+              + [X.ctypes.data, X.shape[0], X.shape[1],
+                 X.strides[0], X.strides[1], int(X.dtype == np.float32),
+                 int(has_bias)] \
+              + extend_args(XY, Xw, E, auto_corr, lambda_over_2_auto_corr,
+                            S, M, maxiter, convergence_tol, resamp_decay,
+                            min_resamp, verbose,
+                            # no seed -- C code seeds from the time
+                            seed or 0, nthreads)
+    cycles = func(*arglist)
+    if cycles < 0:
+        raise ValueError, "Shapes of weights %s and samples %s do not " \
+              "match (has_bias=%s)" % (w.shape, X.shape, has_bias)
+    return cycles
+
+
+def has_openmp():
+    """Whether stepwise regression could run in multiple threads, i.e. the
+    library was built with OpenMP support.
+    """
+    func = smlrlib.has_openmp
+    func.restype = C.c_int
+    return bool(func())
+
 if __debug__:
     debug('INIT', 'mvpa.clfs.libsmlrc end')
 
@@ -9,22 +9,84 @@
 
 #include <Python.h>
 
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+/* Minimal number of samples to run the loops over samples in parallel,
+ * for smaller datasets threading overhead is not worth it */
+#define MIN_NS_PARALLEL 256
+
+#define DO_PRAGMA(x) _Pragma(#x)
+#ifdef _OPENMP
+#define OMP_PARALLEL_FOR(clauses) \
+  DO_PRAGMA(omp parallel for clauses num_threads(nthreads) if(parallel))
+#else
+#define OMP_PARALLEL_FOR(clauses)
+#endif
+
+/* Loop over samples with x bound to the value of the current basis for
+ * the sample i.  Samples are given by a pointer to their data, strides
+ * (in bytes) and the type of elements (float32 or float64), while the
+ * basis X_cols stands for the bias term. */
+#define FOR_SAMPLES(clauses, body)					\
+  if (basis == X_cols)							\
+  {									\
+    OMP_PARALLEL_FOR(clauses)						\
+    for (i=0; i<ns; i++)						\
+    {									\
+      const double x = 1.0;						\
+      body								\
+    }									\
+  }									\
+  else if (X_is_float)							\
+  {									\
+    const char *X_col = X + basis*X_col_stride;				\
+    OMP_PARALLEL_FOR(clauses)						\
+    for (i=0; i<ns; i++)						\
+    {									\
+      const double x = *(const float *)(X_col + i*X_row_stride);	\
+      body								\
+    }									\
+  }									\
+  else									\
+  {									\
+    const char *X_col = X + basis*X_col_stride;				\
+    OMP_PARALLEL_FOR(clauses)						\
+    for (i=0; i<ns; i++)						\
+    {									\
+      const double x = *(const double *)(X_col + i*X_row_stride);	\
+      body								\
+    }									\
+  }
+
+/* Stepwise regression on samples given by a pointer to their data and
+ * strides (in bytes), so any (aligned) float32 or float64 array could be
+ * used without copying.  If has_bias, the bias term is not part of the
+ * samples but is fitted by an additional (last) row of weights.  Loops
+ * over samples are run in nthreads threads (if compiled with OpenMP;
+ * 0 -- as many as OpenMP chooses).
+ */
 DL_EXPORT(int)
-stepwise_regression(int w_rows, int w_cols, double w[w_rows][w_cols],
-			int X_rows, int X_cols, double X[X_rows][X_cols],
-			int XY_rows, int XY_cols, double XY[XY_rows][XY_cols],
-			int Xw_rows, int Xw_cols, double Xw[Xw_rows][Xw_cols],
-			int E_rows, int E_cols, double E[E_rows][E_cols],
-			int ac_rows, double ac[ac_rows],
-			int lm_2_ac_rows, double lm_2_ac[lm_2_ac_rows],
-			int S_rows, double S[S_rows],
-			int M,
-			int maxiter,
-			double convergence_tol,
-			float resamp_decay,
-			float min_resamp,
-			int verbose,
-			long long int seed)
+stepwise_regression_strided(int w_rows, int w_cols, double w[w_rows][w_cols],
+			    const char *X, int X_rows, int X_cols,
+			    long X_row_stride, long X_col_stride,
+			    int X_is_float,
+			    int has_bias,
+			    int XY_rows, int XY_cols, double XY[XY_rows][XY_cols],
+			    int Xw_rows, int Xw_cols, double Xw[Xw_rows][Xw_cols],
+			    int E_rows, int E_cols, double E[E_rows][E_cols],
+			    int ac_rows, double ac[ac_rows],
+			    int lm_2_ac_rows, double lm_2_ac[lm_2_ac_rows],
+			    int S_rows, double S[S_rows],
+			    int M,
+			    int maxiter,
+			    double convergence_tol,
+			    float resamp_decay,
+			    float min_resamp,
+			    int verbose,
+			    long long int seed,
+			    int nthreads)
 {
   // initialize the iterative optimization
   double incr = DBL_MAX;
@@ -50,6 +112,18 @@ stepwise_regression(int w_rows, int w_cols, double w[w_rows][w_cols],
   // loop indexes
   int i = 0;
 
+  // weights have to match the features (and the bias term)
+  if (w_rows != X_cols + (has_bias ? 1 : 0) || X_rows != ns)
+    return -1;
+
+#ifdef _OPENMP
+  // whether to run loops over samples in parallel
+  int parallel = 0;
+  if (nthreads <= 0)
+    nthreads = omp_get_max_threads();
+  parallel = (nthreads > 1) && (ns >= MIN_NS_PARALLEL);
+#endif
+
   // prob of resample each weight
   // allocate everything in heap -- not on stack
   float** p_resamp = (float **)calloc(w_rows, sizeof(float*));
@@ -104,10 +178,8 @@ stepwise_regression(int w_rows, int w_cols, double w[w_rows][w_cols],
 	{
 	  // calc the probability
 	  XdotP = 0.0;
-	  for (i=0; i<ns; i++)
-	  {
-	    XdotP += X[i][basis] * E[i][m]/S[i];
-	  }
+	  FOR_SAMPLES(reduction(+:XdotP),
+		      XdotP += x * E[i][m]/S[i];)
 
 	  // get the gradient
 	  grad = XY[basis][m] - XdotP;
@@ -185,13 +257,11 @@ stepwise_regression(int w_rows, int w_cols, double w[w_rows][w_cols],
 	  {
 	    // update the expected values
 	    w_diff = w_new - w_old;
-	    for (i=0; i<ns; i++)
-	    {
-	      Xw[i][m] += X[i][basis]*w_diff;
-	      E_new_m = exp(Xw[i][m]);
-	      S[i] += E_new_m - E[i][m];
-	      E[i][m] = E_new_m;
-	    }
+	    FOR_SAMPLES(private(E_new_m),
+			Xw[i][m] += x*w_diff;
+			E_new_m = exp(Xw[i][m]);
+			S[i] += E_new_m - E[i][m];
+			E[i][m] = E_new_m;)
 
 	    // update the weight
 	    w[basis][m] = w_new;
@@ -235,6 +305,54 @@ stepwise_regression(int w_rows, int w_cols, double w[w_rows][w_cols],
   return cycle;
 }
 
+
+/* Stepwise regression on C-contiguous float64 samples (including the bias
+ * term if any) in a single thread */
+DL_EXPORT(int)
+stepwise_regression(int w_rows, int w_cols, double w[w_rows][w_cols],
+			int X_rows, int X_cols, double X[X_rows][X_cols],
+			int XY_rows, int XY_cols, double XY[XY_rows][XY_cols],
+			int Xw_rows, int Xw_cols, double Xw[Xw_rows][Xw_cols],
+			int E_rows, int E_cols, double E[E_rows][E_cols],
+			int ac_rows, double ac[ac_rows],
+			int lm_2_ac_rows, double lm_2_ac[lm_2_ac_rows],
+			int S_rows, double S[S_rows],
+			int M,
+			int maxiter,
+			double convergence_tol,
+			float resamp_decay,
+			float min_resamp,
+			int verbose,
+			long long int seed)
+{
+  return stepwise_regression_strided(w_rows, w_cols, w,
+				     (const char *)X, X_rows, X_cols,
+				     X_cols*sizeof(double), sizeof(double),
+				     0, 0,
+				     XY_rows, XY_cols, XY,
+				     Xw_rows, Xw_cols, Xw,
+				     E_rows, E_cols, E,
+				     ac_rows, ac,
+				     lm_2_ac_rows, lm_2_ac,
+				     S_rows, S,
+				     M, maxiter, convergence_tol,
+				     resamp_decay, min_resamp,
+				     verbose, seed, 1);
+}
+
+
+/* Whether stepwise_regression_strided() could run in multiple threads,
+ * i.e. was compiled with OpenMP */
+DL_EXPORT(int)
+has_openmp(void)
+{
+#ifdef _OPENMP
+  return 1;
+#else
+  return 0;
+#endif
+}
+
 /* make dummy module definition to satisfy distutils on win32
  * which cannot compile non-extension libraries
  */
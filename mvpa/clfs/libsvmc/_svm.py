@@ -12,7 +12,7 @@ __docformat__ = 'restructuredtext'
 
 
 from math import exp, fabs
-import re, copy
+import os, re, copy, tempfile
 
 import numpy as np
 
@@ -216,8 +216,67 @@ def seq_to_svm_node(x):
 
 
 
+class SVMNodeMatrix(object):
+    """Rows of a 2D array converted at once into libsvm's node arrays.
+
+    All nodes are stored in a single block allocated by the C code.
+    """
+
+    def __init__(self, x, precomputed=False):
+        """
+        Parameters
+        ----------
+        x : ndarray
+          2D array of samples, or of kernel values between the samples and
+          the training samples if `precomputed`.
+        precomputed : bool
+          Either to convert rows in libsvm's format for precomputed kernels.
+        """
+        self.block = self.matrix = None
+        x = np.asarray(x, dtype=float)
+        if x.ndim != 2:
+            raise ValueError, "Need 2D array of samples, got %s" % (x.shape,)
+        self.shape = x.shape
+        self.precomputed = precomputed
+        self.block = svmc.svm_node_block_from_numpy(x, int(precomputed))
+        self.matrix = svmc.svm_node_matrix_from_block(
+            self.block, len(x), x.shape[1] + int(precomputed) + 1)
+
+
+    def __len__(self):
+        return self.shape[0]
+
+
+    def __getitem__(self, i):
+        """Node array of the i-th row"""
+        return svmc.svm_node_matrix_get(self.matrix, i)
+
+
+    def __del__(self):
+        try:
+            if self.matrix is not None:
+                svmc.svm_node_matrix_destroy(self.matrix)
+            if self.block is not None:
+                svmc.svm_node_array_destroy(self.block)
+        except:
+            # module might be already unloaded at interpreter exit
+            pass
+
+
+
 class SVMProblem:
-    def __init__(self, y, x):
+    def __init__(self, y, x, precomputed=False):
+        """
+        Parameters
+        ----------
+        y : sequence
+          Targets.
+        x : ndarray or sequence
+          Samples, or kernel matrix of the samples if `precomputed`.  2D
+          arrays are converted at once (see `SVMNodeMatrix`).
+        precomputed : bool
+          Either `x` is a precomputed kernel matrix.
+        """
         assert len(y) == len(x)
         self.prob = prob = svmc.new_svm_problem()
         self.size = size = len(y)
@@ -226,6 +285,19 @@ class SVMProblem:
         for i in xrange(size):
             svmc.double_setitem(y_array, i, y[i])
 
+        self.nodes = None
+        self.precomputed = precomputed
+        if precomputed or (isinstance(x, np.ndarray) and x.ndim == 2):
+            self.nodes = nodes = SVMNodeMatrix(x, precomputed=precomputed)
+            self.x_matrix = nodes.matrix
+            self.data = None
+            # columns of node arrays (besides terminators)
+            self.maxlen = nodes.shape[1] + int(precomputed)
+            svmc.svm_problem_l_set(prob, size)
+            svmc.svm_problem_y_set(prob, y_array)
+            svmc.svm_problem_x_set(prob, self.x_matrix)
+            return
+
         self.x_matrix = x_matrix = svmc.svm_node_matrix(size)
         data = [None for i in xrange(size)]
         maxlen = 0
@@ -258,9 +330,20 @@ class SVMProblem:
 
         svmc.delete_svm_problem(self.prob)
         svmc.delete_double(self.y_array)
-        for i in range(self.size):
-            svmc.svm_node_array_destroy(self.data[i])
-        svmc.svm_node_matrix_destroy(self.x_matrix)
+        if self.nodes is None:
+            for i in range(self.size):
+                svmc.svm_node_array_destroy(self.data[i])
+            svmc.svm_node_matrix_destroy(self.x_matrix)
+        # otherwise nodes get freed along with SVMNodeMatrix
+
+
+
+class _SVMProblemInfo(object):
+    """Information about the `SVMProblem` kept by an unpickled `SVMModel`"""
+
+    def __init__(self, prob):
+        self.maxlen = prob.maxlen
+        self.precomputed = prob.precomputed
 
 
 
@@ -280,8 +363,11 @@ class SVMModel:
             if msg:
                 raise ValueError, msg
             self.model = svmc.svm_train(prob.prob, param.param)
+        self._setup()
+
 
-        #setup some classwide variables
+    def _setup(self):
+        """Setup some classwide variables from the model"""
         self.nr_class = svmc.svm_get_nr_class(self.model)
         self.svm_type = svmc.svm_get_svm_type(self.model)
         #create labels(classes)
@@ -347,9 +433,56 @@ class SVMModel:
         return ret
 
 
+    def predict_nodes(self, nodes):
+        """Predictions for all rows of `SVMNodeMatrix` `nodes`"""
+        return svmc.svm_predict_matrix(self.model, nodes.matrix, len(nodes))
+
+
+    def predict_values_raw_nodes(self, nodes):
+        """Decision values for all rows of `SVMNodeMatrix` `nodes`
+
+        Returns
+        -------
+        ndarray
+          `len(nodes)` x `nr_class*(nr_class-1)/2` array.
+        """
+        n = self.nr_class*(self.nr_class-1)//2
+        return svmc.svm_predict_values_matrix(self.model, nodes.matrix,
+                                              len(nodes), n)
+
+
+    def predict_probability_nodes(self, nodes):
+        """Probabilities for all rows of `SVMNodeMatrix` `nodes`
+
+        Returns
+        -------
+        list of (prediction, probabilities) tuples
+          See `predict_probability`.
+        """
+        self._check_probability()
+        dblarr = svmc.new_double(self.nr_class)
+        res = []
+        try:
+            for i in xrange(len(nodes)):
+                pred = svmc.svm_predict_probability(self.model, nodes[i],
+                                                    dblarr)
+                pv = double_array_to_list(dblarr, self.nr_class)
+                res.append((pred, dict(zip(self.labels, pv))))
+        finally:
+            svmc.delete_double(dblarr)
+        return res
+
+
     ##REF: Name was automagically refactored
     def predict_values(self, x):
-        v = self.predict_values_raw(x)
+        return self.values_to_dict(self.predict_values_raw(x))
+
+
+    def values_to_dict(self, v):
+        """Raw decision values into a dict per each pair of labels
+
+        For SVR/ONE_CLASS models it is just the decision value.
+        """
         if self.svm_type == NU_SVR \
            or self.svm_type == EPSILON_SVR \
            or self.svm_type == ONE_CLASS:
@@ -365,8 +498,7 @@ class SVMModel:
             return  d
 
 
-    ##REF: Name was automagically refactored
-    def predict_probability(self, x):
+    def _check_probability(self):
         #c code will do nothing on wrong type, so we have to check ourself
         if self.svm_type == NU_SVR or self.svm_type == EPSILON_SVR:
             raise TypeError, "call get_svr_probability or get_svr_pdf " \
@@ -378,6 +510,11 @@ class SVMModel:
         if not self.probability:
             raise TypeError, "model does not support probabiliy estimates"
 
+
+    ##REF: Name was automagically refactored
+    def predict_probability(self, x):
+        self._check_probability()
+
         #convert x into SVMNode, alloc a double array to receive probabilities
         data = seq_to_svm_node(x)
         dblarr = svmc.new_double(self.nr_class)
@@ -412,6 +549,75 @@ class SVMModel:
         svmc.svm_save_model(filename, self.model)
 
 
+    def __getstate__(self):
+        """Pickle the model through libsvm's own model file format
+
+        Since libsvm stores double values with limited precision, all of
+        them (support vectors, their coefficients, rho, etc) are stored
+        separately at full precision.
+        """
+        fd, filename = tempfile.mkstemp(prefix='svm_model_')
+        os.close(fd)
+        try:
+            self.save(filename)
+            model_file = open(filename).read()
+        finally:
+            os.unlink(filename)
+        param = svmc.svm_model_param_get(self.model)
+        state = dict(model_file=model_file,
+                     sv_values=svmc.svm_node_matrix_values(
+                         svmc.svm_model_SV_get(self.model),
+                         self.get_total_n_sv()),
+                     sv_coef=self.get_sv_coef(),
+                     rho=self.get_rho(),
+                     gamma=svmc.svm_parameter_gamma_get(param),
+                     coef0=svmc.svm_parameter_coef0_get(param))
+        if self.probability:
+            npairs = self.nr_class * (self.nr_class-1)/2
+            state['probA'] = double_array_to_list(
+                svmc.svm_model_probA_get(self.model), npairs)
+            state['probB'] = double_array_to_list(
+                svmc.svm_model_probB_get(self.model), npairs)
+        prob = getattr(self, 'prob', None)
+        if prob is not None:
+            # just the information needed to access the SVs
+            state['prob'] = _SVMProblemInfo(prob)
+        return state
+
+
+    def __setstate__(self, state):
+        fd, filename = tempfile.mkstemp(prefix='svm_model_')
+        try:
+            os.write(fd, state['model_file'])
+            os.close(fd)
+            self.model = svmc.svm_load_model(filename)
+        finally:
+            os.unlink(filename)
+        if self.model is None:
+            raise ValueError, "Failed to restore libsvm model"
+        nsv = svmc.svm_model_l_get(self.model)
+        if svmc.svm_node_matrix_set_values(svmc.svm_model_SV_get(self.model),
+                                           nsv, state['sv_values']) \
+           or svmc.doubleppcarray_set_from_numpy(
+               svmc.svm_model_sv_coef_get(self.model),
+               svmc.svm_get_nr_class(self.model) - 1, nsv, state['sv_coef']):
+            svmc.svm_destroy_model(self.model)
+            self.model = None
+            raise ValueError, "Restored libsvm model does not match its " \
+                  "support vectors"
+        param = svmc.svm_model_param_get(self.model)
+        svmc.svm_parameter_gamma_set(param, state['gamma'])
+        svmc.svm_parameter_coef0_set(param, state['coef0'])
+        for field in ('rho', 'probA', 'probB'):
+            if field in state:
+                array = getattr(svmc, 'svm_model_%s_get' % field)(self.model)
+                for i, value in enumerate(state[field]):
+                    svmc.double_setitem(array, i, value)
+        if 'prob' in state:
+            self.prob = state['prob']
+        self._setup()
+
+
     def __del__(self):
         if __debug__:
             debug('CLF_', 'Destroying libsvm.SVMModel %s' % (`self`))
@@ -449,6 +655,17 @@ class SVMModel:
                     self.prob.maxlen)
 
 
+    def get_sv_indices(self):
+        """Returns indices of the support vectors among training samples.
+
+        Available only for models trained on precomputed kernels.
+        """
+        if not getattr(self, 'prob', None) or not self.prob.precomputed:
+            raise ValueError, "Indices of SVs are known only for models " \
+                  "trained on precomputed kernels"
+        return self.get_sv()[:, 0].astype(int) - 1
+
+
     ##REF: Name was automagically refactored
     def get_sv_coef(self):
         """Return coefficients for SVs... Needs to be used directly with caution!
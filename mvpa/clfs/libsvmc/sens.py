@@ -74,7 +74,11 @@ class LinearSVMWeights(Sensitivity):
         #            " classes. Make sure that it is what you intended to do" )
 
         svcoef = np.matrix(model.get_sv_coef())
-        svs = np.matrix(model.get_sv())
+        if clf.traindataset is not None:
+            # precomputed kernel -- SVs are training samples
+            svs = np.matrix(clf.traindataset.samples[model.get_sv_indices()])
+        else:
+            svs = np.matrix(model.get_sv())
         rhos = np.asarray(model.get_rho())
 
         self.ca.biases = rhos
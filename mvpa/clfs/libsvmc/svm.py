@@ -22,7 +22,7 @@ from mvpa.clfs.base import accepts_dataset_as_samples, \
 from mvpa.clfs._svmbase import _SVM
 
 from mvpa.clfs.libsvmc import _svm
-from mvpa.kernels.libsvm import LinearLSKernel
+from mvpa.kernels.libsvm import LSKernel, LinearLSKernel
 from sens import LinearSVMWeights
 
 if __debug__:
@@ -42,6 +42,12 @@ class SVM(_SVM):
     """Support Vector Machine Classifier.
 
     This is a simple interface to the libSVM package.
+
+    Besides LIBSVM's own kernels (see `mvpa.kernels.libsvm`), any kernel
+    convertible to Numpy (e.g. `CachedKernel`, `PrecomputedKernel`) can be
+    used.  Its matrix is passed to LIBSVM as a precomputed kernel, so
+    `CachedKernel` spares the computation of the kernel in each fold of
+    a cross-validation.
     """
 
     # Since this is internal feature of LibSVM, this conditional attribute is present
@@ -118,6 +124,9 @@ class SVM(_SVM):
         self.__model = None
         """Holds the trained SVM."""
 
+        self.__traindataset = None
+        """Training dataset if kernel is precomputed."""
+
 
 
     def _train(self, dataset):
@@ -126,13 +135,22 @@ class SVM(_SVM):
         targets_sa_name = self.params.targets_attr    # name of targets sa
         targets_sa = dataset.sa[targets_sa_name] # actual targets sa
 
-        # libsvm needs doubles
-        src = _data2ls(dataset)
-
         # libsvm cannot handle literal labels
         labels = self._attrmap.to_numeric(targets_sa.value).tolist()
 
-        svmprob = _svm.SVMProblem(labels, src )
+        kernel = self.params.kernel
+        if self._is_precomputed():
+            kernel.compute(dataset)
+            svmprob = _svm.SVMProblem(labels, kernel.as_raw_np(),
+                                      precomputed=True)
+            kernel_type = PRECOMPUTED
+            # needed to compute the kernel for testing samples
+            self.__traindataset = dataset
+        else:
+            # libsvm needs doubles
+            src = _data2ls(dataset)
+            svmprob = _svm.SVMProblem(labels, src)
+            kernel_type = kernel.as_raw_ls() # Just an integer ID
 
         # Translate few params
         TRANSLATEDICT = {'epsilon': 'eps',
@@ -155,7 +173,7 @@ class SVM(_SVM):
         # **kwargs and create appropriate parameters within .params or
         # .kernel_params
         libsvm_param = _svm.SVMParameter(
-            kernel_type=self.params.kernel.as_raw_ls(),# Just an integer ID
+            kernel_type=kernel_type,
             svm_type=self._svm_type,
             **dict(args))
         
@@ -182,19 +200,31 @@ class SVM(_SVM):
         self.__model = _svm.SVMModel(svmprob, libsvm_param)
 
 
+    def _is_precomputed(self):
+        """Either the kernel is passed to libsvm as a precomputed matrix"""
+        return not isinstance(self.params.kernel, LSKernel)
+
+
     @accepts_samples_as_dataset
     def _predict(self, data):
         """Predict values for the data
         """
-        # libsvm needs doubles
-        src = _data2ls(data)
+        if self._is_precomputed():
+            kernel = self.params.kernel
+            kernel.compute(data, self.__traindataset)
+            nodes = _svm.SVMNodeMatrix(kernel.as_raw_np(), precomputed=True)
+        else:
+            # libsvm needs doubles
+            nodes = _svm.SVMNodeMatrix(_data2ls(data))
         ca = self.ca
+        model = self.model
 
-        predictions = [ self.model.predict(p) for p in src ]
+        predictions = model.predict_nodes(nodes).tolist()
 
         if ca.is_enabled('estimates'):
+            values = model.predict_values_raw_nodes(nodes)
             if self.__is_regression__:
-                estimates = [ self.model.predict_values_raw(p)[0] for p in src ]
+                estimates = values[:, 0].tolist()
             else:
                 # if 'trained_targets' are literal they have to be mapped
                 if np.issubdtype(self.ca.trained_targets.dtype, 'c'):
@@ -203,19 +233,13 @@ class SVM(_SVM):
                 else:
                     trained_targets = self.ca.trained_targets
                 nlabels = len(trained_targets)
-                # XXX We do duplicate work. model.predict calls
-                # predict_values_raw internally and then does voting or
-                # thresholding. So if speed becomes a factor we might
-                # want to move out logic from libsvm over here to base
-                # predictions on obtined values, or adjust libsvm to
-                # spit out values from predict() as well
                 if nlabels == 2:
                     # Apperently libsvm reorders labels so we need to
                     # track (1,0) values instead of (0,1) thus just
                     # lets take negative reverse
-                    estimates = [ self.model.predict_values(p)[(trained_targets[1],
-                                                            trained_targets[0])]
-                               for p in src ]
+                    estimates = [ model.values_to_dict(v)[(trained_targets[1],
+                                                           trained_targets[0])]
+                                  for v in values ]
                     if len(estimates) > 0:
                         if __debug__:
                             debug("SVM",
@@ -225,17 +249,12 @@ class SVM(_SVM):
                 else:
                     # In multiclass we return dictionary for all pairs
                     # of labels, since libsvm does 1-vs-1 pairs
-                    estimates = [ self.model.predict_values(p) for p in src ]
+                    estimates = [ model.values_to_dict(v) for v in values ]
             ca.estimates = estimates
 
         if ca.is_enabled("probabilities"):
-            # XXX Is this really necesssary? yoh don't think so since
-            # assignment to ca is doing the same
-            #self.probabilities = [ self.model.predict_probability(p)
-            #                       for p in src ]
             try:
-                ca.probabilities = [ self.model.predict_probability(p)
-                                         for p in src ]
+                ca.probabilities = model.predict_probability_nodes(nodes)
             except TypeError:
                 warning("Current SVM %s doesn't support probability " %
                         self + " estimation.")
@@ -271,10 +290,14 @@ class SVM(_SVM):
         super(SVM, self).untrain()
         del self.__model
         self.__model = None
+        self.__traindataset = None
 
     model = property(fget=lambda self: self.__model)
     """Access to the SVM model."""
 
+    traindataset = property(fget=lambda self: self.__traindataset)
+    """Training dataset (stored only if kernel is precomputed)."""
+
 
 # try to configure libsvm 'noise reduction'. Due to circular imports,
 # we can't check externals here since it would not work.
@@ -204,6 +204,17 @@ static PyObject* doubleppcarray2numpy_array(double** data, int rows, int cols);
 %array_functions(int,int)
 %array_functions(double,double)
 
+/* propagate errors (e.g. MemoryError) set by the bulk conversions below */
+%exception svm_node_block_from_numpy {
+	$action
+	if (!result && PyErr_Occurred()) SWIG_fail;
+}
+
+%exception svm_node_matrix_from_block {
+	$action
+	if (!result) SWIG_fail;
+}
+
 %inline %{
 struct svm_node *svm_node_array(int size)
 {
@@ -248,4 +259,187 @@ void svm_node_matrix_destroy(struct svm_node **matrix)
 	free(matrix);
 }
 
+/* convert all rows of a 2D array at once into a single block of svm_node
+ * arrays, each terminated by index -1.  Features get indices starting
+ * from 0.  For precomputed kernels (precomputed != 0) each row starts with
+ * the node (0, row number + 1) and kernel values get indices starting
+ * from 1, as libsvm expects.  Returns NULL if the array is not 2D, or
+ * raises MemoryError if the block cannot be allocated. */
+struct svm_node *svm_node_block_from_numpy(PyObject *obj, int precomputed)
+{
+	PyArrayObject* a = (PyArrayObject*) PyArray_ContiguousFromAny(
+		obj, NPY_DOUBLE, 2, 2);
+	if (!a)
+	{
+		PyErr_Clear();
+		return NULL;
+	}
+
+	int rows = (int) PyArray_DIM(a, 0);
+	int cols = (int) PyArray_DIM(a, 1);
+	int offset = precomputed ? 1 : 0;
+	int stride = cols + offset + 1;
+	double* data = (double *) PyArray_DATA(a);
+
+	struct svm_node *block = (struct svm_node *)malloc(
+		sizeof(struct svm_node) * ((size_t) rows * stride + 1));
+	if (!block)
+	{
+		Py_DECREF(a);
+		PyErr_NoMemory();
+		return NULL;
+	}
+
+	int i, j;
+	for (i = 0; i < rows; ++i)
+	{
+		struct svm_node *node = block + (size_t) i * stride;
+		if (precomputed)
+		{
+			node->index = 0;
+			node->value = i + 1;
+			++node;
+		}
+		for (j = 0; j < cols; ++j)
+		{
+			node[j].index = j + offset;
+			node[j].value = data[(size_t) cols * i + j];
+		}
+		node[cols].index = -1;
+		node[cols].value = 0.0;
+	}
+
+	Py_DECREF(a);
+	return block;
+}
+
+/* row pointers into a block of svm_node arrays of the same length */
+struct svm_node **svm_node_matrix_from_block(struct svm_node *block,
+											 int rows, int stride)
+{
+	struct svm_node **matrix = svm_node_matrix(rows + 1);
+	int i;
+	if (!matrix)
+	{
+		PyErr_NoMemory();
+		return NULL;
+	}
+	for (i = 0; i < rows; ++i)
+		matrix[i] = block + (size_t) i * stride;
+	return matrix;
+}
+
+struct svm_node *svm_node_matrix_get(struct svm_node **matrix, int i)
+{
+	return matrix[i];
+}
+
+/* values of all the nodes (but terminators) of the rows of a node matrix */
+PyObject *svm_node_matrix_values(struct svm_node **matrix, int rows)
+{
+	npy_intp n = 0;
+	struct svm_node *node;
+	int i;
+	for (i = 0; i < rows; ++i)
+		for (node = matrix[i]; node->index != -1; ++node)
+			++n;
+	PyArrayObject* a = (PyArrayObject*) PyArray_SimpleNew(1, &n, NPY_DOUBLE);
+	if (!a)
+		return NULL;
+	double* data = (double *) PyArray_DATA(a);
+	for (i = 0; i < rows; ++i)
+		for (node = matrix[i]; node->index != -1; ++node)
+			*(data++) = node->value;
+	return PyArray_Return(a);
+}
+
+/* set values of all the nodes of the rows of a node matrix from a 1D
+ * array (as returned by svm_node_matrix_values).  Returns -1 if the
+ * number of values does not match the number of nodes. */
+int svm_node_matrix_set_values(struct svm_node **matrix, int rows,
+							   PyObject *obj)
+{
+	PyArrayObject* a = (PyArrayObject*) PyArray_ContiguousFromAny(
+		obj, NPY_DOUBLE, 1, 1);
+	if (!a)
+	{
+		PyErr_Clear();
+		return -1;
+	}
+	npy_intp n = 0;
+	struct svm_node *node;
+	int i;
+	for (i = 0; i < rows; ++i)
+		for (node = matrix[i]; node->index != -1; ++node)
+			++n;
+	if (n != PyArray_DIM(a, 0))
+	{
+		Py_DECREF(a);
+		return -1;
+	}
+	double* data = (double *) PyArray_DATA(a);
+	for (i = 0; i < rows; ++i)
+		for (node = matrix[i]; node->index != -1; ++node)
+			node->value = *(data++);
+	Py_DECREF(a);
+	return 0;
+}
+
+/* set values of a rows x cols double** array from a 2D array.  Returns -1
+ * if the shapes do not match. */
+int doubleppcarray_set_from_numpy(double **carray, int rows, int cols,
+								  PyObject *obj)
+{
+	PyArrayObject* a = (PyArrayObject*) PyArray_ContiguousFromAny(
+		obj, NPY_DOUBLE, 2, 2);
+	if (!a)
+	{
+		PyErr_Clear();
+		return -1;
+	}
+	if (PyArray_DIM(a, 0) != rows || PyArray_DIM(a, 1) != cols)
+	{
+		Py_DECREF(a);
+		return -1;
+	}
+	double* data = (double *) PyArray_DATA(a);
+	int i, j;
+	for (i = 0; i < rows; ++i)
+		for (j = 0; j < cols; ++j)
+			carray[i][j] = data[(size_t) cols * i + j];
+	Py_DECREF(a);
+	return 0;
+}
+
+/* predictions for all rows of a node matrix */
+PyObject *svm_predict_matrix(const struct svm_model *model,
+							 struct svm_node **matrix, int rows)
+{
+	npy_intp dims[1] = {rows};
+	PyArrayObject* a = (PyArrayObject*) PyArray_SimpleNew(1, dims, NPY_DOUBLE);
+	if (!a)
+		return NULL;
+	double* data = (double *) PyArray_DATA(a);
+	int i;
+	for (i = 0; i < rows; ++i)
+		data[i] = svm_predict(model, matrix[i]);
+	return PyArray_Return(a);
+}
+
+/* decision values (rows x nvalues) for all rows of a node matrix */
+PyObject *svm_predict_values_matrix(const struct svm_model *model,
+									struct svm_node **matrix, int rows,
+									int nvalues)
+{
+	npy_intp dims[2] = {rows, nvalues};
+	PyArrayObject* a = (PyArrayObject*) PyArray_SimpleNew(2, dims, NPY_DOUBLE);
+	if (!a)
+		return NULL;
+	double* data = (double *) PyArray_DATA(a);
+	int i;
+	for (i = 0; i < rows; ++i)
+		svm_predict_values(model, matrix[i], data + (size_t) i * nvalues);
+	return PyArray_Return(a);
+}
+
 %}
@@ -15,7 +15,7 @@ Meta Classifiers can be grouped according to their function as
 :group ProxyClassifiers: ProxyClassifier BinaryClassifier MappedClassifier
   FeatureSelectionClassifier
 :group PredictionsCombiners for CombinedClassifier: PredictionsCombiner
-  MaximalVote MeanPrediction
+  MaximalVote MaximalEstimate MeanPrediction
 
 """
 
@@ -38,6 +38,7 @@ from mvpa.mappers.base import FeatureSliceMapper
 
 from mvpa.clfs.base import Classifier
 from mvpa.clfs.distance import cartesian_distance
+from mvpa.kernels.base import precache_kernel
 from mvpa.misc.transformers import first_axis_mean
 
 from mvpa.measures.base import \
@@ -47,12 +48,21 @@ from mvpa.measures.base import \
     RegressionAsClassifierSensitivityAnalyzer, \
     BinaryClassifierSensitivityAnalyzer
 
-from mvpa.base import warning
+from mvpa.base import warning, externals
 
 if __debug__:
     from mvpa.base import debug
 
 
+def _get_meta_tags(clf):
+    """Tags of a slave classifier a meta classifier adheres to.
+
+    'fast_cv' is not inherited since held-out predictions of the slave
+    classifier are not held-out predictions of the meta classifier.
+    """
+    return [t for t in clf.__tags__ if t != 'fast_cv']
+
+
 class BoostedClassifier(Classifier, Harvestable):
     """Classifier containing the farm of other classifiers.
 
@@ -181,7 +191,7 @@ class BoostedClassifier(Classifier, Harvestable):
         # TODO: this seems to be wrong since it can be regression etc
         self.__tags__ = [ 'binary', 'multiclass', 'meta' ]
         if len(clfs)>0:
-            self.__tags__ += self.__clfs[0].__tags__
+            self.__tags__ += _get_meta_tags(self.__clfs[0])
 
     def untrain(self):
         """Untrain `BoostedClassifier`
@@ -244,7 +254,7 @@ class ProxyClassifier(Classifier):
         # TODO: unittest
         self.__tags__ = self.__tags__[:] + ['meta']
         if clf is not None:
-            self.__tags__ += clf.__tags__
+            self.__tags__ += _get_meta_tags(clf)
 
 
     def __repr__(self, prefixes=[]):
@@ -395,61 +405,158 @@ class MaximalVote(PredictionsCombiner):
         if len(clfs)==0:
             return []                   # to don't even bother
 
-        all_label_counts = None
+        # distinct predictions (as tuples of labels) of every classifier
+        # and indexes of them for every sample
+        all_votes = []
         for clf in clfs:
             # Lets check first if necessary conditional attribute is enabled
             if not clf.ca.is_enabled("predictions"):
                 raise ValueError, "MaximalVote needs classifiers (such as " + \
                       "%s) with state 'predictions' enabled" % clf
-            predictions = clf.ca.predictions
-            if all_label_counts is None:
-                all_label_counts = [ {} for i in xrange(len(predictions)) ]
-
-            # for every sample
-            for i in xrange(len(predictions)):
-                prediction = predictions[i]
-                # XXX fishy location due to literal labels,
-                # TODO simplify assumptions and logic
-                if isinstance(prediction, basestring) or \
-                       not operator.isSequenceType(prediction):
-                    prediction = (prediction,)
-                for label in prediction: # for every label
-                    # XXX we might have multiple labels assigned
-                    # but might not -- don't remember now
-                    if not all_label_counts[i].has_key(label):
-                        all_label_counts[i][label] = 0
-                    all_label_counts[i][label] += 1
-
-        predictions = []
+            all_votes.append(_get_votes(clf.ca.predictions))
+
+        labels = set()
+        for values, inverse in all_votes:
+            for value in values:
+                labels.update(value)
+        labels = sorted(labels)
+        label_ids = dict([(l, i) for i, l in enumerate(labels)])
+
+        # count votes for every label/sample
+        counts = np.zeros((len(all_votes[0][1]), len(labels)), dtype=int)
+        for values, inverse in all_votes:
+            # votes of each distinct prediction
+            votes = np.zeros((len(values), len(labels)), dtype=int)
+            for i, value in enumerate(values):
+                votes[i, [label_ids[l] for l in value]] = 1
+            counts += votes[inverse]
+
         # select maximal vote now for each sample
-        for i in xrange(len(all_label_counts)):
-            label_counts = all_label_counts[i]
-            # lets do explicit search for max so we know
-            # if it is unique
-            maxk = []                   # labels of elements with max vote
-            maxv = -1
-            for k, v in label_counts.iteritems():
-                if v > maxv:
-                    maxk = [k]
-                    maxv = v
-                elif v == maxv:
-                    maxk.append(k)
-
-            assert len(maxk) >= 1, \
-                   "We should have obtained at least a single key of max label"
-
-            if len(maxk) > 1:
-                warning("We got multiple labels %s which have the " % maxk +
-                        "same maximal vote %d. XXX disambiguate" % maxv)
-            predictions.append(maxk[0])
+        winners = counts.argmax(axis=1)
+        maxv = counts.max(axis=1)
+        nties = np.sum((counts == maxv[:, np.newaxis]).sum(axis=1) > 1)
+        if nties:
+            warning("We got multiple labels which have the same maximal "
+                    "vote for %d samples. XXX disambiguate" % nties)
+        predictions = [labels[i] for i in winners]
 
         ca = self.ca
-        ca.estimates = all_label_counts
+        if ca.is_enabled('estimates'):
+            ca.estimates = [dict([(labels[i], c[i]) for i in c.nonzero()[0]])
+                            for c in counts]
         ca.predictions = predictions
         return predictions
 
 
 
+def _get_votes(predictions):
+    """Distinct `predictions` and the index of the prediction of each sample
+
+    Each distinct prediction is a tuple of the labels voted for, since
+    `BinaryClassifier` might predict a list of labels.
+    """
+    try:
+        apredictions = np.asarray(predictions)
+    except ValueError:
+        # sequences of labels
+        apredictions = None
+    if apredictions is not None and apredictions.ndim == 1 \
+           and apredictions.dtype != np.object:
+        values, inverse = np.unique(apredictions, return_inverse=True)
+        return [(v,) for v in values], inverse
+
+    value_ids = {}
+    inverse = np.empty(len(predictions), dtype=int)
+    for i, prediction in enumerate(predictions):
+        # XXX fishy location due to literal labels,
+        # TODO simplify assumptions and logic
+        if isinstance(prediction, basestring) or \
+               not operator.isSequenceType(prediction):
+            prediction = (prediction,)
+        else:
+            prediction = tuple(prediction)
+        inverse[i] = value_ids.setdefault(prediction, len(value_ids))
+    return sorted(value_ids, key=value_ids.get), inverse
+
+
+
+class MaximalEstimate(PredictionsCombiner):
+    """Provides a decision by the largest decision value of binary classifiers
+
+    Meant to combine 1-vs-all `BinaryClassifier`\s: each sample gets the
+    positive label of the binary classifier most confident about it.
+    Unlike voting, the decision is not biased toward some labels whenever
+    none or multiple of the binary classifiers claim a sample.  Slave
+    classifiers have to provide either a decision value (positive for
+    +1, e.g. `SVM`) or a value per label (e.g. probabilities of `SMLR`)
+    as their 'estimates'.
+    """
+
+    predictions = ConditionalAttribute(enabled=True,
+        doc="Predictions of the most confident classifiers")
+    estimates = ConditionalAttribute(enabled=False,
+        doc="Estimates keep decision values of the classifiers for each "
+            "label/sample")
+
+    def train(self, clfs, dataset):
+        """Enable estimates of the slave classifiers"""
+        for clf in clfs:
+            clf.clf.ca.enable('estimates')
+
+
+    def __call__(self, clfs, dataset):
+        """Actuall callable - pick the largest decision value
+        """
+        if len(clfs)==0:
+            return []                   # to don't even bother
+
+        labels, decisions = [], []
+        for clf in clfs:
+            if not isinstance(clf, BinaryClassifier):
+                raise ValueError, "MaximalEstimate needs BinaryClassifiers, " \
+                      "got %s" % clf
+            poslabels = clf.poslabels
+            labels.append(len(poslabels) > 1 and poslabels or poslabels[0])
+            decisions.append(_get_decision_values(clf.clf))
+        decisions = np.array(decisions).T
+
+        predictions = [labels[i] for i in decisions.argmax(axis=1)]
+
+        ca = self.ca
+        if ca.is_enabled('estimates'):
+            ca.estimates = [dict(zip(labels, d)) for d in decisions]
+        ca.predictions = predictions
+        return predictions
+
+
+
+def _get_decision_values(clf):
+    """Decision values of a binary classifier (targets -1 and +1)
+
+    Positive values stand for +1.
+    """
+    if not clf.ca.is_set('estimates'):
+        raise ValueError, "%s provides no 'estimates' to derive decision " \
+              "values from" % clf
+    try:
+        estimates = np.asanyarray(clf.ca.estimates, dtype=float)
+    except (TypeError, ValueError):
+        estimates = None
+    if estimates is not None and estimates.ndim == 1:
+        return estimates
+    if estimates is not None and estimates.ndim == 2 \
+           and estimates.shape[1] == 2:
+        # value per label, in the order of the (sorted) trained targets
+        if clf.ca.is_set('trained_targets'):
+            pos = list(clf.ca.trained_targets).index(1)
+        else:
+            pos = 1
+        return estimates[:, pos] - estimates[:, 1 - pos]
+    raise ValueError, "Cannot derive decision values from estimates %r " \
+          "of %s" % (clf.ca.estimates, clf)
+
+
+
 class MeanPrediction(PredictionsCombiner):
     """Provides a decision by taking mean of the results
     """
@@ -948,21 +1055,13 @@ class BinaryClassifier(ProxyClassifier):
         """Train `BinaryClassifier`
         """
         targets_sa_name = self.params.targets_attr
-        idlabels = [(x, +1) for x in get_samples_by_attr(dataset, targets_sa_name,
-                                                         self.__poslabels)] + \
-                    [(x, -1) for x in get_samples_by_attr(dataset, targets_sa_name,
-                                                          self.__neglabels)]
-        # XXX we have to sort ids since at the moment Dataset.select_samples
-        #     doesn't take care about order
-        idlabels.sort()
+        targets = dataset.sa[targets_sa_name].value
+        pos = np.in1d(targets, self.__poslabels)
+        ids = np.where(pos | np.in1d(targets, self.__neglabels))[0]
 
         # If we need all samples, why simply not perform on original
-        # data, an just store/restore labels. But it really should be done
-        # within Dataset.select_samples
-        if len(idlabels) == dataset.nsamples \
-            and [x[0] for x in idlabels] == range(dataset.nsamples):
-            # the last condition is not even necessary... just overly
-            # cautious
+        # data, an just store/restore labels.
+        if len(ids) == dataset.nsamples:
             datasetselected = dataset.copy(deep=False)   # no selection is needed
             if __debug__:
                 debug('CLFBIN',
@@ -971,17 +1070,17 @@ class BinaryClassifier(ProxyClassifier):
                       " classification among labels %s/+1 and %s/-1" %
                       (self.__poslabels, self.__neglabels))
         else:
-            datasetselected = dataset[[ x[0] for x in idlabels ]]
+            datasetselected = dataset[ids]
             if __debug__:
                 debug('CLFBIN',
                       "Selected %d samples out of %d samples for binary " %
-                      (len(idlabels), dataset.nsamples) +
+                      (len(ids), dataset.nsamples) +
                       " classification among labels %s/+1 and %s/-1" %
                       (self.__poslabels, self.__neglabels) +
                       ". Selected %s" % datasetselected)
 
         # adjust the labels
-        datasetselected.sa[targets_sa_name].value = [ x[1] for x in idlabels ]
+        datasetselected.sa[targets_sa_name].value = np.where(pos[ids], 1, -1)
 
         # now we got a dataset with only 2 labels
         if __debug__:
@@ -1012,11 +1111,13 @@ class MulticlassClassifier(CombinedClassifier):
     """`CombinedClassifier` to perform multiclass using a list of
     `BinaryClassifier`.
 
-    such as 1-vs-1 (ie in pairs like libsvm doesn) or 1-vs-all (which
-    is yet to think about)
+    such as 1-vs-1 (ie in pairs like libsvm doesn) or 1-vs-all, where
+    each label is separated from all the others.  Binary classifiers
+    can be trained in parallel, then each child process receives only
+    the samples its classifiers are trained on.
     """
 
-    def __init__(self, clf, bclf_type="1-vs-1", **kwargs):
+    def __init__(self, clf, bclf_type="1-vs-1", nproc=1, **kwargs):
         """Initialize the instance
 
         Parameters
@@ -1026,8 +1127,18 @@ class MulticlassClassifier(CombinedClassifier):
           for multiclass
         bclf_type
           "1-vs-1" or "1-vs-all", determines the way to generate binary
-          classifiers
+          classifiers.  Unless `combiner` is provided, predictions of
+          1-vs-1 classifiers are combined by `MaximalVote`, and the ones
+          of 1-vs-all classifiers by `MaximalEstimate`.
+        nproc : None or int
+          How many processes to use for training binary classifiers.
+          Requires `pprocess` external module, and trained classifiers
+          have to be picklable to be sent back from child processes.  If
+          None -- all available cores will be used.
         """
+        if bclf_type == "1-vs-all" and kwargs.get('combiner') is None:
+            # votes of 1-vs-all classifiers are mostly ambiguous
+            kwargs['combiner'] = MaximalEstimate()
         CombinedClassifier.__init__(self, **kwargs)
 
         self.__clf = clf
@@ -1035,26 +1146,32 @@ class MulticlassClassifier(CombinedClassifier):
 
         # adhere to slave classifier capabilities
         if clf is not None:
-            self.__tags__ += clf.__tags__
+            self.__tags__ += _get_meta_tags(clf)
         if not 'multiclass' in self.__tags__:
             self.__tags__ += ['multiclass']
 
         # Some checks on known ways to do multiclass
-        if bclf_type == "1-vs-1":
-            pass
-        elif bclf_type == "1-vs-all": # TODO
-            raise NotImplementedError
-        else:
+        if not bclf_type in ("1-vs-1", "1-vs-all"):
             raise ValueError, \
                   "Unknown type of classifier %s for " % bclf_type + \
                   "BoostedMulticlassClassifier"
         self.__bclf_type = bclf_type
 
+        if nproc is not None and nproc > 1 \
+               and not externals.exists('pprocess'):
+            raise RuntimeError("The 'pprocess' module is required for "
+                               "parallel training. Please either install "
+                               "python-pprocess, or reduce `nproc` to 1 "
+                               "(got nproc=%i)" % nproc)
+        self.__nproc = nproc
+
     # XXX fix it up a bit... it seems that MulticlassClassifier should
     # be actually ProxyClassifier and use BoostedClassifier internally
     def __repr__(self, prefixes=[]):
         prefix = "bclf_type=%s, clf=%s" % (repr(self.__bclf_type),
                                             repr(self.__clf))
+        if self.__nproc != 1:
+            prefix += ", nproc=%s" % repr(self.__nproc)
         return super(MulticlassClassifier, self).__repr__([prefix] + prefixes)
 
 
@@ -1066,26 +1183,86 @@ class MulticlassClassifier(CombinedClassifier):
         # construct binary classifiers
         ulabels = dataset.sa[targets_sa_name].unique
         if self.__bclf_type == "1-vs-1":
-            # generate pairs and corresponding classifiers
-            biclfs = []
-            for i in xrange(len(ulabels)):
-                for j in xrange(i+1, len(ulabels)):
-                    clf = self.__clf.clone()
-                    biclfs.append(
-                        BinaryClassifier(
-                            clf,
-                            poslabels=[ulabels[i]], neglabels=[ulabels[j]]))
-            if __debug__:
-                debug("CLFMC", "Created %d binary classifiers for %d labels" %
-                      (len(biclfs), len(ulabels)))
+            # generate pairs
+            labelsets = [([ulabels[i]], [ulabels[j]])
+                         for i in xrange(len(ulabels))
+                         for j in xrange(i+1, len(ulabels))]
+        else:
+            # each label against the rest
+            labelsets = [([l], [x for x in ulabels if x != l])
+                         for l in ulabels]
+        biclfs = [BinaryClassifier(self.__clf.clone(),
+                                   poslabels=poslabels, neglabels=neglabels)
+                  for poslabels, neglabels in labelsets]
+        if __debug__:
+            debug("CLFMC", "Created %d binary classifiers for %d labels" %
+                  (len(biclfs), len(ulabels)))
+
+        # assign first, so enabled ca propagate into the slaves
+        self.clfs = biclfs
+
+        nproc = self.__nproc
+        if nproc is None and externals.exists('pprocess'):
+            import pprocess
+            try:
+                nproc = pprocess.get_number_of_cores() or 1
+            except AttributeError:
+                warning("pprocess version %s has no API to figure out maximal "
+                        "number of cores. Using 1"
+                        % externals.versions['pprocess'])
+                nproc = 1
 
-            self.clfs = biclfs
+        # perform actual training
+        if nproc > 1 and len(biclfs) > 1:
+            self.clfs = self._train_parallel(biclfs, dataset, nproc)
+        else:
+            for clf in biclfs:
+                clf.train(dataset)
 
-        elif self.__bclf_type == "1-vs-all":
-            raise NotImplementedError
+        # combiner might need to train as well
+        self.combiner.train(self.clfs, dataset)
 
-        # perform actual training
-        CombinedClassifier._train(self, dataset)
+
+    def _train_parallel(self, biclfs, dataset, nproc):
+        """Train binary classifiers in `nproc` child processes
+
+        Returns
+        -------
+        list of BinaryClassifier
+          Trained classifiers, in the order of `biclfs`.
+        """
+        targets = dataset.sa[self.params.targets_attr].value
+        datasets = []
+        for clf in biclfs:
+            mask = np.in1d(targets, clf.poslabels + clf.neglabels)
+            if mask.all():
+                datasets.append(dataset)
+            else:
+                datasets.append(dataset[mask])
+
+        import pprocess
+        p_results = pprocess.Map(limit=nproc)
+        if __debug__:
+            debug("CLFMC", "Starting off child processes for nproc=%i"
+                  % nproc)
+        compute = p_results.manage(pprocess.MakeParallel(_train_clfs))
+        for block in np.array_split(np.arange(len(biclfs)),
+                                    min(nproc, len(biclfs))):
+            compute([biclfs[i] for i in block], [datasets[i] for i in block])
+
+        # results are in the order of the blocks
+        trained = []
+        for clfs in p_results:
+            trained += clfs
+        return trained
+
+
+
+def _train_clfs(clfs, datasets):
+    """Train each of `clfs` on the corresponding dataset"""
+    for clf, dataset in zip(clfs, datasets):
+        clf.train(dataset)
+    return clfs
 
 
 
@@ -1167,6 +1344,10 @@ class SplitClassifier(CombinedClassifier):
 
         clf_hastestdataset = hasattr(clf_template, 'testdataset')
 
+        # compute the kernel (if cached) only once, so all the clones
+        # get it along
+        precache_kernel(clf_template, dataset)
+
         # for proper and easier debugging - first define classifiers and then
         # train them
         for split in self.__splitter.splitcfg(dataset):
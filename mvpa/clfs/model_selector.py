@@ -13,14 +13,14 @@ __docformat__ = 'restructuredtext'
 
 
 import numpy as np
-from mvpa.base import externals
+from mvpa.base import externals, warning
 from mvpa.misc.exceptions import InvalidHyperparameterError
 
 if externals.exists("scipy", raise_=True):
     import scipy.linalg as SL
 
-# no sense to import this module if openopt is not available
-if externals.exists("openopt", raise_=True):
+# openopt is required only for the optimization itself
+if externals.exists("openopt"):
     try:
         from openopt import NLP
     except ImportError:
@@ -56,6 +56,8 @@ class ModelSelector(object):
         self.hyperparameters_best = None
         self.log_marginal_likelihood_best = None
         self.problem = None
+        self.stopcase = None
+        self.restarts = None
         pass
 
     def max_log_marginal_likelihood(self, hyp_initial_guess, maxiter=1,
@@ -93,6 +95,7 @@ class ModelSelector(object):
         optimization problem (NLP). This fact is confirmed by Dmitrey,
         author of OpenOpt.
         """
+        externals.exists("openopt", raise_=True)
         self.problem = None
         self.use_gradient = use_gradient
         self.logscale = logscale # use log-scale on hyperparameters to enhance numerical stability
@@ -268,4 +271,101 @@ class ModelSelector(object):
         self.stopcase = result.stopcase
         return self.log_marginal_likelihood_best
 
+
+    def _solve_from(self, hyp_initial_guess, kwargs):
+        """Maximize log_marginal_likelihood starting from a single guess.
+
+        Returns a tuple (log_marginal_likelihood_best,
+        hyperparameters_best, stopcase).
+        """
+        self.hyperparameters_best = None
+        self.log_marginal_likelihood_best = None
+        self.stopcase = None
+        self.max_log_marginal_likelihood(hyp_initial_guess, **kwargs)
+        lml = self.solve()
+        if __debug__:
+            debug("MOD_SEL", "Restart from %s: log_marginal_likelihood=%s "
+                  "hyperparameters=%s" % (hyp_initial_guess, lml,
+                                          self.hyperparameters_best))
+        return lml, self.hyperparameters_best, self.stopcase
+
+
+    def solve_restarts(self, hyp_initial_guesses, nproc=1, **kwargs):
+        """Maximize log_marginal_likelihood from several initial guesses.
+
+        The optimization is restarted from every initial guess and the
+        best solution is kept.  Afterwards the parametric model is set to
+        the best hyperparameters and trained on the dataset.
+
+        Parameters
+        ----------
+        hyp_initial_guesses : sequence of numpy.ndarray
+          Initial values of the hyperparameters for each restart.
+        nproc : None or int, optional
+          How many processes to use for running the restarts.  Requires
+          `pprocess` external module.  If None -- all available cores
+          will be used.
+        **kwargs
+          Passed to `max_log_marginal_likelihood()` for every restart.
+
+        Returns
+        -------
+        float or None
+          Best log_marginal_likelihood or None if none of the restarts
+          converged.  Results of all restarts are available in
+          `restarts` as (log_marginal_likelihood_best,
+          hyperparameters_best, stopcase) tuples.
+        """
+        if nproc != 1 and not externals.exists('pprocess'):
+            if nproc is None:
+                nproc = 1
+            else:
+                raise RuntimeError("The 'pprocess' module is required for "
+                                   "parallel restarts. Please either install "
+                                   "python-pprocess, or reduce `nproc` to 1 "
+                                   "(got nproc=%i)" % nproc)
+        if nproc is None:
+            import pprocess
+            try:
+                nproc = pprocess.get_number_of_cores() or 1
+            except AttributeError:
+                warning("pprocess version %s has no API to figure out maximal "
+                        "number of cores. Using 1"
+                        % externals.versions['pprocess'])
+                nproc = 1
+
+        guesses = [np.array(g) for g in hyp_initial_guesses]
+        if nproc > 1:
+            import pprocess
+            p_results = pprocess.Map(limit=nproc)
+            if __debug__:
+                debug("MOD_SEL", "Starting off %d restarts in child processes "
+                      "for nproc=%i" % (len(guesses), nproc))
+            compute = p_results.manage(pprocess.MakeParallel(self._solve_from))
+            for guess in guesses:
+                compute(guess, kwargs)
+            # results are in the order of the guesses
+            restarts = list(p_results)
+        else:
+            restarts = [self._solve_from(guess, kwargs) for guess in guesses]
+        self.restarts = restarts
+
+        best = None
+        for i, (lml, hyp, stopcase) in enumerate(restarts):
+            if lml is None or hyp is None:
+                continue
+            if best is None or lml > restarts[best][0]:
+                best = i
+        if best is None:
+            self.hyperparameters_best = None
+            self.log_marginal_likelihood_best = None
+            return None
+
+        (self.log_marginal_likelihood_best, self.hyperparameters_best,
+         self.stopcase) = restarts[best]
+        # restarts might have been done in child processes
+        self.parametric_model.set_hyperparameters(self.hyperparameters_best)
+        self.parametric_model.train(self.dataset)
+        return self.log_marginal_likelihood_best
+
     pass
@@ -12,18 +12,36 @@ __docformat__ = 'restructuredtext'
 
 
 import numpy as np
+import time
 
+from mvpa.base import externals
 from mvpa.misc.exceptions import ConvergenceError
+from mvpa.misc.state import ConditionalAttribute
 from mvpa.clfs.base import Classifier, accepts_dataset_as_samples
 
+if externals.exists('scipy'):
+    from scipy.linalg import cho_factor, cho_solve
+
 if __debug__:
     from mvpa.base import debug
 
 
 class PLR(Classifier):
     """Penalized logistic regression `Classifier`.
+
+    The weights are fitted by Newton-Raphson iterations (iteratively
+    reweighted least squares).  If there are more features than samples,
+    iterations are done in the dual form, i.e. for the coefficients of
+    the samples x samples kernel matrix, so no features x features matrix
+    is ever built.
     """
 
+    niterations = ConditionalAttribute(enabled=True,
+        doc="Number of iterations until convergence")
+
+    iterations_time = ConditionalAttribute(enabled=False,
+        doc="Time (in seconds) spent in each iteration")
+
     def __init__(self, lm=1, criterion=1, reduced=False, maxiter=20, **kwargs):
         """
         Initialize a penalized logistic regression analysis
@@ -66,7 +84,7 @@ class PLR(Classifier):
         """Train the classifier using `data` (`Dataset`).
         """
         # Set up the environment for fitting the data
-        X = data.samples.T
+        X = np.asanyarray(data.samples, dtype='d')
         d = data.sa[self.params.targets_attr].value
         if not list(set(d)) == [0, 1]:
             raise ValueError, \
@@ -78,40 +96,54 @@ class PLR(Classifier):
 
             # Compensate for reduced rank:
             # Select only the n largest eigenvectors
-            U, S, V = svd(X.T)
+            U, S, Vh = svd(X, full_matrices=False)
             S /= S[0]
-            V = np.matrix(V[:, :np.max(np.where(S > self.__reduced)) + 1])
+            V = Vh[:np.max(np.where(S > self.__reduced)) + 1].T
             # Map Data to the subspace spanned by the eigenvectors
-            X = (X.T * V).T
-
-        nfeatures, npatterns = X.shape
-
-        # Weighting vector
-        w  = np.matrix(np.zeros( (nfeatures + 1, 1), 'd'))
-        # Error for convergence criterion
-        dw = np.matrix(np.ones(  (nfeatures + 1, 1), 'd'))
-        # Patterns of interest in the columns
-        X = np.matrix( \
-                np.concatenate((X, np.ones((1, npatterns), 'd')), 0) \
-                )
-        p = np.matrix(np.zeros((1, npatterns), 'd'))
-        # Matrix implementation of penalty term
-        Lambda = self.__lm * np.identity(nfeatures + 1, 'd')
-        Lambda[nfeatures, nfeatures] = 0
-        # Gradient
-        g = np.matrix(np.zeros((nfeatures + 1, 1), 'd'))
-        # Fisher information matrix
-        H = np.matrix(np.identity(nfeatures + 1, 'd'))
+            X = np.dot(X, V)
+
+        npatterns, nfeatures = X.shape
+        # there is no need in the features x features Hessian if the
+        # weights are spanned by the samples
+        dual = nfeatures > npatterns
+        if dual:
+            K = np.dot(X, X.T)
+            # weights are X.T * a
+            a = np.zeros(npatterns, 'd')
+        else:
+            w = np.zeros(nfeatures, 'd')
+        offset = 0.0
+        # Linear predictor
+        y = np.zeros(npatterns, 'd')
 
         # Optimize
         k = 0
-        while np.sum(np.ravel(dw.A ** 2)) > self.__criterion:
-            p[:, :] = self.__f(w.T * X)
-            g[:, :] = X * (d - p).T - Lambda * w
-            H[:, :] = X * np.diag(p.A1 * (1 - p.A1)) * X.T + Lambda
-            dw[:, :] = H.I * g
-            w += dw
+        err = np.inf
+        times = []
+        while err > self.__criterion:
+            t0 = time.time()
+            p = self.__f(y)
+            # weights of the samples in the Fisher information matrix
+            W = p * (1 - p)
+            if dual:
+                da, doffset = self.__dual_step(K, W, d - p, a)
+                a += da
+                dy = np.dot(K, da)
+                # squared norm of the change of the weights
+                err = np.dot(da, dy)
+            else:
+                dw, doffset = self.__primal_step(X, W, d - p, w)
+                w += dw
+                dy = np.dot(X, dw)
+                err = np.dot(dw, dw)
+            offset += doffset
+            y += dy + doffset
+            err += doffset ** 2
             k += 1
+            times.append(time.time() - t0)
+            if __debug__:
+                debug("PLR_", "Iteration %d: error=%g took %.3f sec"
+                      % (k, err, times[-1]))
             if k > self.__maxiter:
                 raise ConvergenceError, \
                       "More than %d Iterations without convergence" % \
@@ -120,16 +152,67 @@ class PLR(Classifier):
         if __debug__:
             debug("PLR", \
                   "PLR converged after %d steps. Error: %g" % \
-                  (k, np.sum(np.ravel(dw.A ** 2))))
+                  (k, err))
+
+        self.ca.niterations = k
+        self.ca.iterations_time = times
 
+        if dual:
+            w = np.dot(X.T, a)
         if self.__reduced:
             # We have computed in rank reduced space ->
             # Project to original space
-            self.w = V * w[:-1]
-            self.offset = w[-1]
+            w = np.dot(V, w)
+        self.w = w
+        self.offset = offset
+
+
+    def __primal_step(self, X, W, r, w):
+        """Newton step for the weights and the offset.
+
+        Solves the system with the Fisher information matrix
+        X'WX + Lambda (with the unpenalized offset) by Cholesky
+        factorization.
+        """
+        lm = self.__lm
+        nfeatures = X.shape[1]
+        # weighted products by broadcasting instead of diag(W)
+        XtW = X.T * W
+        H = np.empty((nfeatures + 1, nfeatures + 1), 'd')
+        H[:nfeatures, :nfeatures] = np.dot(XtW, X)
+        H[:nfeatures, :nfeatures].flat[::nfeatures + 1] += lm
+        H[:nfeatures, nfeatures] = H[nfeatures, :nfeatures] = XtW.sum(axis=1)
+        H[nfeatures, nfeatures] = W.sum()
+        # gradient
+        g = np.hstack((np.dot(X.T, r) - lm * w, r.sum()))
+        if externals.exists('scipy'):
+            dw = cho_solve(cho_factor(H, lower=True), g)
         else:
-            self.w = w[:-1]
-            self.offset = w[-1]
+            L = np.linalg.cholesky(H)
+            dw = np.linalg.solve(L.T, np.linalg.solve(L, g))
+        return dw[:-1], dw[-1]
+
+
+    def __dual_step(self, K, W, r, a):
+        """Newton step for the coefficients of the kernel and the offset.
+
+        Since the penalized weights are a linear combination of the
+        samples, the Newton system reduces to
+        ``(WK + lm I) da + W doffset = r - lm a`` and
+        ``1'WK da + 1'W doffset = 1'r``.
+        """
+        lm = self.__lm
+        npatterns = len(K)
+        WK = K * W[:, np.newaxis]
+        A = np.empty((npatterns + 1, npatterns + 1), 'd')
+        A[:npatterns, :npatterns] = WK
+        A[:npatterns, :npatterns].flat[::npatterns + 1] += lm
+        A[:npatterns, npatterns] = W
+        A[npatterns, :npatterns] = WK.sum(axis=0)
+        A[npatterns, npatterns] = W.sum()
+        b = np.hstack((r - lm * a, r.sum()))
+        da = np.linalg.solve(A, b)
+        return da[:-1], da[-1]
 
 
     def __f(self, y):
@@ -145,11 +228,8 @@ class PLR(Classifier):
 
         Returns a list of class labels
         """
-        # make sure the data are in matrix form
-        data = np.matrix(np.asarray(data))
-
         # get the values and then predictions
-        values = np.ravel(self.__f(self.offset + data * self.w))
+        values = self.__f(self.offset + np.dot(np.asarray(data), self.w))
         predictions = values > 0.5
 
         # save the state if desired, relying on State._setitem_ to
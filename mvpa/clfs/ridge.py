@@ -15,7 +15,7 @@ import numpy as np
 from mvpa.base import externals
 
 if externals.exists("scipy", raise_=True):
-    from scipy.linalg import lstsq
+    from scipy.linalg import eigh
 
 from mvpa.clfs.base import Classifier, accepts_dataset_as_samples
 
@@ -24,9 +24,18 @@ class RidgeReg(Classifier):
 
     This ridge regression adds an intercept term so your labels do not
     have to be zero-centered.
+
+    The solution is obtained from an eigendecomposition of either the
+    features x features (primal form, if there are more samples than
+    features) or the samples x samples (dual form, otherwise) cross-product
+    matrix of the centered data, so no features x features matrix is ever
+    built for data with many more features than samples.  The same
+    decomposition provides solutions for any number of penalties at
+    almost no additional cost (see `train_path()`), as well as exact
+    held-out predictions for cross-validation folds (see `train_cv()`).
     """
 
-    __tags__ = ['ridge', 'regression', 'linear']
+    __tags__ = ['ridge', 'regression', 'linear', 'fast_cv']
 
     def __init__(self, lm=None, **kwargs):
         """
@@ -54,6 +63,13 @@ class RidgeReg(Classifier):
         # store train method config
         self.__implementation = 'direct'
 
+        # solutions for a sequence of penalties (see train_path())
+        self.__path = None
+        self.__path_lms = None
+        # held-out predictions for cross-validation folds (see train_cv())
+        self.__cv_folds = None
+        self.__cv_predictions = None
+
 
     def __repr__(self):
         """String summary of the object
@@ -66,34 +82,190 @@ class RidgeReg(Classifier):
                 (self.__lm, str(self.ca.enabled))
 
 
+    def _get_lm(self, nfeatures):
+        """The penalty term to use for data with `nfeatures`"""
+        if self.__lm is None:
+            # Not specified, so calculate based on .05*nfeatures
+            return .05*nfeatures
+        return self.__lm
+
+
     def _train(self, data):
         """Train the classifier using `data` (`Dataset`).
         """
 
         if self.__implementation == "direct":
-            # create matrices to solve with additional penalty term
-            # determine the lambda matrix
-            if self.__lm is None:
-                # Not specified, so calculate based on .05*nfeatures
-                Lambda = .05*data.nfeatures*np.eye(data.nfeatures)
+            decomposition = self._decompose(data)
+            lms = [self._get_lm(data.nfeatures)]
+            if self.__path_lms is not None:
+                lms += list(self.__path_lms)
+            weights = self._get_weights(decomposition, lms)
+            self.w = weights[0]
+            if self.__path_lms is None:
+                self.__path = None
             else:
-                # use the provided penalty
-                Lambda = self.__lm*np.eye(data.nfeatures)
-
-            # add the penalty term
-            a = np.concatenate( \
-                (np.concatenate((data.samples, np.ones((data.nsamples, 1))), 1),
-                    np.concatenate((Lambda, np.zeros((data.nfeatures, 1))), 1)))
-            b = np.concatenate((data.sa[self.params.targets_attr].value,
-                               np.zeros(data.nfeatures)))
-
-            # perform the least sq regression and save the weights
-            self.w = lstsq(a, b)[0]
+                self.__path = zip(self.__path_lms, weights[1:])
+            if self.__cv_folds is not None:
+                M, residuals = self._get_residual_operator(decomposition,
+                                                           lms[0])
+                self.__cv_predictions = self._get_holdout_predictions(
+                    M, residuals, decomposition['y'] + decomposition['ymean'],
+                    self.__cv_folds)
         else:
             raise ValueError, "Unknown implementation '%s'" \
                               % self.__implementation
 
 
+    def _decompose(self, data):
+        """Eigendecomposition of the smaller cross-product of centered data.
+
+        Intercept is not penalized, thus the problem is solved for the
+        centered samples and targets.
+
+        Returns
+        -------
+        dict
+        """
+        X = np.asanyarray(data.samples, dtype=float)
+        y = np.asanyarray(data.sa[self.params.targets_attr].value,
+                          dtype=float)
+        xmean, ymean = X.mean(axis=0), y.mean()
+        X = X - xmean
+        y = y - ymean
+        dual = len(X) < X.shape[1]
+        if dual:
+            # samples x samples kernel
+            evals, evecs = eigh(np.dot(X, X.T))
+            proj = np.dot(evecs.T, y)
+        else:
+            evals, evecs = eigh(np.dot(X.T, X))
+            proj = np.dot(evecs.T, np.dot(X.T, y))
+        # tolerance for (numerically) zero eigenvalues
+        tol = max(evals.max(), 0) * max(X.shape) * np.finfo(float).eps
+        return dict(X=X, y=y, xmean=xmean, ymean=ymean, dual=dual,
+                    evals=evals, evecs=evecs, proj=proj, tol=tol)
+
+
+    def _get_weights(self, decomposition, lms):
+        """Weights (with the intercept last) for each of the penalties `lms`
+        """
+        d = decomposition
+        # penalty term enters the augmented least-squares system as
+        # lambda * I, hence squared in the normal equations
+        denom = d['evals'] + np.asarray(lms, dtype=float)[:, np.newaxis]**2
+        inv = np.zeros(denom.shape)
+        nonzero = denom > d['tol']
+        inv[nonzero] = 1.0 / denom[nonzero]
+        coef = np.dot(inv * d['proj'], d['evecs'].T)
+        if d['dual']:
+            # back from the dual coefficients to the weights
+            coef = np.dot(coef, d['X'])
+        intercept = d['ymean'] - np.dot(coef, d['xmean'])
+        return np.hstack((coef, intercept[:, np.newaxis]))
+
+
+    def _get_residual_operator(self, decomposition, lm):
+        """`I - H` for the hat matrix `H` and the residuals of the fit
+        """
+        d = decomposition
+        denom = d['evals'] + lm**2
+        inv = np.zeros(denom.shape)
+        nonzero = denom > d['tol']
+        inv[nonzero] = 1.0 / denom[nonzero]
+        if d['dual']:
+            proj = d['evecs'] * np.sqrt(d['evals'].clip(0) * inv)
+        else:
+            proj = np.dot(d['X'], d['evecs'] * np.sqrt(inv))
+        n = len(d['X'])
+        # intercept contributes the mean
+        M = np.eye(n) - 1.0 / n - np.dot(proj, proj.T)
+        return M, np.dot(M, d['y'])
+
+
+    def train_cv(self, data, folds):
+        """Train the classifier and get held-out predictions for `folds`.
+
+        Predictions for the samples of each fold, as if the classifier was
+        trained on all the other samples, are computed exactly from the
+        hat matrix of a single fit to the full `data`.
+
+        Parameters
+        ----------
+        data : Dataset
+          Training data.
+        folds : sequence of ndarrays
+          Boolean masks of the samples held out in each fold.
+
+        Returns
+        -------
+        list of ndarrays
+          Predictions for the held-out samples of each fold.
+        """
+        self.__cv_folds = folds
+        try:
+            self.train(data)
+        finally:
+            self.__cv_folds = None
+        predictions, self.__cv_predictions = self.__cv_predictions, None
+        return predictions
+
+
+    def train_path(self, data, lms):
+        """Train the classifier and get solutions for a sequence of penalties.
+
+        All solutions come from a single decomposition of the data,
+        therefore they are almost as cheap as training the classifier
+        once.  The classifier itself is trained with its own penalty
+        `lm`.
+
+        Parameters
+        ----------
+        data : Dataset
+          Training data.
+        lms : sequence of float
+          Penalty terms lambda.
+
+        Returns
+        -------
+        list of (lm, weights) tuples
+          Weights (with the intercept last) for each penalty in the order
+          of `lms`.
+        """
+        self.__path_lms = list(lms)
+        try:
+            self.train(data)
+        finally:
+            self.__path_lms = None
+        return self.__path
+
+
+    @accepts_dataset_as_samples
+    def predict_path(self, data):
+        """Predict `data` for each penalty of the trained path.
+
+        Returns
+        -------
+        list of ndarrays
+          Predictions for each penalty in the order of `path`.
+        """
+        if self.__path is None:
+            raise ValueError, \
+                  "RidgeReg %s was not trained with train_path()" % self
+        data = np.concatenate((data, np.ones((len(data), 1))), 1)
+        return list(np.dot(data, np.array([w for lm, w in self.__path]).T).T)
+
+
+    def untrain(self):
+        """Untrain classifier and reset all learnt params
+        """
+        self.w = None
+        self.__path = None
+        super(RidgeReg, self).untrain()
+
+
+    path = property(lambda self: self.__path)
+
+
     @accepts_dataset_as_samples
     def _predict(self, data):
         """
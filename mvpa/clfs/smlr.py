@@ -14,20 +14,23 @@ import numpy as np
 
 from mvpa.base import warning, externals
 from mvpa.clfs.base import Classifier, accepts_dataset_as_samples
+from mvpa.clfs.transerror import TransferError
 from mvpa.measures.base import Sensitivity
 from mvpa.misc.exceptions import ConvergenceError
 from mvpa.misc.param import Parameter
 from mvpa.misc.state import ConditionalAttribute
 from mvpa.datasets.base import Dataset
 
-__all__ = [ "SMLR", "SMLRWeights" ]
+__all__ = [ "SMLR", "SMLRWeights", "SMLRPathError" ]
 
 
 _DEFAULT_IMPLEMENTATION = "Python"
 if externals.exists('ctypes'):
     # Uber-fast C-version of the stepwise regression
     try:
-        from mvpa.clfs.libsmlrc import stepwise_regression as _cStepwiseRegression
+        from mvpa.clfs.libsmlrc import \
+             stepwise_regression_strided as _cStepwiseRegression, \
+             has_openmp as _cHasOpenMP
         _DEFAULT_IMPLEMENTATION = "C"
     except OSError, e:
         warning("Failed to load fast implementation of SMLR.  May be you "
@@ -112,6 +115,12 @@ class SMLR(Classifier):
              stepwise_regression. C version brings significant speedup thus is
              the default one.""")
 
+    nthreads = Parameter(1, allowedtype='None or int', min=1,
+             doc="""Number of threads the C implementation uses for the
+             loops over samples.  Requires the C extension built with OpenMP
+             support (see `setup.py --with-openmp`).  If None -- as many as
+             OpenMP chooses (typically the number of cores).""")
+
     seed = Parameter(None, allowedtype='None or int',
              doc="""Seed to be used to initialize random generator, might be
              used to replicate the run""")
@@ -142,6 +151,11 @@ class SMLR(Classifier):
                     ' Using pure Python one')
             self.params.implementation = 'Python'
 
+        if self.params.implementation == 'C' \
+               and self.params.nthreads != 1 and not _cHasOpenMP():
+            warning('SMLR: C implementation was built without OpenMP '
+                    'support, thus it will use a single thread')
+
         # pylint friendly initializations
         self._ulabels = None
         """Unigue labels from the training set."""
@@ -151,6 +165,9 @@ class SMLR(Classifier):
         """Just the weights, without the biases"""
         self.__biases = None
         """The biases, will remain none if has_bias is False"""
+        self.__path = None
+        """Weights for a sequence of penalties (see `train_path()`)"""
+        self.__path_lms = None
 
 
     ##REF: Name was automagically refactored
@@ -297,8 +314,17 @@ class SMLR(Classifier):
         return cycles
 
 
-    def _train(self, dataset):
-        """Train the classifier using `dataset` (`Dataset`).
+    def _setup_problem(self, dataset):
+        """Precompute what we can for the optimization on `dataset`.
+
+        Returns
+        -------
+        (X, XY, auto_corr, M) : tuple
+          Samples, their products with one-of-M coded labels,
+          auto-correlation terms, and the number of classes.  The bias
+          term (if any) is included in `XY` and `auto_corr`, and for the
+          Python implementation also in `X` (the C implementation handles
+          it internally to avoid copying the samples).
         """
         targets_sa_name = self.params.targets_attr    # name of targets sa
         targets_sa = dataset.sa[targets_sa_name] # actual targets sa
@@ -314,32 +340,65 @@ class SMLR(Classifier):
         # get the dataset information into easy vars
         X = dataset.samples
 
-        # see if we are adding a bias term
-        if self.params.has_bias:
+        if self.params.implementation.upper() == 'C':
+            # C code operates on float32 or float64 samples of any layout
+            if not X.dtype in (np.float32, np.float64):
+                if __debug__:
+                    debug("SMLR_", "Converting data to double")
+                # must cast to double
+                X = X.astype(np.double)
+        elif self.params.has_bias:
             if __debug__:
                 debug("SMLR_", "hstacking 1s for bias")
 
             # append the bias term to the features
             X = np.hstack((X, np.ones((X.shape[0], 1), dtype=X.dtype)))
 
-        if self.params.implementation.upper() == 'C':
-            _stepwise_regression = _cStepwiseRegression
-            #
-            # TODO: avoid copying to non-contig arrays, use strides in ctypes?
-            if not (X.flags['C_CONTIGUOUS'] and X.flags['ALIGNED']):
-                if __debug__:
-                    debug("SMLR_",
-                          "Copying data to get it C_CONTIGUOUS/ALIGNED")
-                X = np.array(X, copy=True, dtype=np.double, order='C')
+        # decide the size of weights based on num classes estimated
+        if self.params.fit_all_weights:
+            c_to_fit = M
+        else:
+            c_to_fit = M-1
 
-            # currently must be double for the C code
-            if X.dtype != np.double:
-                if __debug__:
-                    debug("SMLR_", "Converting data to double")
-                # must cast to double
-                X = X.astype(np.double)
+        # Precompute what we can
+        Y = Y[:, :c_to_fit]
+        auto_corr = np.einsum('ij,ij->j', X, X, dtype=np.double)
+        XY = np.dot(X.T, Y.astype(X.dtype)).astype(np.double)
+        if self.params.has_bias and X.shape[1] == dataset.nfeatures:
+            # bias term is not among the samples
+            auto_corr = np.hstack((auto_corr, [len(X)]))
+            XY = np.vstack((XY, Y.sum(axis=0)))
+        auto_corr *= (M-1.)/(2.*M)
+
+        return X, XY, auto_corr, M
+
+
+    def _fit(self, lm, problem, start=None):
+        """Run the stepwise regression for a penalty `lm`.
+
+        Parameters
+        ----------
+        lm : float
+          The penalty term lambda.
+        problem : tuple
+          As returned by `_setup_problem()`.
+        start : tuple, optional
+          `(w, Xw, E, S)` of a previous solution on the same problem to
+          start the optimization from (they get updated in place).  If
+          None, optimization starts from all-zero weights.
+
+        Returns
+        -------
+        (w, Xw, E, S) : tuple
+          The solution.
+        """
+        X, XY, auto_corr, M = problem
 
-        # set the feature dimensions
+        if self.params.implementation.upper() == 'C':
+            def _stepwise_regression(*args):
+                return _cStepwiseRegression(
+                    has_bias=X.shape[1] < len(XY),
+                    nthreads=self.params.nthreads or 0, *args)
         elif self.params.implementation.upper() == 'PYTHON':
             _stepwise_regression = self._python_stepwise_regression
         else:
@@ -348,24 +407,19 @@ class SMLR(Classifier):
                   self.params.implementation
 
         # set the feature dimensions
-        ns, nd = X.shape
-
-        # decide the size of weights based on num classes estimated
-        if self.params.fit_all_weights:
-            c_to_fit = M
-        else:
-            c_to_fit = M-1
+        ns = len(X)
+        nd, c_to_fit = XY.shape
 
-        # Precompute what we can
-        auto_corr = ((M-1.)/(2.*M))*(np.sum(X*X, 0))
-        XY = np.dot(X.T, Y[:, :c_to_fit])
-        lambda_over_2_auto_corr = (self.params.lm/2.)/auto_corr
+        lambda_over_2_auto_corr = (lm/2.)/auto_corr
 
-        # set starting values
-        w = np.zeros((nd, c_to_fit), dtype=np.double)
-        Xw = np.zeros((ns, c_to_fit), dtype=np.double)
-        E = np.ones((ns, c_to_fit), dtype=np.double)
-        S = M*np.ones(ns, dtype=np.double)
+        if start is None:
+            # set starting values
+            w = np.zeros((nd, c_to_fit), dtype=np.double)
+            Xw = np.zeros((ns, c_to_fit), dtype=np.double)
+            E = np.ones((ns, c_to_fit), dtype=np.double)
+            S = M*np.ones(ns, dtype=np.double)
+        else:
+            w, Xw, E, S = start
 
         # set verbosity
         if __debug__:
@@ -397,8 +451,42 @@ class SMLR(Classifier):
                   "More than %d Iterations without convergence" % \
                   (self.params.maxiter)
 
+        if __debug__:
+            debug('SMLR', "fit with lm=%g finished in %d cycles on "
+                  "data.shape=%s " % (lm, cycles, X.shape) +
+                  "min:max(data)=%f:%f, got min:max(w)=%f:%f" %
+                  (np.min(X), np.max(X), np.min(w), np.max(w)))
+
+        return w, Xw, E, S
+
+
+    def _train(self, dataset):
+        """Train the classifier using `dataset` (`Dataset`).
+        """
+        problem = self._setup_problem(dataset)
+        X = problem[0]
+        if self.params.unsparsify and X.shape[1] < len(problem[1]):
+            # unsparsifying needs the bias term among the samples
+            X = np.hstack((X, np.ones((X.shape[0], 1), dtype=X.dtype)))
+
+        if self.__path_lms is None:
+            w = self._fit(self.params.lm, problem)[0]
+            self.__path = None
+        else:
+            # fit the penalties in decreasing order, each starting from the
+            # solution of the previous (more sparse) one
+            path = []
+            start = None
+            for lm in self.__path_lms:
+                start = self._fit(lm, problem, start)
+                w = start[0].copy()
+                if self.params.unsparsify:
+                    w = self._unsparsify_weights(X, w)
+                path.append((lm, w))
+            self.__path = path
+
         # see if unsparsify the weights
-        if self.params.unsparsify:
+        if self.params.unsparsify and self.__path is None:
             # unsparsify
             w = self._unsparsify_weights(X, w)
 
@@ -414,11 +502,59 @@ class SMLR(Classifier):
         if self.params.has_bias:
             self.__biases = w[-1, :]
 
-        if __debug__:
-            debug('SMLR', "train finished in %d cycles on data.shape=%s " %
-                  (cycles, X.shape) +
-                  "min:max(data)=%f:%f, got min:max(w)=%f:%f" %
-                  (np.min(X), np.max(X), np.min(w), np.max(w)))
+
+    def train_path(self, dataset, lms):
+        """Train the classifier for a sequence of penalties.
+
+        Penalties are fit in decreasing order, and the optimization for
+        each one starts from the solution for the previous one (warm
+        start), while the terms which do not depend on the penalty are
+        computed only once.  Since solutions for neighboring penalties
+        are similar, the whole path costs not much more than a few
+        individual fits.
+
+        Weights for all penalties are available from `path` and can be
+        used for prediction with `predict_path()`.  The classifier itself
+        ends up trained with the smallest penalty of the path.
+
+        Parameters
+        ----------
+        dataset : Dataset
+          Training data.
+        lms : sequence of float
+          Penalty terms lambda.
+
+        Returns
+        -------
+        list of (lm, weights) tuples
+          Weights (including the biases if `has_bias`) for each penalty,
+          in decreasing order of penalties.
+        """
+        lms = sorted(set(lms), reverse=True)
+        if not len(lms):
+            raise ValueError, "Need at least one penalty to fit SMLR path"
+        self.__path_lms = lms
+        try:
+            self.train(dataset)
+        finally:
+            self.__path_lms = None
+        return self.__path
+
+
+    @accepts_dataset_as_samples
+    def predict_path(self, data):
+        """Predict `data` for each penalty of the trained path.
+
+        Returns
+        -------
+        list of ndarrays
+          Predictions for each penalty in the order of `path`.
+        """
+        if self.__path is None:
+            raise ValueError, \
+                  "SMLR %s was not trained with train_path()" % self
+        return [self._get_predictions(data, w)[0] for lm, w in self.__path]
+
 
     def _unsparsify_weights(self, samples, weights):
         """Unsparsify weights via least squares regression."""
@@ -475,9 +611,8 @@ class SMLR(Classifier):
         """
         return np.where(np.max(np.abs(self.__weights), axis=1)>0)[0]
 
-    @accepts_dataset_as_samples
-    def _predict(self, data):
-        """Predict the output for the provided data.
+    def _get_predictions(self, data, weights_all):
+        """Predictions and probabilities of `data` for given weights.
         """
         # see if we are adding a bias term
         if self.params.has_bias:
@@ -487,10 +622,10 @@ class SMLR(Classifier):
 
         # append the zeros column to the weights if necessary
         if self.params.fit_all_weights:
-            w = self.__weights_all
+            w = weights_all
         else:
-            w = np.hstack((self.__weights_all,
-                          np.zeros((self.__weights_all.shape[0], 1))))
+            w = np.hstack((weights_all,
+                          np.zeros((weights_all.shape[0], 1))))
 
         # determine the probability values for making the prediction
         dot_prod = np.dot(data, w)
@@ -505,11 +640,20 @@ class SMLR(Classifier):
                    np.min(E), np.max(E)))
 
         values = E / S[:, np.newaxis].repeat(E.shape[1], axis=1)
-        self.ca.estimates = values
 
         # generate predictions
         predictions = np.asarray([self._ulabels[np.argmax(vals)]
                                  for vals in values])
+        return predictions, values
+
+
+    @accepts_dataset_as_samples
+    def _predict(self, data):
+        """Predict the output for the provided data.
+        """
+        predictions, values = self._get_predictions(data, self.__weights_all)
+        self.ca.estimates = values
+
         # no need to assign conditional attribute here -- would be done
         # in Classifier._postpredict anyway
         #self.predictions = predictions
@@ -517,6 +661,13 @@ class SMLR(Classifier):
         return predictions
 
 
+    def untrain(self):
+        """Untrain classifier and reset all learnt params
+        """
+        self.__path = None
+        super(SMLR, self).untrain()
+
+
     ##REF: Name was automagically refactored
     def get_sensitivity_analyzer(self, **kwargs):
         """Returns a sensitivity analyzer for SMLR."""
@@ -525,6 +676,7 @@ class SMLR(Classifier):
 
     biases = property(lambda self: self.__biases)
     weights = property(lambda self: self.__weights)
+    path = property(lambda self: self.__path)
 
 
 
@@ -568,3 +720,77 @@ class SMLRWeights(Sensitivity):
         # with the case of `fit_all_weights=False`
         return Dataset(weights,
                        sa={clf.params.targets_attr: clf._ulabels[:len(weights)]})
+
+
+
+class SMLRPathError(TransferError):
+    """Transfer errors of `SMLR` for a sequence of penalties.
+
+    Whenever a training dataset is provided, the classifier is trained
+    for all penalties at once using `SMLR.train_path()`, and an array
+    with an error per penalty (in decreasing order of penalties) is
+    returned.  Plugged into `CrossValidatedTransferError` it provides
+    the errors for a whole grid of penalties across all folds::
+
+      cv = CrossValidatedTransferError(
+               SMLRPathError(SMLR(), lms=[10, 1, 0.1, 0.01]),
+               NFoldSplitter())
+      errors = cv(dataset).samples.mean(axis=0)
+
+    Conditional attributes (e.g. `confusion`) describe the classifier
+    trained with the smallest penalty.
+    """
+
+    def __init__(self, clf, lms, **kwargs):
+        """
+        Parameters
+        ----------
+        clf : SMLR
+          Classifier to train along the path.
+        lms : sequence of float
+          Penalty terms lambda.
+        **kwargs
+          All additional arguments are passed to the `TransferError`
+          base class.
+        """
+        if not isinstance(clf, SMLR):
+            raise ValueError, "SMLRPathError works only with SMLR, got %s" \
+                  % clf
+        TransferError.__init__(self, clf, **kwargs)
+        self.__lms = sorted(set(lms), reverse=True)
+
+
+    def __copy__(self):
+        """Performs deepcopying of the classifier."""
+        out = SMLRPathError.__new__(SMLRPathError)
+        SMLRPathError.__init__(out, self.clf.clone(), self.__lms,
+                               errorfx=self.errorfx, labels=self._labels)
+        return out
+
+
+    def _precall(self, testdataset, trainingdataset=None):
+        """Train the classifier along the path if training data is given
+        """
+        if not trainingdataset is None:
+            clf = self.clf
+            if self.ca.is_enabled('training_confusion'):
+                clf.ca.change_temporarily(enable_ca=['training_confusion'])
+            clf.train_path(trainingdataset, self.__lms)
+            if self.ca.is_enabled('training_confusion'):
+                self.ca.training_confusion = clf.ca.training_confusion
+                clf.ca.reset_changed_temporarily()
+        # classifier is trained already -- the rest of the generic part
+        TransferError._precall(self, testdataset, None)
+
+
+    def _call(self, testdataset, trainingdataset=None):
+        """Compute the transfer errors for all penalties.
+        """
+        # assigns conditional attributes for the last (smallest) penalty
+        TransferError._call(self, testdataset, trainingdataset)
+        testtargets = testdataset.sa[self.clf.params.targets_attr].value
+        return np.array([self.errorfx(predictions, testtargets)
+                         for predictions in self.clf.predict_path(testdataset)])
+
+
+    lms = property(lambda self: self.__lms, doc="Penalties of the path")
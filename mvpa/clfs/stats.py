@@ -39,7 +39,7 @@ class Nonparametric(object):
           higher precision in the tails, so 'imagery' samples are
           placed in each of the two tails).
         """
-        self._dist_samples = np.ravel(dist_samples)
+        self._dist_samples = np.sort(np.ravel(dist_samples))
         self._correction = correction
 
     def __repr__(self):
@@ -58,17 +58,112 @@ class Nonparametric(object):
         """Returns the cdf value at `x`.
         """
         dist_samples = self._dist_samples
-        res = np.vectorize(lambda v:(dist_samples <= v).mean())(x)
-        if self._correction == 'clip':
-            nsamples = len(dist_samples)
-            np.clip(res, 1.0/(nsamples+2), (nsamples+1.0)/(nsamples+2), res)
-        elif self._correction is None:
-            pass
+        x = np.asanyarray(x)
+        # samples are sorted, so number of samples <= v is simply the
+        # insertion point to the right of v
+        res = np.searchsorted(dist_samples, x, side='right') \
+              / float(len(dist_samples))
+        # NaNs are sorted last, but nothing compares <= NaN
+        res = np.where(np.isnan(x), 0.0, res)
+        return _correct_cdf(res, len(dist_samples), self._correction, self)
+
+
+
+class FeaturewiseNonparametric(object):
+    """Non-parametric distributions of multiple features at once.
+
+    Vectorized equivalent of a list of `Nonparametric` distributions (one
+    per feature).  Samples of all features are sorted once, and cdf values
+    for all features are then computed by a simultaneous binary search
+    within each feature's samples.
+    """
+
+    def __init__(self, dist_samples, correction='clip', nsamples=None):
+        """
+        Parameters
+        ----------
+        dist_samples : ndarray
+          2D array (samples x features) of samples to be used to assess
+          the distribution of each feature.
+        correction : {'clip'} or None, optional
+          See `Nonparametric`.
+        nsamples : None or ndarray, optional
+          Number of samples available for each feature.  If provided,
+          only the first `nsamples` values of each feature are used, and
+          the remaining ones have to be NaN.  If None, all samples are
+          used for every feature.
+        """
+        dist_samples = np.asanyarray(dist_samples)
+        if dist_samples.ndim != 2:
+            raise ValueError, "%s requires 2D samples, got shape %s" \
+                  % (self.__class__.__name__, dist_samples.shape)
+        self._dist_samples = np.sort(dist_samples, axis=0)
+        self._correction = correction
+        if nsamples is None:
+            self._nsamples = dist_samples.shape[0]
         else:
-            raise ValueError, \
-                  '%r is incorrect value for correction parameter of %s' \
-                  % (self._correction, self.__class__.__name__)
-        return res
+            self._nsamples = np.asanyarray(nsamples)
+
+    def __repr__(self):
+        return '%s(%r%s)' % (
+            self.__class__.__name__,
+            self._dist_samples,
+            ('', ', correction=%r' % self._correction)
+              [int(self._correction != 'clip')])
+
+    def __len__(self):
+        """Number of features"""
+        return self._dist_samples.shape[1]
+
+
+    def cdf(self, x):
+        """Returns the cdf values at `x` (one value per feature).
+        """
+        dist_samples = self._dist_samples
+        nsamples, nfeatures = dist_samples.shape
+        x = np.asanyarray(x)
+        if x.shape != (nfeatures,):
+            raise ValueError, "Expected %d values, got array of shape %s" \
+                  % (nfeatures, x.shape)
+        features = np.arange(nfeatures)
+        # binary search for the number of samples <= x within each column
+        lo = np.zeros(nfeatures, dtype=int)
+        hi = np.empty(nfeatures, dtype=int)
+        hi.fill(nsamples)
+        # NaNs never compare <= anything (and are sorted last)
+        olderr = np.seterr(invalid='ignore')
+        try:
+            while True:
+                active = lo < hi
+                if not active.any():
+                    break
+                mid = (lo + hi) // 2
+                # clip to stay within bounds for already finished columns
+                mid_ = np.minimum(mid, nsamples - 1)
+                below = (dist_samples[mid_, features] <= x) & active
+                lo[below] = mid[below] + 1
+                above = active & ~below
+                hi[above] = mid[above]
+        finally:
+            np.seterr(**olderr)
+        nsamples = self._nsamples
+        res = lo / np.asanyarray(nsamples, dtype=float)
+        return _correct_cdf(res, nsamples, self._correction, self)
+
+
+
+def _correct_cdf(res, nsamples, correction, dist):
+    """Helper to apply correction of nonparametric cdf values"""
+    if correction == 'clip':
+        nsamples = np.asanyarray(nsamples, dtype=float)
+        np.clip(res, 1.0/(nsamples+2), (nsamples+1.0)/(nsamples+2), res)
+    elif correction is None:
+        pass
+    else:
+        raise ValueError, \
+              '%r is incorrect value for correction parameter of %s' \
+              % (correction, dist.__class__.__name__)
+    return res
 
 
 def _pvalue(x, cdf_func, tail, return_tails=False, name=None):
@@ -229,7 +324,8 @@ class MCNullDist(NullDist):
     # XXX shouldn't we may be RF permute_attr into a Permutator class? ;)
     def __init__(self, dist_class=Nonparametric, permutations=100,
                  permute_attr='targets', chunks_attr=None,
-                 permute_col='sa', assure_permute=False, **kwargs):
+                 permute_col='sa', assure_permute=False, nproc=1, seed=None,
+                 **kwargs):
         """Initialize Monte-Carlo Permutation Null-hypothesis testing
 
         Parameters
@@ -253,9 +349,28 @@ class MCNullDist(NullDist):
           Passed to func:`~mvpa.datasets.misc.permute_attr`. If True,
           assures that targets are permuted, i.e. any one is different from
           the original one
+        nproc : None or int, optional
+          How many processes to use for computing the measure on permuted
+          data.  Requires `pprocess` external module.  If None -- all
+          available cores will be used.
+        seed : None or int, optional
+          Master seed to derive random seeds for every permutation from.
+          If provided, resultant distribution does not depend on `nproc`.
+          If None, and permutations are done in multiple processes, the
+          master seed is drawn from NumPy's global random number generator
+          (thus it is determined by PyMVPA's seed).
         """
         NullDist.__init__(self, **kwargs)
 
+        if nproc != 1 and not externals.exists('pprocess'):
+            if nproc is None:
+                nproc = 1
+            else:
+                raise RuntimeError("The 'pprocess' module is required for "
+                                   "multiprocess permutations. Please either "
+                                   "install python-pprocess, or reduce `nproc` "
+                                   "to 1 (got nproc=%i)" % nproc)
+
         self._dist_class = dist_class
         self._dist = []                 # actual distributions
 
@@ -267,6 +382,8 @@ class MCNullDist(NullDist):
         self.chunks_attr = chunks_attr
         self.assure_permute = assure_permute
         self.permute_col = permute_col
+        self.nproc = nproc
+        self.seed = seed
 
     def __repr__(self, prefixes=[]):
         prefixes_ = ["permutations=%s" % self.__permutations]
@@ -278,6 +395,10 @@ class MCNullDist(NullDist):
             prefixes_ += ['permute_col=%r' % self.permute_col]
         if self.assure_permute:
             prefixes_ += ['assure_permute=%r' % self.assure_permute]
+        if self.nproc != 1:
+            prefixes_ += ['nproc=%r' % self.nproc]
+        if self.seed is not None:
+            prefixes_ += ['seed=%r' % self.seed]
         if self._dist_class != Nonparametric:
             prefixes_.insert(0, 'dist_class=%r' % (self._dist_class,))
         return super(MCNullDist, self).__repr__(
@@ -298,28 +419,206 @@ class MCNullDist(NullDist):
           If provided measure is assumed to be a `TransferError` and
           working and validation dataset are passed onto it.
         """
-        # TODO: place exceptions separately so we could avoid circular imports
-        from mvpa.clfs.base import LearnerError
+        nproc = self._get_nproc()
+        seeds = self._get_seeds(self.__permutations, nproc)
+
+        # estimate null-distribution
+        dist_samples = self._compute_permutations(measure, wdata, vdata,
+                                                  seeds, nproc)
+
+        if __debug__:
+            debug('STATMC', '')
+
+
+        # store samples
+        self.ca.dist_samples = dist_samples = np.asarray(dist_samples)
+
+        # fit distribution per each element
+
+        # to decide either it was done on scalars or vectors
+        shape = dist_samples.shape
+        nshape = len(shape)
+        # if just 1 dim, original data was scalar, just create an
+        # artif dimension for it
+        if nshape == 1:
+            dist_samples = dist_samples[:, np.newaxis]
+
+        # fit per each element.
+        # XXX could be more elegant? may be use np.vectorize?
+        dist_samples_rs = dist_samples.reshape((shape[0], -1))
+        if self._dist_class is Nonparametric:
+            # all elements at once
+            self._dist = FeaturewiseNonparametric(dist_samples_rs)
+            return
+        dist = []
+        for samples in dist_samples_rs.T:
+            params = self._dist_class.fit(samples)
+            if __debug__ and 'STAT' in debug.active:
+                debug('STAT', 'Estimated parameters for the %s are %s'
+                      % (self._dist_class, str(params)))
+            dist.append(self._dist_class(*params))
+        self._dist = dist
+
+
+    def _get_nproc(self):
+        """Number of processes to be used for permutations"""
+        nproc = self.nproc
+        if nproc is None:
+            import pprocess
+            try:
+                nproc = pprocess.get_number_of_cores() or 1
+            except AttributeError:
+                warning("pprocess version %s has no API to figure out maximal "
+                        "number of cores. Using 1"
+                        % externals.versions['pprocess'])
+                nproc = 1
+        return nproc
+
+
+    def _get_seeds(self, permutations, nproc):
+        """Seeds for every permutation
+
+        Seeds are derived from the master seed to have the same
+        permutations whatever the number of processes is.
+        """
+        seed = self.seed
+        if seed is None and nproc > 1:
+            seed = np.random.randint(2**30)
+        if seed is None:
+            return [None] * permutations
+        return list(np.random.RandomState(seed).randint(
+            2**30, size=permutations))
+
+
+    def _compute_permutations(self, measure, wdata, vdata, seeds, nproc):
+        """Compute the measure for permutations defined by `seeds`
+
+        Returns list of results in the order of `seeds`.
+        """
+        permutations = len(seeds)
+        if nproc > 1:
+            # the next block sets up the infrastructure for parallel computing
+            import pprocess
+            p_results = pprocess.Map(limit=nproc)
+            if __debug__:
+                debug('STATMC', "Starting off child processes for nproc=%i"
+                      % nproc)
+            compute = p_results.manage(
+                        pprocess.MakeParallel(self._permutations_block))
+            # split all permutations into `nproc` blocks
+            for block in np.array_split(np.arange(permutations), nproc):
+                compute(measure, wdata, vdata, [seeds[p] for p in block])
+
+            # collect results in the order of permutations
+            dist_samples = []
+            for block_results in p_results:
+                dist_samples += block_results
+                if __debug__:
+                    debug('STATMC', "Doing %i permutations: %i" \
+                          % (permutations, len(dist_samples)), cr=True)
+        else:
+            reseed = seeds and seeds[0] is not None
+            if reseed:
+                # do not disturb the global RNG whenever it gets reseeded
+                rstate = np.random.get_state()
+            dist_samples = self._permutations_block(
+                measure, wdata, vdata, seeds, progress=True)
+            if reseed:
+                np.random.set_state(rstate)
+
+        if __debug__:
+            debug('STATMC', '')
+        return dist_samples
+
+
+    def _permutations_block(self, measure, wdata, vdata, seeds,
+                            progress=False):
+        """Compute the measure for a number of permutations of the data
 
+        Little helper to capture the parts of the computation that can be
+        parallelized.
+
+        Parameters
+        ----------
+        seeds : list
+          Seeds to reseed the random number generator with before each
+          permutation.  Its length defines the number of permutations
+          and a seed None means no reseeding.
+        progress : bool
+          Either to report progress on the 'STATMC' debug target.
+        """
         dist_samples = []
         """Holds the values for randomized labels."""
 
-        # estimate null-distribution
-        for p in xrange(self.__permutations):
+        clf = self._get_retrainable_clf(measure, vdata)
+        if clf is not None:
+            was_retrainable = clf.params.retrainable
+            if not was_retrainable:
+                clf._set_retrainable(True)
+        try:
+            self._permutations_loop(measure, wdata, vdata, seeds, progress,
+                                    clf, dist_samples)
+        finally:
+            if clf is not None:
+                measure.only_targets_changed = False
+                if not was_retrainable:
+                    clf._set_retrainable(False)
+        return dist_samples
+
+
+    def _get_retrainable_clf(self, measure, vdata):
+        """Classifier which can be cheaply retrained on permuted targets
+
+        Permutations of the targets of the training dataset of a
+        `TransferError` with a constant validation dataset only change
+        the targets, so a retrainable classifier (e.g. `GPR`) does not
+        need to recompute anything which depends on the samples only
+        (kernels, their Cholesky factorization, etc).
+        """
+        from mvpa.clfs.transerror import ClassifierError
+        if vdata is None or not isinstance(measure, ClassifierError):
+            return None
+        clf = measure.clf
+        if not 'retrainable' in clf.__tags__ \
+           or self.permute_col != 'sa' \
+           or self.permute_attr != clf.params.targets_attr:
+            return None
+        return clf
+
+
+    def _permutations_loop(self, measure, wdata, vdata, seeds, progress,
+                           clf, dist_samples):
+        """Loop over permutations for `_permutations_block()`"""
+        # TODO: place exceptions separately so we could avoid circular imports
+        from mvpa.clfs.base import LearnerError
+        from mvpa.datasets.miscfx import permute_attr
+
+        # either the classifier was trained on a permutation already
+        trained = False
+        for p, seed in enumerate(seeds):
             # new permutation all the time
             # but only permute the training data and keep the testdata constant
             #
-            if __debug__:
+            if __debug__ and progress:
                 debug('STATMC', "Doing %i permutations: %i" \
-                      % (self.__permutations, p+1), cr=True)
+                      % (len(seeds), p+1), cr=True)
+
+            if seed is not None:
+                np.random.seed(seed)
 
             # TODO this really needs to be more clever! If data samples are
             # shuffled within a class it really makes no difference for the
             # classifier, hence the number of permutations to estimate the
             # null-distribution of transfer errors can be reduced dramatically
             # when the *right* permutations (the ones that matter) are done.
-            permuted_wdata = wdata.copy('shallow')
-            permuted_wdata.permute_attr(
+            if clf is not None:
+                # share the very same samples, so the classifier could
+                # verify that only the targets have changed
+                permuted_wdata = wdata.copy(deep=False)
+                permuted_wdata.samples = wdata.samples
+            else:
+                permuted_wdata = wdata.copy('shallow')
+            permute_attr(permuted_wdata,
                 attr=self.permute_attr,
                 chunks_attr=self.chunks_attr,
                 col=self.permute_col,
@@ -331,6 +630,10 @@ class MCNullDist(NullDist):
             else:
                 measure_args = [permuted_wdata]
 
+            if clf is not None:
+                # only targets differ from the previous permutation
+                measure.only_targets_changed = trained
+
             # compute and store the measure of this permutation
             # assume it has `TransferError` interface
             try:
@@ -339,38 +642,12 @@ class MCNullDist(NullDist):
                 warning('Failed to obtain value from %s due to %s.  Measurement'
                         ' was skipped, which could lead to unstable and/or'
                         ' incorrect assessment of the null_dist' % (measure, e))
+                trained = False
+                continue
+            trained = True
             res = np.asanyarray(res)
             dist_samples.append(res)
 
-        if __debug__:
-            debug('STATMC', '')
-
-
-        # store samples
-        self.ca.dist_samples = dist_samples = np.asarray(dist_samples)
-
-        # fit distribution per each element
-
-        # to decide either it was done on scalars or vectors
-        shape = dist_samples.shape
-        nshape = len(shape)
-        # if just 1 dim, original data was scalar, just create an
-        # artif dimension for it
-        if nshape == 1:
-            dist_samples = dist_samples[:, np.newaxis]
-
-        # fit per each element.
-        # XXX could be more elegant? may be use np.vectorize?
-        dist_samples_rs = dist_samples.reshape((shape[0], -1))
-        dist = []
-        for samples in dist_samples_rs.T:
-            params = self._dist_class.fit(samples)
-            if __debug__ and 'STAT' in debug.active:
-                debug('STAT', 'Estimated parameters for the %s are %s'
-                      % (self._dist_class, str(params)))
-            dist.append(self._dist_class(*params))
-        self._dist = dist
-
 
     def cdf(self, x):
         """Return value of the cumulative distribution function at `x`.
@@ -396,7 +673,10 @@ class MCNullDist(NullDist):
                   % (len(self._dist), len(x))
 
         # extract cdf values per each element
-        cdfs = [ dist.cdf(v) for v, dist in zip(x, self._dist) ]
+        if isinstance(self._dist, FeaturewiseNonparametric):
+            cdfs = self._dist.cdf(x)
+        else:
+            cdfs = [ dist.cdf(v) for v, dist in zip(x, self._dist) ]
         return np.array(cdfs).reshape(xshape)
 
 
@@ -411,6 +691,534 @@ class MCNullDist(NullDist):
         self._dist = []
 
 
+    permutations = property(fget=lambda self: self.__permutations)
+
+
+
+class SequentialMCNullDist(MCNullDist):
+    """Monte-Carlo permutation testing which stops as soon as it can.
+
+    Instead of always performing the full number of permutations,
+    permutations are done in batches of `step`.  After each batch the
+    number of permutations resulting in a value at least as extreme as
+    the observed one is evaluated for every element.  As soon as the
+    Clopper-Pearson confidence interval of the p-value of an element
+    does not contain `alpha` any longer, the significance decision for
+    that element is settled and no further samples are collected for it.
+    Permutations stop once all elements are decided, or once the maximal
+    number of `permutations` is reached.
+
+    Since the decision on an element depends on its observed value, the
+    measure is computed on the original data at the beginning of `fit()`.
+    The distribution of each element is then assessed non-parametrically
+    from the samples collected for it.
+
+    Notes
+    -----
+    The p-value of an element is settled with the error probability of
+    `1-confidence` (in both directions), so obviously non-significant
+    elements usually get decided after a few dozens of permutations,
+    while significant ones require at least approximately
+    log(1-confidence)/log(1-alpha) permutations.
+
+    See Also
+    --------
+    Besag, J. and Clifford, P. (1991). Sequential Monte Carlo p-values.
+    Biometrika, 78, 301-304.
+    """
+
+    nsamples = ConditionalAttribute(enabled=True,
+        doc='Number of permutations done for each element')
+
+    def __init__(self, alpha=0.05, confidence=0.99, step=10,
+                 featurewise=False, permutations=1000, **kwargs):
+        """
+        Parameters
+        ----------
+        alpha : float
+          Significance level to decide on.  For `tail='both'` it is
+          compared to the two-tailed p-value.
+        confidence : float
+          Confidence of the decision on each element.
+        step : int
+          Number of permutations to perform before reassessing the
+          decisions.
+        featurewise : bool
+          If True, the measure on permuted data is only computed for the
+          still undecided features.  This is valid only for univariate
+          featurewise measures (e.g. `OneWayAnova`), whose value for a
+          feature does not depend on the other features present.
+        permutations : int
+          Maximal number of permutations to perform.
+        """
+        MCNullDist.__init__(self, dist_class=Nonparametric,
+                            permutations=permutations, **kwargs)
+        self.alpha = alpha
+        self.confidence = confidence
+        self.step = step
+        self.featurewise = featurewise
+
+
+    def __repr__(self, prefixes=[]):
+        prefixes_ = []
+        if self.alpha != 0.05:
+            prefixes_.append('alpha=%r' % self.alpha)
+        if self.confidence != 0.99:
+            prefixes_.append('confidence=%r' % self.confidence)
+        if self.step != 10:
+            prefixes_.append('step=%r' % self.step)
+        if self.featurewise:
+            prefixes_.append('featurewise=%r' % self.featurewise)
+        return super(SequentialMCNullDist, self).__repr__(
+            prefixes=prefixes_ + prefixes)
+
+
+    def _is_decided(self, exceed, nsamples):
+        """Which elements have p-value confidence intervals excluding alpha
+
+        Parameters
+        ----------
+        exceed : ndarray
+          Number of samples at least as extreme as the observed value.
+        nsamples : int
+          Number of samples drawn.
+        """
+        from scipy.stats import beta
+        alpha = self.alpha
+        if self.tail == 'both':
+            # test one tail at half the level
+            alpha = alpha / 2.0
+        q = (1.0 - self.confidence) / 2.0
+        exceed = np.asanyarray(exceed, dtype=float)
+        lower = np.zeros(exceed.shape)
+        upper = np.ones(exceed.shape)
+        some = exceed > 0
+        lower[some] = beta.ppf(q, exceed[some], nsamples - exceed[some] + 1)
+        notall = exceed < nsamples
+        upper[notall] = beta.ppf(1 - q, exceed[notall] + 1,
+                                 nsamples - exceed[notall])
+        return (lower > alpha) | (upper < alpha)
+
+
+    def _count_exceeding(self, samples, observed):
+        """Number of samples at least as extreme as observed values"""
+        left = np.sum(samples <= observed, axis=0)
+        right = np.sum(samples >= observed, axis=0)
+        tail = self.tail
+        if tail == 'left':
+            return left
+        elif tail == 'right':
+            return right
+        # 'any' and 'both' -- the tail the observed value belongs to
+        return np.minimum(left, right)
+
+
+    def fit(self, measure, wdata, vdata=None):
+        """Fit the distribution by performing permutations until decided.
+
+        See `MCNullDist.fit()` for the description of the parameters.
+        """
+        externals.exists('scipy', raise_=True)
+
+        # decisions depend on the observed values
+        if not vdata is None:
+            observed = measure(vdata, wdata)
+        else:
+            observed = measure(wdata)
+        observed = np.asanyarray(observed)
+        shape = observed.shape
+        observed = observed.reshape((-1,))
+        nelements = len(observed)
+
+        if self.featurewise and \
+               (vdata is not None or nelements != wdata.nfeatures):
+            raise ValueError, \
+                  "featurewise=True requires a measure which returns a " \
+                  "single value per feature, got shape %s for %i features" \
+                  % (shape, wdata.nfeatures)
+
+        permutations = self.permutations
+        nproc = self._get_nproc()
+        seeds = self._get_seeds(permutations, nproc)
+
+        # samples are collected in blocks of (up to) `step` permutations,
+        # so memory is spent only on the permutations actually done
+        blocks = []
+        nsamples = np.zeros(nelements, dtype=int)
+        exceed = np.zeros(nelements, dtype=int)
+        undecided = ~np.isnan(observed)
+
+        done = 0
+        ndrawn = 0
+        while done < permutations and undecided.any():
+            batch = seeds[done:done + self.step]
+            done += len(batch)
+            if self.featurewise and not undecided.all():
+                data = wdata[:, undecided]
+            else:
+                data = wdata
+            res = self._compute_permutations(measure, data, vdata,
+                                             batch, nproc)
+            if not len(res):
+                continue
+            res = np.asarray(res).reshape((len(res), -1))
+            if res.shape[1] != undecided.sum():
+                # measure computed for all elements
+                res = res[:, undecided]
+            # all undecided elements got the same number of samples,
+            # NaN stands for 'not drawn'
+            block = np.empty((len(res), nelements))
+            block.fill(np.nan)
+            block[:, undecided] = res
+            blocks.append(block)
+            ndrawn += len(res)
+            nsamples[undecided] = ndrawn
+            exceed[undecided] += self._count_exceeding(res,
+                                                       observed[undecided])
+            decided = self._is_decided(exceed[undecided], ndrawn)
+            undecided[np.where(undecided)[0][decided]] = False
+            if __debug__:
+                debug('STATMC', "Done %i permutations, %i of %i elements "
+                      "still undecided" % (done, undecided.sum(), nelements))
+
+        if len(blocks):
+            dist_samples = np.concatenate(blocks)
+        else:
+            dist_samples = np.empty((0, nelements))
+        del blocks
+        self.ca.dist_samples = dist_samples.reshape((ndrawn,) + shape)
+        self.ca.nsamples = nsamples.reshape(shape)
+        # elements with NaN observed values were never sampled
+        self._dist = FeaturewiseNonparametric(dist_samples,
+                                              nsamples=np.maximum(nsamples, 1))
+
+
+
+class MCMaxStatNullDist(MCNullDist):
+    """Monte-Carlo permutation testing of the maximum statistic.
+
+    Instead of storing all samples of every element for all permutations,
+    only the maximum (or the minimum for `tail='left'`) across all
+    elements of each permutation is kept.  The distribution of this
+    maximum statistic provides p-values corrected for the family-wise
+    error (FWE) across all elements, and thresholds which control it.
+
+    Permutations are processed in blocks of `step`, so memory demand is
+    O(step * elements + permutations) instead of
+    O(permutations * elements).  Optionally, uncorrected p-values of the
+    observed values are estimated from running counts of exceedances
+    (enable conditional attribute `uncorrected_p`).
+    """
+
+    max_samples = ConditionalAttribute(enabled=True,
+        doc='Maximum (minimum for the left tail) across all elements for '
+            'each permutation')
+    uncorrected_p = ConditionalAttribute(enabled=False,
+        doc='Uncorrected p-values of the observed values of each element. '
+            'Requires computing the measure on the original data')
+
+    def __init__(self, step=100, tail='right', **kwargs):
+        """
+        Parameters
+        ----------
+        step : int
+          Number of permutations to process at once.
+        tail : {'left', 'right'}
+          Which tail of the distribution to report.
+        """
+        if not tail in ('left', 'right'):
+            raise ValueError, "%s supports only 'left' or 'right' tails, " \
+                  "got %r" % (self.__class__.__name__, tail)
+        MCNullDist.__init__(self, dist_class=Nonparametric, tail=tail,
+                            **kwargs)
+        self.step = step
+
+
+    def __repr__(self, prefixes=[]):
+        prefixes_ = []
+        if self.step != 100:
+            prefixes_.append('step=%r' % self.step)
+        return super(MCMaxStatNullDist, self).__repr__(
+            prefixes=prefixes_ + prefixes)
+
+
+    def fit(self, measure, wdata, vdata=None):
+        """Fit the distribution of the maximum statistic.
+
+        See `MCNullDist.fit()` for the description of the parameters.
+        """
+        right = self.tail == 'right'
+        if not right and self.tail != 'left':
+            raise ValueError, "%s supports only 'left' or 'right' tails" \
+                  % self.__class__.__name__
+
+        observed = None
+        if self.ca.is_enabled('uncorrected_p'):
+            if not vdata is None:
+                observed = measure(vdata, wdata)
+            else:
+                observed = measure(wdata)
+            observed = np.asanyarray(observed)
+            shape = observed.shape
+            observed = observed.reshape((-1,))
+            exceed = np.zeros(observed.shape, dtype=int)
+
+        permutations = self.permutations
+        nproc = self._get_nproc()
+        seeds = self._get_seeds(permutations, nproc)
+
+        max_samples = []
+        for start in xrange(0, permutations, self.step):
+            res = self._compute_permutations(
+                measure, wdata, vdata, seeds[start:start + self.step], nproc)
+            if not len(res):
+                continue
+            res = np.asarray(res).reshape((len(res), -1))
+            if right:
+                max_samples.append(np.nanmax(res, axis=1))
+            else:
+                max_samples.append(np.nanmin(res, axis=1))
+            if not observed is None:
+                if right:
+                    exceed += np.sum(res >= observed, axis=0)
+                else:
+                    exceed += np.sum(res <= observed, axis=0)
+            if __debug__:
+                debug('STATMC', "Done %i permutations"
+                      % min(start + self.step, permutations))
+
+        self.ca.max_samples = max_samples = np.concatenate(max_samples)
+        if not observed is None:
+            self.ca.uncorrected_p = \
+                ((exceed + 1.0) / (len(max_samples) + 1.0)).reshape(shape)
+        self._dist = Nonparametric(max_samples)
+
+
+    def cdf(self, x):
+        """Return value of the cdf of the maximum statistic at `x`.
+        """
+        if self._dist is None:
+            raise RuntimeError, "Distribution has to be fit first"
+        return self._dist.cdf(x)
+
+
+    def p(self, x, return_tails=False):
+        """Returns FWE-corrected p-values for values of `x`.
+
+        P-value of a value is the fraction of permutations (the observed
+        one included) in which the maximum (minimum for the left tail)
+        statistic reaches the value.
+        """
+        if self._dist is None:
+            raise RuntimeError, "Distribution has to be fit first"
+        is_scalar = np.isscalar(x)
+        x = np.asanyarray(x, dtype=float)
+        # sorted already
+        max_samples = self._dist._dist_samples
+        n = len(max_samples)
+        # number of permutations at least as extreme (ties included)
+        if self.tail == 'right':
+            nexceed = n - np.searchsorted(max_samples, x, side='left')
+        else:
+            nexceed = np.searchsorted(max_samples, x, side='right')
+        res = (nexceed + 1.0) / (n + 1.0)
+        # nothing is as extreme as NaN
+        res = np.where(np.isnan(x), 1.0, res)
+        if is_scalar:
+            res = res.item()
+        if return_tails:
+            return res, np.zeros(np.shape(res), dtype=bool) \
+                   + (self.tail == 'right')
+        return res
+
+
+    def threshold(self, alpha=0.05):
+        """Value exceeding which is significant at FWE-corrected `alpha`
+
+        Values beyond the threshold (larger for the right tail, smaller
+        for the left one) get `p()` not exceeding `alpha`.  If `alpha` is
+        too small for the number of permutations, no value is significant
+        and an infinite threshold is returned.
+        """
+        if self._dist is None:
+            raise RuntimeError, "Distribution has to be fit first"
+        max_samples = self._dist._dist_samples
+        n = len(max_samples)
+        # permutations at least as extreme allowed for p <= alpha
+        k = int(np.floor(alpha * (n + 1))) - 1
+        if self.tail == 'right':
+            if k < 0:
+                return np.inf
+            if k >= n:
+                return -np.inf
+            return max_samples[n - k - 1]
+        else:
+            if k < 0:
+                return -np.inf
+            if k >= n:
+                return np.inf
+            return max_samples[k]
+
+
+
+class MCClusterNullDist(MCNullDist):
+    """Monte-Carlo permutation testing of cluster-level statistics.
+
+    Elements (features) of a map exceeding the cluster-forming `threshold`
+    get grouped into connected clusters, given the adjacency of features
+    (see :mod:`mvpa.misc.cluster`).  For each permutation only the maximal
+    cluster statistic (size or mass) is kept.  P-values of the clusters of
+    an observed map are then corrected for the family-wise error across
+    all clusters.
+
+    `p()` returns the p-value of the cluster each element belongs to, and
+    1 for the elements outside of any cluster.
+    """
+
+    max_samples = ConditionalAttribute(enabled=True,
+        doc='Maximal cluster statistic for each permutation')
+
+    def __init__(self, threshold, neighborhood, stat='size', step=100,
+                 tail='right', **kwargs):
+        """
+        Parameters
+        ----------
+        threshold : float
+          Cluster-forming threshold.  Elements with values larger
+          (smaller for the left tail) than it are clustered.
+        neighborhood : QueryEngine or sparse matrix or tuple
+          Defines adjacency of the features (see
+          `mvpa.misc.cluster.get_adjacency()`).  A query engine (e.g.
+          `IndexQueryEngine(voxel_indices=Sphere(1))`) gets trained on
+          the dataset passed to `fit()`.
+        stat : {'size', 'mass'}
+          Cluster statistic: number of elements in a cluster or the sum
+          of the values of its elements (of negated values for the left
+          tail).
+        step : int
+          Number of permutations to process at once.
+        tail : {'left', 'right'}
+          Which tail of the distribution to report.
+        """
+        if not tail in ('left', 'right'):
+            raise ValueError, "%s supports only 'left' or 'right' tails, " \
+                  "got %r" % (self.__class__.__name__, tail)
+        if not stat in ('size', 'mass'):
+            raise ValueError, "Unknown cluster statistic %r" % (stat,)
+        MCNullDist.__init__(self, dist_class=Nonparametric, tail=tail,
+                            **kwargs)
+        self.threshold = threshold
+        self.neighborhood = neighborhood
+        self.stat = stat
+        self.step = step
+        self._adjacency = None
+        self._sorted_max_samples = None
+
+
+    def __repr__(self, prefixes=[]):
+        prefixes_ = ['threshold=%r' % self.threshold,
+                     'neighborhood=%r' % self.neighborhood]
+        if self.stat != 'size':
+            prefixes_.append('stat=%r' % self.stat)
+        if self.step != 100:
+            prefixes_.append('step=%r' % self.step)
+        return super(MCClusterNullDist, self).__repr__(
+            prefixes=prefixes_ + prefixes)
+
+
+    def clusters(self, x):
+        """Clusters of a map and their statistics
+
+        Parameters
+        ----------
+        x : ndarray
+          Map with a value per each feature.
+
+        Returns
+        -------
+        (labels, stats) : tuple
+          Cluster labels of all features (-1 outside of clusters) and
+          the statistic of every cluster.
+        """
+        from mvpa.misc.cluster import label_clusters, get_cluster_stats
+        if self._adjacency is None:
+            raise RuntimeError, "Distribution has to be fit first"
+        x = np.asanyarray(x).ravel()
+        if self.tail == 'left':
+            x = -x
+            mask = x > -self.threshold
+        else:
+            mask = x > self.threshold
+        labels, nclusters = label_clusters(mask, self._adjacency)
+        sizes, masses = get_cluster_stats(x, labels, nclusters)
+        if self.stat == 'size':
+            return labels, sizes
+        return labels, masses
+
+
+    def fit(self, measure, wdata, vdata=None):
+        """Fit the distribution of the maximal cluster statistic.
+
+        See `MCNullDist.fit()` for the description of the parameters.
+        """
+        from mvpa.misc.cluster import get_adjacency
+        self._adjacency = get_adjacency(self.neighborhood, wdata)
+
+        permutations = self.permutations
+        nproc = self._get_nproc()
+        seeds = self._get_seeds(permutations, nproc)
+
+        max_samples = []
+        for start in xrange(0, permutations, self.step):
+            res = self._compute_permutations(
+                measure, wdata, vdata, seeds[start:start + self.step], nproc)
+            for r in res:
+                stats = self.clusters(r)[1]
+                max_samples.append(len(stats) and stats.max() or 0)
+            if __debug__:
+                debug('STATMC', "Done %i permutations"
+                      % min(start + self.step, permutations))
+
+        self.ca.max_samples = max_samples = np.asarray(max_samples)
+        self._dist = Nonparametric(max_samples)
+        self._sorted_max_samples = np.sort(max_samples)
+
+
+    def cdf(self, x):
+        """Return value of the cdf of the maximal cluster statistic at `x`.
+        """
+        if self._dist is None:
+            raise RuntimeError, "Distribution has to be fit first"
+        return self._dist.cdf(x)
+
+
+    def p(self, x, return_tails=False):
+        """Returns FWE-corrected p-values of the clusters in `x`.
+
+        Every element gets the p-value of the cluster it belongs to, and
+        1 if it is not part of any cluster.  P-value of a cluster is the
+        fraction of permutations (the observed one included) in which the
+        maximal cluster statistic reaches the statistic of the cluster.
+        """
+        if self._dist is None:
+            raise RuntimeError, "Distribution has to be fit first"
+        x = np.asanyarray(x)
+        labels, stats = self.clusters(x)
+        # permutation p-values: cluster statistic has to be reached
+        # (ties included) by the maximal one of a permutation
+        max_samples = self._sorted_max_samples
+        nexceed = len(max_samples) \
+                  - np.searchsorted(max_samples, stats, side='left')
+        cluster_p = (nexceed + 1.0) / (len(max_samples) + 1.0)
+        res = np.ones(labels.shape)
+        inside = labels >= 0
+        res[inside] = cluster_p[labels[inside]]
+        res = res.reshape(x.shape)
+        if return_tails:
+            return res, np.zeros(x.shape, dtype=bool) + (self.tail == 'right')
+        return res
+
+
 
 class FixedNullDist(NullDist):
     """Proxy/Adaptor class for SciPy distributions.
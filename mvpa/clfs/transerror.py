@@ -1268,6 +1268,23 @@ class ClassifierError(ClassWithCollections):
         self.__train = train
         """Either to train classifier if trainingdata is provided"""
 
+        self.only_targets_changed = False
+        """Either the datasets of the call differ from the ones of the
+        previous call only in the targets of the training dataset.  If so,
+        a retrainable classifier gets retrained and repredicted without
+        recomputing anything which depends on the samples only (e.g.
+        kernels)"""
+        self._retrained = False
+        """Either the classifier was retrained in the current call"""
+
+
+    def _use_retrain(self, trainingdataset):
+        """Either to use the cheap retrain/repredict path of the classifier
+        """
+        clf = self.__clf
+        return self.only_targets_changed and trainingdataset is not None \
+               and clf.params.retrainable and clf.trained
+
 
     __doc__ = enhanced_doc_string('ClassifierError', locals(), ClassWithCollections)
 
@@ -1282,6 +1299,7 @@ class ClassifierError(ClassWithCollections):
     def _precall(self, testdataset, trainingdataset=None):
         """Generic part which trains the classifier if necessary
         """
+        self._retrained = False
         if not trainingdataset is None:
             if self.__train:
                 # XXX can be pretty annoying if triggered inside an algorithm
@@ -1298,7 +1316,11 @@ class ClassifierError(ClassWithCollections):
                 if self.ca.is_enabled('training_confusion'):
                     self.__clf.ca.change_temporarily(
                         enable_ca=['training_confusion'])
-                self.__clf.train(trainingdataset)
+                self._retrained = self._use_retrain(trainingdataset)
+                if self._retrained:
+                    self.__clf.retrain(trainingdataset, targets=True)
+                else:
+                    self.__clf.train(trainingdataset)
                 if self.ca.is_enabled('training_confusion'):
                     self.ca.training_confusion = \
                         self.__clf.ca.training_confusion
@@ -1348,7 +1370,7 @@ class ClassifierError(ClassWithCollections):
         error = self._call(testdataset, trainingdataset)
         self._postcall(testdataset, trainingdataset, error)
         if __debug__:
-            debug('CERR', 'Classifier error on %s: %.2f'
+            debug('CERR', 'Classifier error on %s: %s'
                   % (testdataset, error))
         return error
 
@@ -1464,7 +1486,10 @@ class TransferError(ClassifierError):
             raise ValueError, "Transfer error call obtained None " \
                   "as a dataset for testing.%s" % msg
         #clf should handle dataset or samples
-        predictions = clf.predict(testdataset)
+        if self._retrained:
+            predictions = clf.repredict(testdataset)
+        else:
+            predictions = clf.predict(testdataset)
         # compute confusion matrix
         # Should it migrate into ClassifierError.__postcall?
         # -> Probably not because other childs could estimate it
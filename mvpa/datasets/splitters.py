@@ -442,6 +442,8 @@ class Splitter(object):
     splitattr = property(fget=lambda self:self.__splitattr)
     permute_attr = property(fget=lambda self:self.__permute_attr)
     npertarget = property(fget=lambda self:self.__npertarget)
+    nrunspersplit = property(fget=lambda self:self.__runspersplit)
+    reverse = property(fget=lambda self:self._reverse)
 
 
 
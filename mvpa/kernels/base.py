@@ -20,8 +20,12 @@ Concerns:
 
 __docformat__ = 'restructuredtext'
 
+import os
+import hashlib
+
 import numpy as np
 
+from mvpa.base import externals
 from mvpa.base.types import is_datasetlike
 from mvpa.misc.state import ClassWithCollections
 from mvpa.misc.param import Parameter
@@ -31,7 +35,7 @@ if __debug__:
     from mvpa.base import debug
 
 __all__ = ['Kernel', 'NumpyKernel', 'CustomKernel', 'PrecomputedKernel',
-           'CachedKernel']
+           'CachedKernel', 'LowRankKernel', 'NystroemKernel']
 
 class Kernel(ClassWithCollections):
     """Abstract class which calculates a kernel function between datasets
@@ -133,6 +137,36 @@ class Kernel(ClassWithCollections):
         self.compute(*args, **kwargs)
         return self
 
+    def diag(self, ds):
+        """Diagonal of the kernel matrix of `ds` with itself
+
+        The computed kernel matrix is not altered, and the full matrix of
+        `ds` is never built.
+        """
+        if is_datasetlike(ds):
+            ds = ds.samples
+        return self._diag(ds)
+
+    def _diag(self, data):
+        """Generic implementation computing the kernel for blocks of samples
+
+        Kernels which diagonal has a closed form should override it.
+        """
+        k = self._k
+        bs = self._diag_block_size
+        try:
+            diag = [np.diag(self.computed(data[i:i + bs]).as_raw_np())
+                    for i in xrange(0, len(data), bs)]
+        finally:
+            self._k = k
+        return np.hstack(diag)
+
+    _diag_block_size = 256
+    """Number of samples in a block for the generic `_diag()`"""
+
+    low_rank = False
+    """Either the kernel provides an explicit low-rank feature map"""
+
     ############################################################################
     # The following methods are circularly defined.  Child kernel types can
     # override either one or both to allow conversion to Numpy
@@ -206,6 +240,48 @@ class NumpyKernel(Kernel):
         return self._k
     # wasn't that easy?
 
+    def compute_blockwise(self, ds1, ds2=None, block_size=1024, out=None):
+        """Compute the kernel in tiles of samples
+
+        Temporaries allocated by the kernel function are bounded by the
+        size of a `block_size` x `block_size` tile instead of the full
+        matrix.  If `ds2` is None, only the upper triangular tiles are
+        computed and mirrored.
+
+        Parameters
+        ----------
+        block_size : int
+          Number of samples of each dataset in a tile.
+        out : ndarray, optional
+          Array to store the kernel matrix in (e.g. `numpy.memmap`).
+        """
+        if is_datasetlike(ds1):
+            ds1 = ds1.samples
+        symmetric = ds2 is None
+        if symmetric:
+            ds2 = ds1
+        elif is_datasetlike(ds2):
+            ds2 = ds2.samples
+        n1, n2 = len(ds1), len(ds2)
+        if out is None:
+            out = np.empty((n1, n2))
+        for i in xrange(0, n1, block_size):
+            block1 = ds1[i:i + block_size]
+            for j in xrange(symmetric and i or 0, n2, block_size):
+                if symmetric and i == j:
+                    block2 = block1
+                else:
+                    block2 = ds2[j:j + block_size]
+                if __debug__:
+                    debug('KRN', "Computing tile %d:%d, %d:%d of %s"
+                          % (i, i + len(block1), j, j + len(block2), self))
+                self._compute(block1, block2)
+                tile = self.as_raw_np()
+                out[i:i + len(block1), j:j + len(block2)] = tile
+                if symmetric and i != j:
+                    out[j:j + len(block2), i:i + len(block1)] = tile.T
+        self._k = out
+
 
 class CustomKernel(NumpyKernel):
     """Custom Kernel defined by an arbitrary function
@@ -264,6 +340,165 @@ class PrecomputedKernel(NumpyKernel):
     def compute(self, *args, **kwargs):
         pass
 
+    def _diag(self, data):
+        raise NotImplementedError, \
+              "Diagonal of a precomputed kernel for new data is not known"
+
+
+class LowRankKernel(NumpyKernel):
+    """Kernel approximated by an explicit low-rank feature map
+
+    The kernel between two samples is the dot product of their features
+    ``K(a, b) = features(a) features(b).T``, where the number of features
+    `m` is usually much smaller than the number of samples `n`.  Kernel
+    methods aware of it (e.g. `GPR`, `CachedKernel`) work on the `n x m`
+    features, instead of the full `n x n` kernel matrix.
+
+    The feature map might depend on the data (e.g. landmarks of
+    `NystroemKernel`).  It is then initialized from the first data the
+    kernel is computed on, unless `fit()` was called explicitly.
+    """
+
+    low_rank = True
+
+    def fit(self, ds):
+        """(Re)initialize the feature map for the data in `ds`
+        """
+        if is_datasetlike(ds):
+            ds = ds.samples
+        self._fit(ds)
+
+    def _fit(self, data):
+        """Specific implementation to be overridden
+        """
+        raise NotImplementedError, "Abstract method"
+
+    def _is_fit(self):
+        """Either the feature map was initialized already
+        """
+        raise NotImplementedError, "Abstract method"
+
+    def features(self, ds):
+        """Features of the samples in `ds` (`n x m` array)
+        """
+        if is_datasetlike(ds):
+            ds = ds.samples
+        if not self._is_fit():
+            self._fit(ds)
+        return self._features(ds)
+
+    def _features(self, data):
+        """Specific implementation to be overridden
+        """
+        raise NotImplementedError, "Abstract method"
+
+    def _compute(self, d1, d2):
+        if not self._is_fit():
+            self._fit(d1)
+        f1 = self._features(d1)
+        if d2 is d1:
+            f2 = f1
+        else:
+            f2 = self._features(d2)
+        self._k = np.dot(f1, f2.T)
+
+    def _diag(self, data):
+        f = self.features(data)
+        return (f * f).sum(axis=1)
+
+
+class NystroemKernel(LowRankKernel):
+    """Nystroem approximation of an arbitrary kernel
+
+    The kernel is approximated from its values between the samples and a
+    set of `nlandmarks` landmark samples:
+    ``K ~= K_nm inv(K_mm) K_nm.T`` (Williams & Seeger, 2001).  Landmarks
+    are either randomly selected samples, or centroids of k-means
+    clustering of the samples.
+    """
+
+    nlandmarks = Parameter(100, allowedtype='int', min=1,
+        doc="""Number of landmark samples, which is the maximal rank of the
+        approximation.  Limited by the number of samples the landmarks are
+        selected from""")
+
+    landmarks_selection = Parameter('random',
+        allowedtype="'random' or 'kmeans'",
+        doc="""How to select the landmarks: random subset of the samples, or
+        centroids of k-means clustering (requires scipy)""")
+
+    def __init__(self, kernel=None, *args, **kwargs):
+        """Initialize `NystroemKernel`
+
+        Parameters
+        ----------
+        kernel : Kernel
+          Kernel to approximate.  Any kernel which can be converted to a
+          `NumpyKernel` is allowed
+        """
+        super(NystroemKernel, self).__init__(*args, **kwargs)
+        self._kernel = kernel
+        self.landmarks = None
+        """Landmark samples"""
+        self.__map = None
+        self.__map_key = None
+
+    def __repr__(self, prefixes=[]):
+        return super(NystroemKernel, self).__repr__(
+            ['kernel=%r' % self._kernel] + prefixes)
+
+    def _fit(self, data):
+        params = self.params
+        nlandmarks = min(params.nlandmarks, len(data))
+        if params.landmarks_selection == 'random':
+            ids = np.random.permutation(len(data))[:nlandmarks]
+            landmarks = data[np.sort(ids)]
+        elif params.landmarks_selection == 'kmeans':
+            externals.exists('scipy', raise_=True)
+            from scipy.cluster.vq import kmeans2
+            landmarks, _ = kmeans2(np.asanyarray(data, dtype=float),
+                                   nlandmarks, minit='points')
+        else:
+            raise ValueError, "Unknown landmarks selection '%s'" \
+                  % params.landmarks_selection
+        if __debug__:
+            debug('KRN', "Selected %d landmarks for %s"
+                  % (len(landmarks), self))
+        self.landmarks = landmarks
+        self.__map = self.__map_key = None
+
+    def _is_fit(self):
+        return self.landmarks is not None
+
+    def _get_map(self):
+        """Projection of the kernel to the landmarks onto the features
+
+        Kernel between landmarks is cheap to compute, and its
+        decomposition is redone only if it changed (e.g. due to changed
+        kernel parameters).
+        """
+        kernel = self._kernel
+        kernel.compute(self.landmarks)
+        kmm = kernel.as_raw_np()
+        kernel.cleanup()
+        if self.__map is None or not np.array_equal(kmm, self.__map_key):
+            evals, evecs = np.linalg.eigh(kmm)
+            # drop (numerically) zero eigenvalues -- rank of the
+            # approximation might be lower than number of landmarks
+            tol = max(evals.max(), 0) * len(evals) * np.finfo(float).eps
+            nonzero = evals > tol
+            self.__map = evecs[:, nonzero] / np.sqrt(evals[nonzero])
+            self.__map_key = kmm
+        return self.__map
+
+    def _features(self, data):
+        pmap = self._get_map()
+        kernel = self._kernel
+        kernel.compute(data, self.landmarks)
+        knm = kernel.as_raw_np()
+        kernel.cleanup()
+        return np.dot(knm, pmap)
+
 
 class CachedKernel(NumpyKernel):
     """Kernel which caches all data to avoid duplicate computation
@@ -283,17 +518,33 @@ class CachedKernel(NumpyKernel):
 
     The cache is asymmetric for lhs and rhs, so compute(d1, d2) does not create
     a cache usable for compute(d2, d1).
-    """
 
-    # TODO: Figure out how to design objects like CrossValidation etc to
-    # precompute this kernel automatically, making it transparent to the user
+    Algorithms which train a classifier repeatedly on subsets of the same
+    dataset (e.g. `CrossValidatedTransferError` or `SplitClassifier`)
+    precompute the cache on the whole dataset automatically (see
+    `precache_kernel`), so it is transparent to the user.
+
+    If the base kernel is a `LowRankKernel`, only its features are cached
+    (`n x m` instead of `n x n` matrix).  Kernel matrices of the requested
+    samples are formed from the cached features only when accessed (e.g.
+    via `as_raw_np()`), while low-rank aware methods (e.g. `GPR`) use
+    `features()` directly.
+
+    Otherwise the full kernel matrix might be computed in tiles (see
+    `NumpyKernel.compute_blockwise`) and stored in a memory-mapped file
+    within `cache_dir`.  Such files are named by a fingerprint of the
+    data and of the kernel, so they are reused by any other process or
+    session computing the same kernel on the same data.  Files are never
+    removed automatically.
+    """
 
     @property
     def __kernel_name__(self):
         """Allows checking name of subkernel"""
         return self._kernel.__kernel_name__
 
-    def __init__(self, kernel=None, *args, **kwargs):
+    def __init__(self, kernel=None, block_size=None, cache_dir=None,
+                 *args, **kwargs):
         """Initialize `CachedKernel`
 
         Parameters
@@ -301,13 +552,68 @@ class CachedKernel(NumpyKernel):
         kernel : Kernel
           Base kernel to cache.  Any kernel which can be converted to a
           `NumpyKernel` is allowed
+        block_size : None or int
+          If not None, a `NumpyKernel` is computed in tiles of `block_size`
+          samples to bound the memory needed for temporaries.
+        cache_dir : None or str
+          If not None, the kernel matrix is stored in (or loaded from) a
+          memory-mapped file within this directory.
         """
         super(CachedKernel, self).__init__(*args, **kwargs)
         self._kernel = kernel
+        self._block_size = block_size
+        self._cache_dir = cache_dir
         self.params.update(self._kernel.params)
         self._rhsids = self._lhsids = self._kfull = None
+        self._lhsfeatures = self._rhsfeatures = None
+        self._kfeatures = None
         self._recomputed = None
 
+    @property
+    def low_rank(self):
+        """Either the base kernel provides a low-rank feature map"""
+        return self._kernel.low_rank
+
+    def features(self, ds):
+        """Features of the samples in `ds` for a low-rank base kernel
+
+        Cached features are used whenever `ds` is a subset of the
+        dataset the kernel was cached for.
+        """
+        if not self.low_rank:
+            raise ValueError, "Base kernel of %s is not low-rank" % self
+        if self._lhsfeatures is not None and is_datasetlike(ds) \
+           and not len(self.params.which_set()):
+            try:
+                return self._lhsfeatures[self._lhsids(ds, allow_slice=True)]
+            except KeyError:
+                pass
+        return self._kernel.features(ds)
+
+    def __array__(self):
+        return self.as_raw_np()
+
+    def as_raw_np(self):
+        """Directly return this kernel as a numpy array.
+
+        For a low-rank base kernel it is formed from the features of the
+        samples on first access.
+        """
+        if self._k is None and self._kfeatures is not None:
+            f1, f2 = self._kfeatures
+            self._k = np.dot(f1, f2.T)
+        return self._k
+
+    def cleanup(self):
+        """Wipe out the kernel matrix of the last computation, but not the
+        cache itself
+        """
+        super(CachedKernel, self).cleanup()
+        self._kfeatures = None
+
+    def _diag(self, data):
+        return self._kernel.diag(data)
+
     def _cache(self, ds1, ds2=None):
         """Initializes internal lookups + _kfull via caching the kernel matrix
         """
@@ -322,15 +628,101 @@ class CachedKernel(NumpyKernel):
             self._rhsids = SamplesLookup(ds2)
 
         ckernel = self._kernel
-        ckernel.compute(ds1, ds2)
-        self._kfull = ckernel.as_raw_np()
-        ckernel.cleanup()
-        self._k = self._kfull
+        if ckernel.low_rank:
+            self._kfull = None
+            self._lhsfeatures = ckernel.features(ds1)
+            if self._rhsids is self._lhsids:
+                self._rhsfeatures = self._lhsfeatures
+            else:
+                self._rhsfeatures = ckernel.features(ds2)
+            # kernel matrix gets formed only if accessed
+            self._kfeatures = (self._lhsfeatures, self._rhsfeatures)
+            self._k = None
+        else:
+            self._lhsfeatures = self._rhsfeatures = None
+            self._kfeatures = None
+            if self._rhsids is self._lhsids:
+                ds2 = None
+            if self._cache_dir is None:
+                self._kfull = self._compute_full(ds1, ds2)
+            else:
+                self._kfull = self._load_full(ds1, ds2)
+            self._k = self._kfull
 
         self._recomputed = True
         self.params.reset()
         # TODO: store params representation for later comparison
 
+    def _compute_full(self, ds1, ds2, out=None):
+        """Full kernel matrix of the base kernel
+        """
+        ckernel = self._kernel
+        if self._block_size is not None and isinstance(ckernel, NumpyKernel):
+            ckernel.compute_blockwise(ds1, ds2, block_size=self._block_size,
+                                      out=out)
+        else:
+            ckernel.compute(ds1, ds2)
+        kfull = ckernel.as_raw_np()
+        ckernel.cleanup()
+        if out is not None and kfull is not out:
+            out[:] = kfull
+            kfull = out
+        return kfull
+
+    def _load_full(self, ds1, ds2):
+        """Full kernel matrix memory-mapped from the file in `cache_dir`
+
+        The file gets created if it does not exist yet.
+        """
+        filename = os.path.join(self._cache_dir, 'kernel_%s.npy'
+                                % self._get_fingerprint(ds1, ds2))
+        if not os.path.exists(filename):
+            if __debug__:
+                debug('KRN', "Storing kernel matrix of %s in %s"
+                      % (self, filename))
+            shape = (len(ds1), len(ds1 if ds2 is None else ds2))
+            # other processes might be computing it as well, so the file
+            # appears only once it is complete
+            tmpname = '%s.%d.tmp' % (filename, os.getpid())
+            out = np.lib.format.open_memmap(tmpname, mode='w+',
+                                            dtype=float, shape=shape)
+            try:
+                self._compute_full(ds1, ds2, out=out)
+                out.flush()
+                del out
+                os.rename(tmpname, filename)
+            finally:
+                if os.path.exists(tmpname):
+                    os.remove(tmpname)
+        elif __debug__:
+            debug('KRN', "Loading kernel matrix of %s from %s"
+                  % (self, filename))
+        return np.load(filename, mmap_mode='r')
+
+    def _get_fingerprint(self, ds1, ds2):
+        """Hash of the data and of the base kernel
+        """
+        ckernel = self._kernel
+        d1 = ds1.samples
+        if ds2 is None:
+            d2 = d1
+        else:
+            d2 = ds2.samples
+        fingerprint = hashlib.sha1(ckernel.__class__.__name__)
+        for name, param in sorted(ckernel.params.items()):
+            fingerprint.update('%s=%r' % (name, param.value))
+        for d in (d1, d2):
+            d = np.ascontiguousarray(d)
+            fingerprint.update('%s%s' % (d.shape, d.dtype.str))
+            fingerprint.update(buffer(d))
+        # not every kernel keeps its hyperparameters among params, but
+        # they are reflected in the kernel values
+        ckernel.compute(d1[:16], d2[:16])
+        fingerprint.update(np.ascontiguousarray(ckernel.as_raw_np(),
+                                                dtype=float))
+        ckernel.cleanup()
+        return fingerprint.hexdigest()
+
     def compute(self, ds1, ds2=None, force=False):
         """Automatically computes and caches the kernel or extracts the
         relevant part of a precached kernel into self._k
@@ -363,12 +755,22 @@ class CachedKernel(NumpyKernel):
         else:
             # figure d1, d2
             try:
-                lhsids = self._lhsids(ds1) #
+                lhsids = self._lhsids(ds1, allow_slice=True)
                 if ds2 is None:
                     rhsids = lhsids
                 else:
-                    rhsids = self._rhsids(ds2)
-                self._k = self._kfull[np.ix_(lhsids, rhsids)]
+                    rhsids = self._rhsids(ds2, allow_slice=True)
+                if self._lhsfeatures is not None:
+                    self._kfeatures = (self._lhsfeatures[lhsids],
+                                       self._rhsfeatures[rhsids])
+                    self._k = None
+                elif isinstance(lhsids, slice) and isinstance(rhsids, slice):
+                    # contiguous block -- just copy it out
+                    self._k = np.array(self._kfull[lhsids, rhsids])
+                elif isinstance(lhsids, slice) or isinstance(rhsids, slice):
+                    self._k = self._kfull[lhsids, rhsids]
+                else:
+                    self._k = self._kfull[np.ix_(lhsids, rhsids)]
             except KeyError:
                 self._cache(ds1, ds2)
 
@@ -378,6 +780,42 @@ class CachedKernel(NumpyKernel):
                   % dict(inst=self, ds1=ds1, ds2=ds2))
 
 
+
+def precache_kernel(clf, dataset):
+    """Precompute the kernel of a classifier on a whole dataset
+
+    If `clf` is a kernel-based classifier with a `CachedKernel` as its
+    `kernel` parameter, the kernel gets computed (if it was not yet cached
+    for this `dataset`) on the full `dataset`, so that subsequent training
+    and testing on any subset of it (e.g. cross-validation folds) just
+    slices the cached matrix.  Nothing is done for any other classifier,
+    including meta-classifiers, since they might alter the data before it
+    reaches the kernel.
+
+    Parameters
+    ----------
+    clf : Classifier
+    dataset : Dataset
+      Superset of all the datasets `clf` is going to be trained/tested on.
+
+    Returns
+    -------
+    bool
+      Either the kernel of `clf` is cached for `dataset`.
+    """
+    if not 'kernel-based' in clf.__tags__ \
+       or not 'kernel' in clf.params:
+        return False
+    kernel = clf.params.kernel
+    if not isinstance(kernel, CachedKernel):
+        return False
+    if __debug__:
+        debug('KRN', "Precaching %(kernel)s of %(clf)s on %(ds)s"
+              % dict(kernel=kernel, clf=clf, ds=dataset))
+    kernel.compute(dataset)
+    return True
+
+
 __BOGUS_NOTES__ = """
 if ds1 is the "derived" dataset as it was computed on:
     * ds2 is None
@@ -21,16 +21,87 @@ classifier gets trained on some new data of different dimensionality
 __docformat__ = 'restructuredtext'
 
 
+import hashlib
+
 import numpy as np
 
 from mvpa.misc.state import ConditionalAttribute
 from mvpa.misc.param import Parameter
 from mvpa.misc.exceptions import InvalidHyperparameterError
 from mvpa.clfs.distance import squared_euclidean_distance
-from mvpa.kernels.base import NumpyKernel
+from mvpa.kernels.base import NumpyKernel, LowRankKernel
 if __debug__:
     from mvpa.base import debug, warning
 
+def _get_data_key(data):
+    """Key identifying the content of an array"""
+    data = np.ascontiguousarray(data)
+    return (data.shape, data.dtype.str,
+            hashlib.sha1(buffer(data)).hexdigest())
+
+
+class DistanceKernel(NumpyKernel):
+    """Base class for kernels which are functions of squared distances.
+
+    Optionally, unweighted squared euclidean distances between the last
+    pair of inputs are cached, so a change of the hyperparameters (e.g. a
+    single length scale during model selection) only rescales the cached
+    matrix instead of recomputing the distances from the data.
+    """
+
+    def __init__(self, cache_sqdist=False, *args, **kwargs):
+        """
+        Parameters
+        ----------
+        cache_sqdist : bool, optional
+          Either to keep the squared distances between the last pair of
+          inputs to be reused while computing the kernel for other values
+          of the hyperparameters.  It requires memory for an additional
+          matrix of the size of the kernel until `cleanup()`.
+        """
+        NumpyKernel.__init__(self, *args, **kwargs)
+        self.__cache_sqdist = cache_sqdist
+        self.__sqdist = None
+        self.__sqdist_key = None
+
+
+    def _get_sqdist(self, data1, data2, weight=None):
+        """Squared euclidean distances, optionally weighted.
+
+        Parameters
+        ----------
+        weight : None or float or ndarray
+          Scalar weight or weight for each feature.  Distances are only
+          cached (if enabled) for scalar weights.
+        """
+        if not self.__cache_sqdist \
+               or (weight is not None and np.asanyarray(weight).size > 1):
+            # no caching or per feature weights (e.g. ARD) -- nothing to
+            # reuse
+            return squared_euclidean_distance(data1, data2, weight=weight)
+        key = (_get_data_key(data1), _get_data_key(data2))
+        if key != self.__sqdist_key:
+            if __debug__:
+                debug("KRN", "Computing squared distances for %s and %s "
+                      "data" % (data1.shape, data2.shape))
+            self.__sqdist = squared_euclidean_distance(data1, data2)
+            self.__sqdist_key = key
+        if weight is None:
+            return self.__sqdist
+        return self.__sqdist * float(np.asanyarray(weight).ravel()[0])
+
+
+    cache_sqdist = property(fget=lambda self: self.__cache_sqdist)
+
+
+    def cleanup(self):
+        """Wipe out internal representation and cached distances
+        """
+        NumpyKernel.cleanup(self)
+        self.__sqdist = None
+        self.__sqdist_key = None
+
+
 # Simple stuff
 
 class LinearKernel(NumpyKernel):
@@ -38,6 +109,9 @@ class LinearKernel(NumpyKernel):
     def _compute(self, d1, d2):
         self._k = np.dot(d1, d2.T)
 
+    def _diag(self, data):
+        return (data * data).sum(axis=1)
+
 
 class PolyKernel(NumpyKernel):
     """Polynomial kernel: K(a,b) = (gamma*a*b.T+coef0)**degree"""
@@ -49,8 +123,12 @@ class PolyKernel(NumpyKernel):
         self._k = np.power(self.params.gamma*np.dot(d1, d2.T)+self.params.coef0,
                           self.params.degree)
 
+    def _diag(self, data):
+        return np.power(self.params.gamma * (data * data).sum(axis=1)
+                        + self.params.coef0, self.params.degree)
+
 
-class RbfKernel(NumpyKernel):
+class RbfKernel(DistanceKernel):
     """Radial basis function (aka Gausian, aka ) kernel
     K(a,b) = exp(-||a-b||**2/sigma)
     """
@@ -58,7 +136,10 @@ class RbfKernel(NumpyKernel):
     
     def _compute(self, d1, d2):
         # Do the Rbf
-        self._k = np.exp(-squared_euclidean_distance(d1,d2) / self.params.sigma)
+        self._k = np.exp(-self._get_sqdist(d1, d2) / self.params.sigma)
+
+    def _diag(self, data):
+        return np.ones(len(data))
         
 # More complex
 class ConstantKernel(NumpyKernel):
@@ -85,6 +166,9 @@ class ConstantKernel(NumpyKernel):
         self._k = \
             (self.params.sigma_0 ** 2) * np.ones((data1.shape[0], data2.shape[0]))
 
+    def _diag(self, data):
+        return (self.params.sigma_0 ** 2) * np.ones(len(data))
+
     ## def set_hyperparameters(self, hyperparameter):
     ##     if hyperparameter < 0:
     ##         raise InvalidHyperparameterError()
@@ -233,10 +317,18 @@ class GeneralizedLinearKernel(NumpyKernel):
                 self.ca.gradientslog = dict(
                     sigma_0=2*sigma_0**2,
                     Sigma_p=gl_Sigma_p)
+
+    def _diag(self, data):
+        Sigma_p = self.params.Sigma_p
+        if np.isscalar(Sigma_p) or len(Sigma_p.shape) == 1:
+            diag = (data * data * Sigma_p).sum(axis=1)
+        else:
+            diag = (np.dot(data, Sigma_p) * data).sum(axis=1)
+        return diag + self.params.sigma_0 ** 2
     pass
 
 
-class ExponentialKernel(NumpyKernel):
+class ExponentialKernel(DistanceKernel):
     """The Exponential kernel class.
 
     Note that it can handle a length scale for each dimension for
@@ -253,7 +345,7 @@ class ExponentialKernel(NumpyKernel):
 
     def __init__(self, *args, **kwargs):
         # for docstring holder
-        NumpyKernel.__init__(self, *args, **kwargs)
+        DistanceKernel.__init__(self, *args, **kwargs)
 
     ## def __init__(self, length_scale=1.0, sigma_f = 1.0, **kwargs):
     ##     """Initialize an Exponential kernel instance.
@@ -294,11 +386,14 @@ class ExponentialKernel(NumpyKernel):
         # efficient since length_scale is squared and then
         # square-rooted uselessly.
         # Weighted euclidean distance matrix:
-        self.wdm = np.sqrt(squared_euclidean_distance(
+        self.wdm = np.sqrt(self._get_sqdist(
             data1, data2, weight=(params.length_scale**-2)))
         self._k = \
             params.sigma_f**2 * np.exp(-self.wdm)
 
+    def _diag(self, data):
+        return self.params.sigma_f**2 * np.ones(len(data))
+
     def gradient(self, data1, data2):
         """Compute gradient of the kernel matrix. A must for fast
         model selection with high-dimensional data.
@@ -375,7 +470,7 @@ class ExponentialKernel(NumpyKernel):
     pass
 
 
-class SquaredExponentialKernel(NumpyKernel):
+class SquaredExponentialKernel(DistanceKernel):
     """The Squared Exponential kernel class.
 
     Note that it can handle a length scale for each dimension for
@@ -396,7 +491,7 @@ class SquaredExponentialKernel(NumpyKernel):
           (Defaults to 1.0)
         """
         # init base class first
-        NumpyKernel.__init__(self, **kwargs)
+        DistanceKernel.__init__(self, **kwargs)
 
         self.length_scale = length_scale
         self.sigma_f = sigma_f
@@ -423,13 +518,17 @@ class SquaredExponentialKernel(NumpyKernel):
           (Defaults to None)
         """
         # weighted squared euclidean distance matrix:
-        self.wdm2 = squared_euclidean_distance(data1, data2, weight=(self.length_scale**-2))
+        self.wdm2 = self._get_sqdist(data1, data2,
+                                     weight=(self.length_scale**-2))
         self._k = self.sigma_f**2 * np.exp(-0.5*self.wdm2)
         # XXX EO: old implementation:
         # self.kernel_matrix = \
         #     self.sigma_f * np.exp(-squared_euclidean_distance(
         #         data1, data2, weight=0.5 / (self.length_scale ** 2)))
 
+    def _diag(self, data):
+        return self.sigma_f**2 * np.ones(len(data))
+
     def set_hyperparameters(self, hyperparameter):
         """Set hyperaparmeters from a vector.
 
@@ -503,7 +602,7 @@ class SquaredExponentialKernel(NumpyKernel):
                             fset=_setlength_scale)
     pass
 
-class Matern_3_2Kernel(NumpyKernel):
+class Matern_3_2Kernel(DistanceKernel):
     """The Matern kernel class for the case ni=3/2 or ni=5/2.
 
     Note that it can handle a length scale for each dimension for
@@ -528,7 +627,7 @@ class Matern_3_2Kernel(NumpyKernel):
           (Defaults to 3.0)
         """
         # init base class first
-        NumpyKernel.__init__(self, **kwargs)
+        DistanceKernel.__init__(self, **kwargs)
 
         self.length_scale = length_scale
         self.sigma_f = sigma_f
@@ -551,7 +650,7 @@ class Matern_3_2Kernel(NumpyKernel):
         data2 : numpy.ndarray
           rhs data
         """
-        tmp = squared_euclidean_distance(
+        tmp = self._get_sqdist(
                 data1, data2, weight=0.5 / (self.length_scale ** 2))
         if self.numerator == 3.0:
             tmp = np.sqrt(tmp)
@@ -564,6 +663,9 @@ class Matern_3_2Kernel(NumpyKernel):
                 self.sigma_f**2 * (1.0 + np.sqrt(5.0) * tmp2 + 5.0 / 3.0 * tmp) \
                 * np.exp(-np.sqrt(5.0) * tmp2)
 
+    def _diag(self, data):
+        return self.sigma_f**2 * np.ones(len(data))
+
 
     def gradient(self, data1, data2):
         """Compute gradient of the kernel matrix. A must for fast
@@ -608,7 +710,7 @@ class Matern_5_2Kernel(Matern_3_2Kernel):
         pass
 
 
-class RationalQuadraticKernel(NumpyKernel):
+class RationalQuadraticKernel(DistanceKernel):
     """The Rational Quadratic (RQ) kernel class.
 
     Note that it can handle a length scale for each dimension for
@@ -632,7 +734,7 @@ class RationalQuadraticKernel(NumpyKernel):
           (Defaults to 2.0)
         """
         # init base class first
-        NumpyKernel.__init__(self, **kwargs)
+        DistanceKernel.__init__(self, **kwargs)
 
         self.length_scale = length_scale
         self.sigma_f = sigma_f
@@ -652,11 +754,14 @@ class RationalQuadraticKernel(NumpyKernel):
         data2 : numpy.ndarray
           rhs data
         """
-        tmp = squared_euclidean_distance(
+        tmp = self._get_sqdist(
                 data1, data2, weight=1.0 / (self.length_scale ** 2))
         self._k = \
             self.sigma_f**2 * (1.0 + tmp / (2.0 * self.alpha)) ** -self.alpha
 
+    def _diag(self, data):
+        return self.sigma_f**2 * np.ones(len(data))
+
     def gradient(self, data1, data2):
         """Compute gradient of the kernel matrix. A must for fast
         model selection with high-dimensional data.
@@ -681,6 +786,59 @@ class RationalQuadraticKernel(NumpyKernel):
     pass
 
 
+class RandomFourierKernel(LowRankKernel):
+    """Random Fourier features approximation of Squared Exponential kernel
+
+    Squared Exponential kernel
+    K(a,b) = sigma_f**2 * exp(-0.5 * ||(a-b)/length_scale||**2)
+    is approximated by the features ``sigma_f * [cos(a W), sin(a W)] /
+    sqrt(nfrequencies)`` with frequencies W drawn from its spectral
+    density (Rahimi & Recht, 2007).  Equivalently it approximates
+    `RbfKernel` with ``length_scale = sqrt(sigma / 2)``.
+
+    Frequencies are drawn only once for the dimensionality of the data
+    (see `fit()`), and are rescaled upon changes of the length scale.
+    """
+
+    length_scale = Parameter(1.0, allowedtype='float or ndarray', doc="""
+        The characteristic length-scale (or length-scales) of the phenomenon
+        under investigation.""")
+
+    sigma_f = Parameter(1.0, allowedtype='float',
+        doc="""Signal standard deviation.""")
+
+    nfrequencies = Parameter(100, allowedtype='int', min=1,
+        doc="""Number of random frequencies.  There are two features
+        (cosine and sine) per each frequency""")
+
+    def __init__(self, *args, **kwargs):
+        # for docstring holder
+        LowRankKernel.__init__(self, *args, **kwargs)
+        self.frequencies = None
+        """Frequencies for the unit length scale"""
+
+    def _fit(self, data):
+        self.frequencies = np.random.normal(
+            size=(data.shape[1], self.params.nfrequencies))
+
+    def _is_fit(self):
+        return self.frequencies is not None
+
+    def _features(self, data):
+        params = self.params
+        if data.shape[1] != len(self.frequencies):
+            raise ValueError, \
+                  "%s was fit for data with %d features, got %d" \
+                  % (self, len(self.frequencies), data.shape[1])
+        length_scale = np.asanyarray(params.length_scale, dtype=float)
+        if length_scale.ndim:
+            # ARD
+            length_scale = length_scale[:, np.newaxis]
+        proj = np.dot(data, self.frequencies / length_scale)
+        return np.hstack((np.cos(proj), np.sin(proj))) \
+               * (params.sigma_f / np.sqrt(proj.shape[1]))
+
+
 # dictionary of avalable kernels with names as keys:
 kernel_dictionary = {'constant': ConstantKernel,
                      'linear': LinearKernel, #GeneralizedLinearKernel,
@@ -691,5 +849,6 @@ kernel_dictionary = {'constant': ConstantKernel,
                      'squared exponential': SquaredExponentialKernel,
                      'Matern ni=3/2': Matern_3_2Kernel,
                      'Matern ni=5/2': Matern_5_2Kernel,
-                     'rational quadratic': RationalQuadraticKernel}
+                     'rational quadratic': RationalQuadraticKernel,
+                     'random fourier': RandomFourierKernel}
 
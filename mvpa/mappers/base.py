@@ -47,6 +47,8 @@ class Mapper(object):
         self._sa_filter = None
         self._fa_filter = None
         self._a_filter = None
+        # optional on-disk memoization of the training
+        self._cache = None
 
 
     #
@@ -190,7 +192,11 @@ class Mapper(object):
         # this mimics Classifier.train() -- we might merge them all at some
         # point
         self._pretrain(dataset)
-        result = self._train(dataset)
+        cache = getattr(self, '_cache', None)
+        if cache is None:
+            result = self._train(dataset)
+        else:
+            result = cache.train(self, dataset)
         self._posttrain(dataset)
         return result
 
@@ -292,6 +298,18 @@ class Mapper(object):
         self.__inspace = name
 
 
+    def _set_cache(self, cache):
+        self._cache = cache
+
+    cache = property(fget=lambda self: getattr(self, '_cache', None),
+                     fset=_set_cache,
+                     doc="""`ResultsCache` to memoize training of the mapper.
+
+        If set, the trained state of the mapper is stored on disk and
+        restored whenever the same mapper is trained on the same data
+        again. See :class:`~mvpa.misc.cache.ResultsCache`.""")
+
+
 
 class FeatureSliceMapper(Mapper):
     """Mapper to select a subset of features.
@@ -71,7 +71,7 @@ class DatasetMeasure(ClassWithCollections):
     """Stores the t-score corresponding to null_prob under assumption
     of Normal distribution"""
 
-    def __init__(self, postproc=None, null_dist=None, **kwargs):
+    def __init__(self, postproc=None, null_dist=None, cache=None, **kwargs):
         """Does nothing special.
 
         Parameters
@@ -83,6 +83,10 @@ class DatasetMeasure(ClassWithCollections):
         null_dist : instance of distribution estimator
           The estimated distribution is used to assign a probability for a
           certain value of the computed measure.
+        cache : ResultsCache instance, optional
+          If provided, the (raw) results of the measure are memoized on disk
+          and retrieved whenever the same measure is computed on the same
+          dataset again.  See :class:`~mvpa.misc.cache.ResultsCache`.
         """
         ClassWithCollections.__init__(self, **kwargs)
 
@@ -94,6 +98,7 @@ class DatasetMeasure(ClassWithCollections):
             debug('SA', 'Assigning null_dist %s whenever original given was %s'
                   % (null_dist_, null_dist))
         self.__null_dist = null_dist_
+        self.__cache = cache
 
 
     __doc__ = enhanced_doc_string('DatasetMeasure', locals(),
@@ -109,7 +114,10 @@ class DatasetMeasure(ClassWithCollections):
         Returns the computed measure in some iterable (list-like)
         container applying a post-processing mapper if such is defined.
         """
-        result = self._call(dataset)
+        if self.__cache is None:
+            result = self._call(dataset)
+        else:
+            result = self.__cache.call(self, self._call, dataset)
         result = self._postcall(dataset, result)
 
         # XXX Remove when "sensitivity-return-dataset" transition is done
@@ -155,6 +163,8 @@ class DatasetMeasure(ClassWithCollections):
             # infinite looping.
             measure = copy.copy(self)
             measure.__null_dist = None
+            # and there is no point to cache results on permuted data
+            measure.__cache = None
             self.__null_dist.fit(measure, dataset)
 
             if self.ca.is_enabled('null_t'):
@@ -209,6 +219,8 @@ class DatasetMeasure(ClassWithCollections):
             prefixes.append("postproc=%s" % self.__postproc)
         if self.__null_dist is not None:
             prefixes.append("null_dist=%s" % self.__null_dist)
+        if self.__cache is not None:
+            prefixes.append("cache=%r" % self.__cache)
         return super(DatasetMeasure, self).__repr__(prefixes=prefixes)
 
     def untrain(self):
@@ -229,6 +241,11 @@ class DatasetMeasure(ClassWithCollections):
         """Return mapper"""
         return self.__postproc
 
+    @property
+    def cache(self):
+        """Return cache of results"""
+        return self.__cache
+
 
 class FeaturewiseDatasetMeasure(DatasetMeasure):
     """A per-feature-measure computed from a `Dataset` (base class).
@@ -0,0 +1,338 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the PyMVPA package for the
+#   copyright and license terms.
+#
+### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""On-disk memoization of expensive computations on datasets.
+
+A `ResultsCache` stores results of `DatasetMeasure` calls and trained states
+of `Mapper` instances in HDF5 files (see :mod:`mvpa.base.hdf5`).  Entries are
+keyed by a fingerprint of the input dataset (samples, samples and feature
+attributes) and a fingerprint of the object's configuration (its class,
+parameters collection and remaining instance state, with functions
+identified by their code), so rerunning the same pipeline with the same data
+retrieves results instead of recomputing them.  Computations involving
+objects without a representation which is stable across sessions are not
+cached.
+
+Caching is opt-in: assign an instance of `ResultsCache` to the `cache`
+argument of a `DatasetMeasure` or to the `cache` property of a `Mapper`.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import os
+import types
+import hashlib
+
+import numpy as np
+
+from mvpa.base import externals, warning
+from mvpa.base.types import is_datasetlike
+
+if __debug__:
+    from mvpa.base import debug
+
+__all__ = ['ResultsCache']
+
+
+class ResultsCache(object):
+    """Size-bounded on-disk cache of results, keyed by content hashes.
+
+    Each entry is stored in a separate HDF5 file within the cache
+    directory.  Whenever the total size of the cache exceeds `max_size`,
+    least recently used entries are removed.
+
+    Notes
+    -----
+    Only the return value of the cached computation is stored.
+    Conditional attributes that get charged during a computation
+    (e.g. `confusion` of a `CrossValidatedTransferError`) are not
+    available if the result was retrieved from the cache.
+    """
+
+    _ignore_attribs = ['_collections', '_known_attribs']
+    """Instance attributes which do not define a computation"""
+
+    def __init__(self, path, max_size=None):
+        """
+        Parameters
+        ----------
+        path : str
+          Directory to store cached results in.  It gets created if it
+          does not exist.
+        max_size : None or int, optional
+          Maximal size of the cache (in bytes).  If None, the size of the
+          cache is not limited.
+        """
+        externals.exists('h5py', raise_=True)
+        self._path = path
+        self._max_size = max_size
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.hits = 0
+        """Number of successful lookups"""
+        self.misses = 0
+        """Number of lookups of not (yet) cached results"""
+
+
+    def __repr__(self):
+        return "%s(%r, max_size=%r)" \
+               % (self.__class__.__name__, self._path, self._max_size)
+
+
+    def _update_digest(self, digest, obj, memo):
+        """Feed a (stable across sessions) representation of `obj`
+
+        Raises `ValueError` if there is none.
+        """
+        if isinstance(obj, (types.NoneType, bool, int, long, float, complex,
+                            basestring)):
+            digest.update(repr(obj))
+        elif isinstance(obj, np.ndarray):
+            digest.update('%s%s' % (obj.dtype.str, obj.shape))
+            if obj.dtype == np.object:
+                for o in obj.flat:
+                    self._update_digest(digest, o, memo)
+            else:
+                digest.update(np.ascontiguousarray(obj).data)
+        elif isinstance(obj, (np.generic)):
+            digest.update('%s%r' % (obj.dtype.str, obj))
+        elif isinstance(obj, (list, tuple)):
+            digest.update('%s%i' % (obj.__class__.__name__, len(obj)))
+            for o in obj:
+                self._update_digest(digest, o, memo)
+        elif isinstance(obj, (type, types.ClassType, np.ufunc)):
+            digest.update('%s.%s' % (getattr(obj, '__module__', None),
+                                     obj.__name__))
+        elif isinstance(obj, types.BuiltinFunctionType):
+            digest.update('%s.%s' % (obj.__module__, obj.__name__))
+            # bound builtin methods
+            if not isinstance(obj.__self__, (types.NoneType, types.ModuleType)):
+                self._update_digest(digest, obj.__self__, memo)
+        elif isinstance(obj, types.FunctionType):
+            # names are not unique (e.g. lambdas), so the code itself
+            # defines the function
+            digest.update('%s.%s' % (obj.__module__, obj.__name__))
+            self._update_digest(digest, obj.func_code, memo)
+            self._update_digest(digest, obj.func_defaults, memo)
+            if obj.func_closure is not None:
+                self._update_digest(
+                    digest, [c.cell_contents for c in obj.func_closure], memo)
+        elif isinstance(obj, types.CodeType):
+            digest.update(obj.co_code)
+            self._update_digest(digest, obj.co_consts, memo)
+            self._update_digest(digest, obj.co_names, memo)
+        elif isinstance(obj, types.MethodType):
+            self._update_digest(digest, obj.im_func, memo)
+            self._update_digest(digest, obj.im_self, memo)
+        elif isinstance(obj, ResultsCache):
+            # the cache itself has no say on the results
+            pass
+        elif id(obj) in memo:
+            # already seen -- avoid infinite recursion
+            digest.update('memo%i' % memo[id(obj)])
+        else:
+            memo[id(obj)] = len(memo)
+            digest.update('%s.%s' % (obj.__class__.__module__,
+                                     obj.__class__.__name__))
+            if is_datasetlike(obj):
+                self._update_digest(digest, obj.samples, memo)
+                for col in (obj.sa, obj.fa):
+                    for k in sorted(col.keys()):
+                        digest.update(k)
+                        self._update_digest(digest, col[k].value, memo)
+            elif isinstance(obj, dict):
+                for k in sorted(obj.keys()):
+                    self._update_digest(digest, k, memo)
+                    self._update_digest(digest, obj[k], memo)
+            elif hasattr(obj, '__dict__'):
+                state = obj.__dict__
+                collections = state.get('_collections', {})
+                # collections (e.g. params) first
+                for k in sorted(collections.keys()):
+                    # conditional attributes are the outcome of
+                    # computations, not their definition
+                    if k == 'ca':
+                        continue
+                    col = collections[k]
+                    digest.update(k)
+                    for p in sorted(col.keys()):
+                        digest.update(p)
+                        self._update_digest(digest, col[p].value, memo)
+                # most of the classes keep (some of) their configuration
+                # outside of collections
+                for k in sorted(state.keys()):
+                    if k in self._ignore_attribs or k in collections:
+                        continue
+                    digest.update(k)
+                    self._update_digest(digest, state[k], memo)
+            else:
+                raise ValueError, \
+                      "No stable representation of %r to compute a key" % obj
+
+
+    def get_key(self, obj, data, tag=''):
+        """Compute a key for the computation of `obj` on `data`.
+
+        Parameters
+        ----------
+        obj : object
+          Instance which performs the computation.
+        data : Dataset or array
+          Input of the computation.
+        tag : str, optional
+          Identifier of the type of the computation (e.g. 'train').
+
+        Raises `ValueError` if `obj` or `data` contain anything (e.g.
+        an object without instance dictionary) which cannot be
+        represented the same way across sessions.
+        """
+        digest = hashlib.sha1(tag)
+        self._update_digest(digest, obj, {})
+        # separate fingerprint for the data, so that identical data
+        # gets the same part of the key whatever the object is
+        ddigest = hashlib.sha1()
+        self._update_digest(ddigest, data, {})
+        return '%s_%s_%s' % (obj.__class__.__name__, digest.hexdigest(),
+                             ddigest.hexdigest())
+
+
+    def _get_filename(self, key):
+        return os.path.join(self._path, key + '.hdf5')
+
+
+    def __contains__(self, key):
+        return os.path.exists(self._get_filename(key))
+
+
+    def get(self, key):
+        """Retrieve a cached value.
+
+        Raises `KeyError` if there is no entry for the `key`.
+        """
+        from mvpa.base.hdf5 import h5load
+        filename = self._get_filename(key)
+        if not os.path.exists(filename):
+            self.misses += 1
+            raise KeyError, "No cached value for %s" % key
+        value = h5load(filename)
+        # mark as recently used
+        os.utime(filename, None)
+        self.hits += 1
+        if __debug__:
+            debug('CACHE', "Retrieved %(key)s from %(cache)s",
+                  msgargs=dict(key=key, cache=self))
+        return value
+
+
+    def store(self, key, value):
+        """Store a `value` under the `key`."""
+        from mvpa.base.hdf5 import h5save
+        filename = self._get_filename(key)
+        try:
+            h5save(filename, value)
+        except Exception, e:
+            # leave nothing half-written behind
+            if os.path.exists(filename):
+                os.remove(filename)
+            warning("Could not store %s in %s: %s" % (key, self, e))
+            return
+        if __debug__:
+            debug('CACHE', "Stored %(key)s in %(cache)s",
+                  msgargs=dict(key=key, cache=self))
+        self._evict(keep=filename)
+
+
+    def _evict(self, keep=None):
+        """Remove least recently used entries to fit into `max_size`"""
+        if self._max_size is None:
+            return
+        entries = []
+        for f in os.listdir(self._path):
+            if not f.endswith('.hdf5'):
+                continue
+            filename = os.path.join(self._path, f)
+            st = os.stat(filename)
+            entries.append((st.st_mtime, st.st_size, filename))
+        total = sum([e[1] for e in entries])
+        # oldest first
+        for mtime, size, filename in sorted(entries):
+            if total <= self._max_size:
+                break
+            if filename == keep:
+                continue
+            if __debug__:
+                debug('CACHE', "Evicting %s" % filename)
+            os.remove(filename)
+            total -= size
+
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        for f in os.listdir(self._path):
+            if f.endswith('.hdf5'):
+                os.remove(os.path.join(self._path, f))
+
+
+    def _get_key_or_warn(self, obj, data, tag):
+        """Key for `get_key()` or None if there is no stable one"""
+        try:
+            return self.get_key(obj, data, tag)
+        except ValueError, e:
+            warning("Not caching computation of %s: %s" % (obj, e))
+            return None
+
+
+    def call(self, obj, method, data, tag='call'):
+        """Memoized invocation of `method(data)` computed by `obj`.
+
+        `method(data)` is simply called if there is no stable key for
+        the computation (see `get_key()`).
+        """
+        key = self._get_key_or_warn(obj, data, tag)
+        if key is None:
+            return method(data)
+        try:
+            return self.get(key)
+        except KeyError:
+            pass
+        result = method(data)
+        self.store(key, result)
+        return result
+
+
+    def train(self, obj, data):
+        """Memoized training of `obj` (e.g. a `Mapper`) on `data`.
+
+        On a cache hit, the trained state of `obj` is restored from the
+        cache instead of calling its `_train()`.  `obj` is simply trained
+        if there is no stable key for the computation (see `get_key()`).
+        """
+        key = self._get_key_or_warn(obj, data, 'train')
+        if key is None:
+            return obj._train(data)
+        try:
+            result, state = self.get(key)
+            obj.__dict__.update(state)
+            return result
+        except KeyError:
+            pass
+        result = obj._train(data)
+        state = dict([(k, v) for k, v in obj.__dict__.iteritems()
+                      if not isinstance(v, ResultsCache)])
+        self.store(key, (result, state))
+        return result
+
+
+    @property
+    def size(self):
+        """Total size (in bytes) of the cached entries"""
+        return sum([os.path.getsize(os.path.join(self._path, f))
+                    for f in os.listdir(self._path) if f.endswith('.hdf5')])
+
+    path = property(fget=lambda self: self._path)
+    max_size = property(fget=lambda self: self._max_size)
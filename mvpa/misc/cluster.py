@@ -0,0 +1,140 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the PyMVPA package for the
+#   copyright and license terms.
+#
+### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Labeling of connected clusters of features.
+
+Adjacency of features is represented in compressed sparse row (CSR) form,
+i.e. as a tuple `(indptr, indices)`, where the neighbors of feature `i` are
+`indices[indptr[i]:indptr[i+1]]`.  It can be derived from a query engine
+(e.g. an `IndexQueryEngine` with a `Sphere`) trained on a dataset, or from
+a `scipy.sparse` matrix.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import numpy as np
+
+from mvpa.misc.neighborhood import QueryEngineInterface
+
+__all__ = ['get_adjacency', 'label_clusters', 'get_cluster_stats']
+
+
+def get_adjacency(neighborhood, dataset=None):
+    """Adjacency of features in CSR form.
+
+    Parameters
+    ----------
+    neighborhood : QueryEngine or sparse matrix or tuple
+      If a query engine, it gets trained on `dataset` (if provided) and
+      queried for the neighbors of every feature.  A (square) sparse
+      matrix with non-zero elements for adjacent features, or an
+      `(indptr, indices)` tuple are taken as is.
+    dataset : Dataset, optional
+      Dataset defining the features.  Required if `neighborhood` is a
+      query engine.
+
+    Returns
+    -------
+    (indptr, indices) : tuple of ndarrays
+    """
+    if isinstance(neighborhood, tuple):
+        indptr, indices = neighborhood
+        return np.asarray(indptr, dtype=int), np.asarray(indices, dtype=int)
+    if hasattr(neighborhood, 'tocsr'):
+        # scipy.sparse matrix
+        csr = neighborhood.tocsr()
+        return csr.indptr.astype(int), csr.indices.astype(int)
+    if isinstance(neighborhood, QueryEngineInterface):
+        if dataset is None:
+            raise ValueError, "Dataset is required to query the adjacency " \
+                  "of features from %s" % neighborhood
+        neighborhood.train(dataset)
+        neighbors = [np.asarray(neighborhood[fid], dtype=int)
+                     for fid in xrange(dataset.nfeatures)]
+        indptr = np.cumsum([0] + [len(n) for n in neighbors])
+        if len(neighbors):
+            indices = np.concatenate(neighbors)
+        else:
+            indices = np.array([], dtype=int)
+        return indptr, indices
+    raise ValueError, "Do not know how to derive adjacency from %r" \
+          % (neighborhood,)
+
+
+def label_clusters(mask, adjacency):
+    """Label connected clusters of features within a mask.
+
+    Connected components are determined by a vectorized union-find:
+    trees get hooked onto the smaller root along all edges at once and
+    then get compressed by pointer jumping, until no edge connects two
+    different trees.
+
+    Parameters
+    ----------
+    mask : ndarray of bool
+      Which features to cluster.
+    adjacency : tuple
+      `(indptr, indices)` as returned by `get_adjacency()`.
+
+    Returns
+    -------
+    (labels, nclusters) : tuple
+      Cluster labels (0 to nclusters-1) for all features, -1 for the
+      features outside of the mask.
+    """
+    mask = np.asanyarray(mask, dtype=bool).ravel()
+    indptr, indices = adjacency
+    nfeatures = len(mask)
+    if len(indptr) != nfeatures + 1:
+        raise ValueError, "Adjacency describes %i features, while mask " \
+              "has %i" % (len(indptr) - 1, nfeatures)
+
+    # edges between features within the mask
+    src = np.repeat(np.arange(nfeatures), np.diff(indptr))
+    dst = indices
+    inmask = mask[src] & mask[dst]
+    src, dst = src[inmask], dst[inmask]
+
+    parent = np.arange(nfeatures)
+    while True:
+        psrc, pdst = parent[src], parent[dst]
+        differ = psrc != pdst
+        if not differ.any():
+            break
+        # hook the larger root onto the smaller one
+        lo = np.minimum(psrc[differ], pdst[differ])
+        hi = np.maximum(psrc[differ], pdst[differ])
+        np.minimum.at(parent, hi, lo)
+        # compress paths
+        while True:
+            grandparent = parent[parent]
+            if (grandparent == parent).all():
+                break
+            parent = grandparent
+
+    labels = -np.ones(nfeatures, dtype=int)
+    roots, labels[mask] = np.unique(parent[mask], return_inverse=True)
+    return labels, len(roots)
+
+
+def get_cluster_stats(values, labels, nclusters):
+    """Size and mass (sum of `values`) of each cluster.
+
+    Returns
+    -------
+    (sizes, masses) : tuple of ndarrays
+    """
+    values = np.asanyarray(values).ravel()
+    labels = np.asanyarray(labels).ravel()
+    if not nclusters:
+        return np.zeros(0, dtype=int), np.zeros(0)
+    inside = labels >= 0
+    sizes = np.bincount(labels[inside], minlength=nclusters)
+    masses = np.bincount(labels[inside], weights=values[inside],
+                         minlength=nclusters)
+    return sizes, masses
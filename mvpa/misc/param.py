@@ -101,7 +101,12 @@ class Parameter(IndexedCollectable):
 
     def __reduce__(self):
         icr = IndexedCollectable.__reduce__(self)
-        res = (self.__class__, (self.__default, self._ro) + icr[1], icr[2])
+        # additional attributes (e.g. min) have to be preserved as well
+        state = dict(icr[2])
+        state['_additional_props'] = self._additional_props[:]
+        for k in self._additional_props:
+            state[k] = getattr(self, k)
+        res = (self.__class__, (self.__default, self._ro) + icr[1], state)
         #if __debug__ and 'COL_RED' in debug.active:
         #    debug('COL_RED', 'Returning %s for %s' % (res, self))
         return res
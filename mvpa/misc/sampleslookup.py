@@ -52,19 +52,43 @@ class SamplesLookup(object):
                       "Generating dataset magic_id in SamplesLookup for %(ds)s",
                       msgargs=dict(ds=ds))
 
+        sample_ids = np.asanyarray(sample_ids)
         nsample_ids = len(sample_ids)
-        self._map = dict(zip(sample_ids,
-                             range(nsample_ids)))
-        if __debug__:
-            # some sanity checks
-            if len(self._map) != nsample_ids:
-                raise ValueError, \
-                    "Apparently samples' origids are not uniquely identifying" \
-                    " samples in %s.  You must change them so they are unique" \
-                    ". Use ds.init_origids('samples')" % ds
+        self._index = self._sorted_ids = self._map = None
+        kind = sample_ids.dtype.kind
+        if kind in 'iu' and nsample_ids \
+               and sample_ids.max() - sample_ids.min() == nsample_ids - 1:
+            # dense integer ids -- direct indexing
+            self._offset = sample_ids.min()
+            self._index = index = np.empty(nsample_ids, dtype=int)
+            index.fill(-1)
+            index[sample_ids - self._offset] = np.arange(nsample_ids)
+            unique = (index >= 0).all()
+        elif kind in 'iuf':
+            # sorted numeric ids to translate by bisection
+            self._sorter = np.argsort(sample_ids, kind='mergesort')
+            self._sorted_ids = sample_ids[self._sorter]
+            unique = (self._sorted_ids[1:] != self._sorted_ids[:-1]).all()
+        else:
+            # bisection of strings is slower than hashing them
+            self._map = dict(zip(sample_ids.tolist(), xrange(nsample_ids)))
+            unique = len(self._map) == nsample_ids
+        if not unique:
+            raise ValueError, \
+                "Apparently samples' origids are not uniquely identifying" \
+                " samples in %s.  You must change them so they are unique" \
+                ". Use ds.init_origids('samples')" % ds
 
-    def __call__(self, ds):
+    def __call__(self, ds, allow_slice=False):
         """
+        Parameters
+        ----------
+        ds : Dataset
+          Dataset which samples to look up.
+        allow_slice : bool
+          If True, a slice is returned instead of indices whenever the
+          samples are contiguous in the mapped dataset.
+
         .. note:
            Will raise KeyError if lookup for sample_ids fails, or ds has not
            been mapped at all
@@ -73,10 +97,33 @@ class SamplesLookup(object):
             raise KeyError, \
                   'Dataset %s is not indexed by %s' % (ds, self)
 
-        _map = self._map
-        _origids = ds.sa.origids
+        _origids = np.asanyarray(ds.sa.origids)
+
+        if self._map is not None:
+            res = np.fromiter(map(self._map.__getitem__, _origids.tolist()),
+                              dtype=int, count=len(_origids))
+        elif self._index is not None:
+            if _origids.dtype.kind not in 'iu':
+                raise KeyError, "Non-integer origids in %s" % ds
+            res = _origids - self._offset
+            if len(res) and (res.min() < 0 or res.max() >= len(self._index)):
+                raise KeyError, "Unknown origids in %s" % ds
+            res = self._index[res]
+            if len(res) and res.min() < 0:
+                raise KeyError, "Unknown origids in %s" % ds
+        else:
+            sorted_ids = self._sorted_ids
+            pos = np.searchsorted(sorted_ids, _origids)
+            pos[pos == len(sorted_ids)] = 0
+            if len(pos) and not (sorted_ids[pos] == _origids).all():
+                raise KeyError, "Unknown origids in %s" % ds
+            res = self._sorter[pos]
+
+        if allow_slice and len(res) \
+               and res[-1] - res[0] == len(res) - 1 \
+               and (len(res) == 1 or (np.diff(res) == 1).all()):
+            res = slice(res[0], res[-1] + 1)
 
-        res = np.array([_map[i] for i in _origids])
         if __debug__:
             debug('SAL',
                   "Successful lookup: %(inst)s on %(ds)s having "
@@ -140,6 +140,8 @@ from mvpa.misc.io.base import *
 from mvpa.misc.io.meg import *
 if externals.exists('cPickle') and externals.exists('gzip'):
     from mvpa.misc.io.hamster import *
+if externals.exists('h5py'):
+    from mvpa.misc.cache import *
 from mvpa.misc.fsl import *
 from mvpa.misc.bv import *
 from mvpa.misc.bv.base import *
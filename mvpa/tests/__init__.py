@@ -108,6 +108,8 @@ def collect_nose_tests(verbosity=1):
         'test_neighborhood',
         'test_stats',
         'test_stats_sp',
+        'test_cache',
+        'test_cluster',
 
         # Mappers
         'test_mapper',
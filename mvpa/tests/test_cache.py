@@ -0,0 +1,140 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the PyMVPA package for the
+#   copyright and license terms.
+#
+### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+'''Tests for on-disk memoization of results'''
+
+import numpy as np
+
+from mvpa.testing import *
+from mvpa.testing.datasets import datasets
+
+skip_if_no_external('h5py')
+
+import os
+import shutil
+import tempfile
+
+from mvpa.misc.cache import ResultsCache
+from mvpa.measures.anova import OneWayAnova
+from mvpa.mappers.zscore import ZScoreMapper
+from mvpa.mappers.detrend import PolyDetrendMapper
+
+
+def test_measure_cache():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        cache = ResultsCache(tmpdir)
+        ds = datasets['uni2small']
+        ref = OneWayAnova()(ds)
+        res1 = OneWayAnova(cache=cache)(ds)
+        assert_equal((cache.hits, cache.misses), (0, 1))
+        # a new instance with the same configuration gets it from the cache
+        res2 = OneWayAnova(cache=cache)(ds)
+        assert_equal((cache.hits, cache.misses), (1, 1))
+        assert_array_equal(ref.samples, res1.samples)
+        assert_array_equal(ref.samples, res2.samples)
+
+        # different targets -- different fingerprint
+        ds2 = ds.copy()
+        ds2.sa.targets = ds2.sa.targets[::-1]
+        res3 = OneWayAnova(cache=cache)(ds2)
+        assert_equal((cache.hits, cache.misses), (1, 2))
+        assert_array_equal(OneWayAnova()(ds2).samples, res3.samples)
+
+        # different parameter -- different fingerprint
+        OneWayAnova(targets_attr='chunks', cache=cache)(ds)
+        assert_equal((cache.hits, cache.misses), (1, 3))
+        assert_equal(len(os.listdir(tmpdir)), 3)
+
+        cache.clear()
+        assert_equal(cache.size, 0)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_mapper_cache():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        cache = ResultsCache(tmpdir)
+        ds = datasets['uni2small'].copy()
+        for m in (ZScoreMapper, PolyDetrendMapper):
+            ref = m()
+            ref.train(ds)
+            for i in xrange(2):
+                mc = m()
+                mc.cache = cache
+                mc.train(ds)
+                assert_array_equal(ref.forward(ds.copy()).samples,
+                                   mc.forward(ds.copy()).samples)
+            # the cache itself was not stored
+            ok_(mc.cache is cache)
+        assert_equal((cache.hits, cache.misses), (2, 2))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_cache_eviction():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        cache = ResultsCache(tmpdir)
+        a = np.arange(1000)
+        cache.store('a', a)
+        size = cache.size
+        bounded = ResultsCache(tmpdir, max_size=int(2.5 * size))
+        bounded.store('b', a)
+        # ensure 'a' is the recently used one
+        os.utime(os.path.join(tmpdir, 'a.hdf5'), (0, 0))
+        os.utime(os.path.join(tmpdir, 'b.hdf5'), (1, 1))
+        assert_array_equal(bounded.get('a'), a)
+        bounded.store('c', a)
+        # 'b' got evicted as the least recently used one
+        ok_('a' in bounded)
+        ok_(not 'b' in bounded)
+        ok_('c' in bounded)
+        assert_raises(KeyError, bounded.get, 'b')
+        assert_equal((bounded.hits, bounded.misses), (1, 1))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_cache_key_callables():
+    from mvpa.clfs.smlr import SMLR
+    from mvpa.clfs.transerror import TransferError
+    from mvpa.algorithms.cvtranserror import CrossValidatedTransferError
+    from mvpa.datasets.splitters import NFoldSplitter
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        cache = ResultsCache(tmpdir)
+        ds = datasets['uni2small']
+        # lambdas differing only in their code
+        errorfxs = [lambda p, t: np.mean(np.asarray(p) != t),
+                    lambda p, t: 1 + np.mean(np.asarray(p) != t)]
+        res = [CrossValidatedTransferError(
+                   TransferError(SMLR(), errorfx=errorfx),
+                   NFoldSplitter(), cache=cache)(ds)
+               for errorfx in errorfxs]
+        assert_equal((cache.hits, cache.misses), (0, 2))
+        assert_array_almost_equal(res[1].samples, res[0].samples + 1)
+
+        # values of closures are part of the key
+        def get_fx(offset):
+            return lambda x: x + offset
+        keys = [cache.get_key(get_fx(o), ds) for o in (0, 0, 1)]
+        assert_equal(keys[0], keys[1])
+        ok_(keys[0] != keys[2])
+
+        # objects without stable representation are not cached
+        anova = OneWayAnova(cache=cache)
+        anova._unstable = object()
+        assert_raises(ValueError, cache.get_key, anova, ds)
+        nfiles = len(os.listdir(tmpdir))
+        assert_array_equal(anova(ds).samples, OneWayAnova()(ds).samples)
+        assert_equal(len(os.listdir(tmpdir)), nfiles)
+    finally:
+        shutil.rmtree(tmpdir)
@@ -27,10 +27,11 @@ from mvpa.misc.errorfx import MeanMismatchErrorFx
 
 from mvpa.clfs.base import DegenerateInputError, FailedToTrainError, \
      FailedToPredictError
-from mvpa.clfs.meta import CombinedClassifier, \
+from mvpa.clfs.meta import CombinedClassifier, MaximalVote, MaximalEstimate, \
      BinaryClassifier, MulticlassClassifier, \
      SplitClassifier, MappedClassifier, FeatureSelectionClassifier, \
      TreeClassifier, RegressionAsClassifier
+from mvpa.clfs.smlr import SMLR
 from mvpa.clfs.transerror import TransferError
 from mvpa.algorithms.cvtranserror import CrossValidatedTransferError
 from mvpa.mappers.flatten import mask_mapper
@@ -632,6 +633,97 @@ class ClassifiersTests(unittest.TestCase):
         # TODO: test combiners, e.g. MaximalVote and ca they store
 
 
+    def test_multiclass_classifier_types(self):
+        ds = datasets['uni4small']
+        clfs = [SMLR(lm=0.1)]
+        if externals.exists('libsvm'):
+            clfs.append(libsvm.SVM(C=1.))
+        nprocs = [1]
+        if externals.exists('pprocess'):
+            nprocs.append(2)
+        for clf in clfs:
+            for bclf_type, nclfs in (('1-vs-1', 6), ('1-vs-all', 4)):
+                results = []
+                for nproc in nprocs:
+                    mclf = MulticlassClassifier(clf=clf, bclf_type=bclf_type,
+                                                nproc=nproc,
+                                                enable_ca=['estimates'])
+                    mclf.train(ds)
+                    assert_equal(len(mclf.clfs), nclfs)
+                    ok_(np.all([c.trained for c in mclf.clfs]))
+                    predictions = mclf.predict(ds)
+                    # it should learn something
+                    ok_(np.mean(np.array(predictions) == ds.targets) > 0.8)
+                    # each binary classifier trains on its labels only
+                    bestimates = []
+                    for c in mclf.clfs:
+                        assert_equal(
+                            c.clf.ca.trained_nsamples,
+                            np.sum(np.in1d(ds.targets,
+                                           c.poslabels + c.neglabels)))
+                        c.clf.ca.enable('estimates')
+                        c.clf.predict(ds)
+                        bestimates.append(c.clf.ca.estimates)
+                    results.append((predictions, mclf.ca.estimates,
+                                    bestimates))
+                # binary classifiers trained in parallel are the same
+                for predictions, estimates, bestimates in results[1:]:
+                    assert_array_equal(predictions, results[0][0])
+                    assert_equal(estimates, results[0][1])
+                    for be, be0 in zip(bestimates, results[0][2]):
+                        assert_array_equal(be, be0)
+        self.failUnlessRaises(ValueError, MulticlassClassifier,
+                              clf=SMLR(), bclf_type='1-vs-some')
+
+
+    def test_multiclass_held_out(self):
+        ds = datasets['uni4large']
+        train, test = ds[ds.chunks % 2 == 0], ds[ds.chunks % 2 == 1]
+        clfs = [SMLR(lm=0.1)]
+        if externals.exists('libsvm'):
+            clfs.append(libsvm.SVM(C=1.))
+        for clf in clfs:
+            accuracies = {}
+            for bclf_type in ('1-vs-1', '1-vs-all'):
+                mclf = MulticlassClassifier(clf=clf, bclf_type=bclf_type,
+                                            enable_ca=['estimates'])
+                mclf.train(train)
+                predictions = np.asarray(mclf.predict(test))
+                accuracies[bclf_type] = np.mean(predictions == test.targets)
+                # ties (e.g. whenever binary classifiers disagree) must
+                # not be resolved in favor of the first label
+                first = ds.UT[0]
+                ok_(np.sum(predictions == first)
+                    - np.sum(test.targets == first) < 0.05 * len(test))
+            ok_(accuracies['1-vs-all'] > 0.8)
+            ok_(accuracies['1-vs-all'] >= accuracies['1-vs-1'] - 0.05)
+            # the most confident classifier wins
+            ok_(isinstance(mclf.combiner, MaximalEstimate))
+            for p, e in zip(predictions, mclf.ca.estimates):
+                assert_equal(p, max(e, key=e.get))
+
+
+    def test_maximal_vote(self):
+        # minimalistic classifiers with given predictions
+        class FixedCA(object):
+            def __init__(self, predictions):
+                self.predictions = predictions
+            def is_enabled(self, name):
+                return True
+        class Fixed(object):
+            def __init__(self, predictions):
+                self.ca = FixedCA(predictions)
+        mv = MaximalVote()
+        mv.ca.enable('estimates')
+        clfs = [Fixed(['a', 'b', 'c']),
+                Fixed(['a', ['a', 'c'], 'b']),
+                Fixed([['b', 'c'], 'c', 'b'])]
+        assert_equal(mv(clfs, None), ['a', 'c', 'b'])
+        assert_equal(mv.ca.estimates, [{'a': 2, 'b': 1, 'c': 1},
+                                       {'a': 1, 'b': 1, 'c': 2},
+                                       {'b': 2, 'c': 1}])
+
+
     # XXX meta should also work but TODO
     @sweepargs(clf=clfswh['svm', '!meta'])
     def test_svms(self, clf):
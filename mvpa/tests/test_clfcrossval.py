@@ -15,7 +15,8 @@ from mvpa.algorithms.cvtranserror import CrossValidatedTransferError
 from mvpa.clfs.transerror import TransferError
 
 from mvpa.testing import *
-from mvpa.testing.datasets import pure_multivariate_signal, get_mv_pattern
+from mvpa.testing.datasets import pure_multivariate_signal, get_mv_pattern, \
+     datasets
 from mvpa.testing.clfs import *
 
 class CrossValidationTests(unittest.TestCase):
@@ -89,13 +90,139 @@ class CrossValidationTests(unittest.TestCase):
         cv = CrossValidatedTransferError(
                 transerror,
                 NFoldSplitter(cvtype=1),
-                harvest_attribs=['transerror.clf.ca.training_time'])
+                harvest_attribs=['transerror.clf.ca.training_time',
+                                 'dataset.nsamples', 'result'])
         result = cv(data)
         ok_(cv.ca.harvested.has_key('transerror.clf.ca.training_time'))
         assert_equal(len(cv.ca.harvested['transerror.clf.ca.training_time']),
                      len(data.UC))
+        # variables of the call and of the splits are available
+        assert_equal(cv.ca.harvested['dataset.nsamples'],
+                     [data.nsamples] * len(data.UC))
+        assert_array_equal(np.ravel(cv.ca.harvested['result']),
+                           result.samples[:, 0])
 
 
+    def test_nproc(self):
+        skip_if_no_external('pprocess')
+        data = get_mv_pattern(3)
+        data.init_origids('samples')
+        cvs = [CrossValidatedTransferError(
+                    TransferError(sample_clf_nl),
+                    NFoldSplitter(cvtype=1),
+                    nproc=nproc,
+                    harvest_attribs=['transerror.clf.ca.trained_targets',
+                                     'dataset.nsamples'],
+                    enable_ca=['confusion', 'training_confusion',
+                               'samples_error'])
+               for nproc in (1, 3)]
+        results = [cv(data) for cv in cvs]
+        # folds must be merged in the order of the splits
+        assert_array_equal(results[0].samples, results[1].samples)
+        assert_array_equal(results[0].sa.cv_fold, results[1].sa.cv_fold)
+        for cv in cvs:
+            assert_equal(len(cv.ca.harvested['transerror.clf.ca.trained_targets']),
+                         len(data.UC))
+            assert_equal(cv.ca.harvested['dataset.nsamples'],
+                         [data.nsamples] * len(data.UC))
+        for state_var in ('confusion', 'training_confusion'):
+            assert_array_equal(cvs[0].ca[state_var].value.matrix,
+                               cvs[1].ca[state_var].value.matrix)
+        assert_equal(cvs[0].ca.samples_error, cvs[1].ca.samples_error)
+
+
+    def test_retrain_permuted_targets(self):
+        skip_if_no_external('scipy')
+        from mvpa.clfs.gpr import GPR
+        data = datasets['chirp_linear']
+        results = []
+        for retrainable in (False, True):
+            clf = GPR(retrainable=retrainable)
+            cv = CrossValidatedTransferError(
+                TransferError(clf),
+                NFoldSplitter(cvtype=1, permute_attr='targets',
+                              nrunspersplit=3))
+            # same permutations in both runs
+            np.random.seed(3)
+            results.append(cv(data).samples)
+            if retrainable:
+                # the last split was a permuted rerun on the same samples
+                ok_(clf.ca.retrained)
+        assert_array_almost_equal(results[0], results[1])
+
+
+    def test_fast_cv(self):
+        skip_if_no_external('scipy')
+        from mvpa.clfs.ridge import RidgeReg
+        from mvpa.clfs.blr import BLR
+        from mvpa.clfs.gpr import GPR
+        from mvpa.kernels.np import SquaredExponentialKernel
+        from mvpa.datasets import Dataset
+
+        data = datasets['chirp_linear'][::5]
+        # more features than samples
+        wide = Dataset(np.random.normal(size=(24, 50)),
+                       sa={'targets': np.random.normal(size=24),
+                           'chunks': np.repeat(range(6), 4)})
+        for clf in (RidgeReg(), RidgeReg(lm=0.5), BLR(),
+                    GPR(SquaredExponentialKernel(length_scale=5.), lm=1e-4)):
+            for ds in (data, wide):
+                # leave-one-chunk-out and leave-one-sample-out
+                for attr in ('chunks', 'origids'):
+                    ds = ds.copy()
+                    ds.init_origids('samples', mode='new')
+                    ntrained = []
+                    train = clf.train
+                    def train_(*args, **kwargs):
+                        ntrained.append(1)
+                        return train(*args, **kwargs)
+                    clf.train = train_
+                    cvs = [CrossValidatedTransferError(
+                                TransferError(clf),
+                                NFoldSplitter(attr=attr),
+                                fast_cv=fast_cv,
+                                enable_ca=['confusion'])
+                           for fast_cv in (True, False)]
+                    results = []
+                    for cv in cvs:
+                        ntrained[:] = []
+                        results.append(cv(ds))
+                        nsplits = len(results[-1])
+                        assert_equal(len(ntrained),
+                                     cv is cvs[0] and 1 or nsplits)
+                    del clf.train
+                    assert_equal(nsplits, len(ds.sa[attr].unique))
+                    assert_array_equal(results[0].sa.cv_fold,
+                                       results[1].sa.cv_fold)
+                    assert_array_almost_equal(results[0].samples,
+                                              results[1].samples)
+                    stats = [cv.ca.confusion for cv in cvs]
+                    assert_array_almost_equal(
+                        np.concatenate([s[1] for s in stats[0].sets]),
+                        np.concatenate([s[1] for s in stats[1].sets]))
+
+        # splitters which do not hold out complementary samples fall back
+        # to processing all splits
+        cv = CrossValidatedTransferError(
+            TransferError(RidgeReg()),
+            NFoldSplitter(nrunspersplit=2, permute_attr='targets'))
+        assert_equal(len(cv(data)), 2 * len(data.UC))
+
+        # failing held-out predictions fall back to processing all splits
+        class FailingRidgeReg(RidgeReg):
+            def train_cv(self, data, folds):
+                raise np.linalg.LinAlgError, "Singular matrix"
+        cvs = [CrossValidatedTransferError(TransferError(clf),
+                                           NFoldSplitter(), fast_cv=True)
+               for clf in (FailingRidgeReg(), RidgeReg())]
+        results = [cv(data) for cv in cvs]
+        assert_equal(len(results[0]), len(data.UC))
+        assert_array_almost_equal(results[0].samples, results[1].samples)
+        # not used by default
+        ok_(not CrossValidatedTransferError(
+                TransferError(FailingRidgeReg()), NFoldSplitter(),
+                enable_ca=['confusion'])._get_fast_cv_folds(data))
+
 
 def suite():
     return unittest.makeSuite(CrossValidationTests)
@@ -0,0 +1,115 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the PyMVPA package for the
+#   copyright and license terms.
+#
+### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+'''Tests for cluster labeling and cluster-level inference'''
+
+import numpy as np
+
+from mvpa.testing import *
+
+from mvpa.datasets import Dataset
+from mvpa.misc.neighborhood import IndexQueryEngine, Sphere
+from mvpa.misc.cluster import get_adjacency, label_clusters, \
+     get_cluster_stats
+from mvpa.clfs.stats import MCClusterNullDist
+from mvpa.measures.anova import OneWayAnova
+
+
+def _get_grid_dataset(shape, nsamples=2):
+    coords = np.transpose(np.indices(shape).reshape((len(shape), -1)))
+    ds = Dataset(np.zeros((nsamples, len(coords))))
+    ds.fa['voxel_indices'] = coords
+    return ds
+
+
+def test_label_clusters():
+    ds = _get_grid_dataset((5, 6))
+    adj = get_adjacency(IndexQueryEngine(voxel_indices=Sphere(1)), ds)
+    assert_equal(len(adj[0]), ds.nfeatures + 1)
+    mask = np.array([[1, 1, 0, 0, 0, 1],
+                     [0, 1, 0, 1, 0, 1],
+                     [0, 0, 0, 1, 1, 1],
+                     [1, 0, 0, 0, 0, 0],
+                     [1, 0, 1, 1, 0, 1]], dtype=bool)
+    labels, nclusters = label_clusters(mask.ravel(), adj)
+    assert_equal(nclusters, 5)
+    labels = labels.reshape(mask.shape)
+    ok_((labels[~mask] == -1).all())
+    # U-shaped cluster is connected
+    assert_equal(len(np.unique(labels[[0, 1, 2, 2, 2, 1],
+                                      [5, 5, 5, 4, 3, 3]])), 1)
+    sizes, masses = get_cluster_stats(np.ones(mask.size), labels, nclusters)
+    assert_array_equal(sorted(sizes), [1, 2, 2, 3, 6])
+    assert_array_equal(sizes, masses)
+
+    # agrees with scipy's labeling
+    if externals.exists('scipy'):
+        from scipy import ndimage
+        for i in xrange(5):
+            mask = np.random.uniform(size=(5, 6)) > 0.5
+            ref, nref = ndimage.label(mask)
+            labels, nclusters = label_clusters(mask.ravel(), adj)
+            assert_equal(nclusters, nref)
+            # same partitioning
+            pairs = set(zip(labels, ref.ravel()))
+            assert_equal(len(pairs), nclusters + 1)
+
+        # sparse matrix adjacency
+        from scipy import sparse
+        indptr, indices = adj
+        m = sparse.csr_matrix((np.ones(len(indices)), indices, indptr))
+        assert_array_equal(label_clusters(mask.ravel(), get_adjacency(m))[0],
+                           labels)
+
+
+def test_cluster_null_dist():
+    ds = _get_grid_dataset((6, 6), nsamples=40)
+    # fixed data and permutations, so the result does not depend on the
+    # state of the global random number generator
+    ds.samples = np.random.RandomState(1).normal(size=ds.shape)
+    ds.sa['targets'] = np.repeat([0, 1], 20)
+    # signal in a 2x3 block
+    block = (ds.fa.voxel_indices[:, 0] < 2) & (ds.fa.voxel_indices[:, 1] < 3)
+    ds.samples[20:, block] += 2
+
+    null = MCClusterNullDist(threshold=20.0,
+                             neighborhood=IndexQueryEngine(
+                                 voxel_indices=Sphere(1)),
+                             permutations=20, seed=1)
+    anova = OneWayAnova(null_dist=null)
+    res = anova(ds)
+    assert_equal(len(null.ca.max_samples), 20)
+    prob = anova.ca.null_prob
+    assert_equal(prob.shape, res.shape)
+    # the block is a significant cluster, everything else is not
+    ok_((prob[0, block] < 0.05).all())
+    ok_((prob[0, ~block] == 1).all())
+
+    assert_raises(ValueError, MCClusterNullDist, 1, None, tail='both')
+
+
+def test_cluster_null_dist_ties():
+    ds = _get_grid_dataset((6, 6), nsamples=20)
+    ds.sa['targets'] = np.repeat([0, 1], 10)
+    # every permutation results in a single cluster of size 3
+    cluster3 = np.zeros(ds.nfeatures)
+    cluster3[:3] = 1
+    null = MCClusterNullDist(threshold=0.5,
+                             neighborhood=IndexQueryEngine(
+                                 voxel_indices=Sphere(1)),
+                             permutations=20)
+    null.fit(lambda x: cluster3, ds)
+    assert_array_equal(null.ca.max_samples, [3] * 20)
+    # observed cluster as large as all of the null ones
+    prob = null.p(cluster3)
+    assert_array_equal(prob[:3], [1.0] * 3)
+    assert_array_equal(prob[3:], [1.0] * (ds.nfeatures - 3))
+    # a larger cluster is the most significant one possible
+    cluster4 = cluster3.copy()
+    cluster4[3] = 1
+    assert_array_almost_equal(null.p(cluster4)[:4], [1 / 21.] * 4)
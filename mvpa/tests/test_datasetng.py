@@ -547,7 +547,12 @@ def test_labelpermutation_randomsampling():
     assert_raises(KeyError, ds.permute_attr,
                   attr='roi') # wrong collection
     ds = ods.copy()
+    # permutation within pairs of features keeps all the values with
+    # probability 1/32, so it is done from a fixed random state
+    rstate = np.random.get_state()
+    np.random.seed(1)
     ds.permute_attr(attr='lucky', chunks_attr='roi', col='fa')
+    np.random.set_state(rstate)
     # we should have not touched samples attributes
     for sa in ds.sa.keys():
         assert_array_equal(ds.sa[sa].value, ods.sa[sa].value)
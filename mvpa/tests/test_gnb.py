@@ -57,6 +57,54 @@ class GNBTests(unittest.TestCase):
                         d1 = np.sum(v, axis=1) - 1.0
                         self.failUnless(np.max(np.abs(d1)) < 1e-5)
 
+
+    @sweepargs(cv=(True, False))
+    def test_gnb_partial_fit(self, cv):
+        ds = datasets['uni4medium']
+        gnb = GNB(common_variance=cv)
+        gnb.train(ds)
+        # estimates agree with the per-class moments
+        for i, l in enumerate(gnb.ulabels):
+            samples = ds.samples[ds.targets == l]
+            assert_array_almost_equal(gnb.means[i], samples.mean(axis=0))
+            if not cv:
+                assert_array_almost_equal(gnb.variances[i],
+                                          samples.var(axis=0))
+
+        # incremental training in batches, with a class missing from
+        # the first one
+        order = np.argsort(ds.targets == ds.sa['targets'].unique[-1],
+                           kind='mergesort')
+        gnb_inc = GNB(common_variance=cv, enable_ca=['trained_targets'])
+        for batch in np.array_split(order, 3):
+            gnb_inc.partial_fit(ds[batch])
+        assert_equal(gnb_inc.ca.trained_nsamples, ds.nsamples)
+        assert_array_equal(gnb_inc.ca.trained_targets, gnb.ulabels)
+        assert_array_equal(gnb_inc.ulabels, gnb.ulabels)
+        for attr in ('means', 'variances', 'priors'):
+            assert_array_almost_equal(getattr(gnb_inc, attr),
+                                      getattr(gnb, attr))
+        assert_array_equal(gnb_inc.predict(ds), gnb.predict(ds))
+
+        self.failUnlessRaises(ValueError, gnb_inc.partial_fit, ds[:, :2])
+
+
+    @sweepargs(logprob=(True, False))
+    def test_gnb_blockwise_predict(self, logprob):
+        ds_tr = datasets['uni4medium_train']
+        ds_te = datasets['uni4medium_test']
+        results = []
+        for block_elements in (None, 7, 1):
+            gnb = GNB(logprob=logprob, enable_ca=['estimates'])
+            if block_elements is not None:
+                # few features (or even a single one) per block
+                gnb._predict_block_elements = block_elements
+            gnb.train(ds_tr)
+            results.append((gnb.predict(ds_te), gnb.ca.estimates))
+        for r in results[1:]:
+            assert_array_equal(r[0], results[0][0])
+            assert_array_almost_equal(r[1], results[0][1])
+
 def suite():
     return unittest.makeSuite(GNBTests)
 
@@ -9,7 +9,9 @@
 """Unit tests for PyMVPA GPR."""
 
 from mvpa.misc import data_generators
-from mvpa.kernels.np import GeneralizedLinearKernel
+from mvpa.kernels.np import GeneralizedLinearKernel, \
+     SquaredExponentialKernel
+from mvpa.kernels.base import NystroemKernel, CachedKernel
 from mvpa.clfs.gpr import GPR
 
 from mvpa.testing import *
@@ -32,6 +34,129 @@ class GPRTests(unittest.TestCase):
     def test_linear(self):
         pass
 
+    def test_blockwise_predict(self):
+        dataset = data_generators.linear1d_gaussian_noise()
+        preds = []
+        for block_size in (None, 7):
+            clf = GPR(GeneralizedLinearKernel(), block_size=block_size,
+                      enable_ca=['predicted_variances'])
+            clf.train(dataset)
+            preds.append((clf.predict(dataset.samples),
+                          clf.ca.predicted_variances))
+        assert_array_almost_equal(preds[0][0], preds[1][0])
+        assert_array_almost_equal(preds[0][1], preds[1][1])
+        assert_array_equal(preds[1][1].shape, dataset.targets.shape)
+
+    def test_model_selection_restarts(self):
+        skip_if_no_external('openopt')
+        from mvpa.clfs.model_selector import ModelSelector
+        dataset = data_generators.sin_modulated(30, 1)
+        # sigma_noise, sigma_f, length_scale
+        guesses = [np.array([.1, 1., 1.]),
+                   np.array([1., .5, .1]),
+                   np.array([.01, 2., 3.])]
+        nprocs = [1]
+        if externals.exists('pprocess'):
+            nprocs.append(2)
+        results = []
+        for nproc in nprocs:
+            clf = GPR(SquaredExponentialKernel(),
+                      enable_ca=['log_marginal_likelihood'])
+            ms = ModelSelector(clf, dataset)
+            lml = ms.solve_restarts(guesses, nproc=nproc,
+                                    optimization_algorithm='scipy_lbfgsb',
+                                    use_gradient=True, logscale=True)
+            assert_equal(len(ms.restarts), len(guesses))
+            converged = [r for r in ms.restarts if r[0] is not None]
+            ok_(len(converged) > 0)
+            # the best restart is picked
+            best = converged[np.argmax([r[0] for r in converged])]
+            assert_equal(lml, best[0])
+            assert_equal(ms.log_marginal_likelihood_best, best[0])
+            assert_array_equal(ms.hyperparameters_best, best[1])
+            # and the model is trained with it
+            ok_(clf.trained)
+            results.append((ms.restarts, lml))
+        # child processes provide the same results
+        for restarts, lml in results[1:]:
+            assert_almost_equal(lml, results[0][1])
+            for r, r0 in zip(restarts, results[0][0]):
+                assert_equal(r[0] is None, r0[0] is None)
+                if r[0] is not None:
+                    assert_almost_equal(r[0], r0[0])
+                    assert_array_almost_equal(r[1], r0[1])
+
+    def test_model_selection_restarts_dispatch(self):
+        from mvpa.clfs.model_selector import ModelSelector
+
+        class GuessSelector(ModelSelector):
+            """Every restart merely evaluates its initial guess, so no
+            optimizer (openopt) is needed"""
+            def max_log_marginal_likelihood(self, hyp_initial_guess,
+                                            **kwargs):
+                self.hyp_initial_guess = np.array(hyp_initial_guess)
+                self.freeHypers = np.zeros(len(hyp_initial_guess),
+                                           dtype=bool)
+
+        dataset = data_generators.sin_modulated(30, 1)
+        # sigma_noise, sigma_f, length_scale
+        guesses = [np.array([.1, 1., 1.]),
+                   np.array([.5, 1., .3]),
+                   np.array([.1, 2., .5])]
+        clf = GPR(SquaredExponentialKernel(),
+                  enable_ca=['log_marginal_likelihood'])
+        lmls = []
+        for guess in guesses:
+            clf.set_hyperparameters(guess)
+            clf.train(dataset)
+            lmls.append(clf.compute_log_marginal_likelihood())
+        best = np.argmax(lmls)
+
+        nprocs = [1]
+        if externals.exists('pprocess'):
+            nprocs.append(2)
+        for nproc in nprocs:
+            clf = GPR(SquaredExponentialKernel(),
+                      enable_ca=['log_marginal_likelihood'])
+            ms = GuessSelector(clf, dataset)
+            lml = ms.solve_restarts(guesses, nproc=nproc)
+            # results of the restarts are in the order of the guesses
+            assert_array_almost_equal([r[0] for r in ms.restarts], lmls)
+            for r, guess in zip(ms.restarts, guesses):
+                assert_array_equal(r[1], guess)
+            # the best restart is picked
+            assert_almost_equal(lml, lmls[best])
+            assert_array_equal(ms.hyperparameters_best, guesses[best])
+            # and the model is trained with it
+            ok_(clf.trained)
+            assert_almost_equal(clf.compute_log_marginal_likelihood(),
+                                lmls[best])
+
+    def test_low_rank(self):
+        # evenly spaced training samples span all the testing ones, so the
+        # approximation of the prior variances of the testing samples by
+        # the landmarks is accurate
+        dataset = data_generators.sin_modulated(30, 1, flat=True)
+        testdata = data_generators.sin_modulated(20, 1, flat=True).samples
+        kernel = SquaredExponentialKernel(length_scale=.5)
+        results = []
+        for k in (kernel, NystroemKernel(kernel, nlandmarks=30),
+                  CachedKernel(NystroemKernel(kernel, nlandmarks=30))):
+            clf = GPR(k, sigma_noise=.1, lm=0., enable_ca=[
+                'predicted_variances', 'log_marginal_likelihood'])
+            clf.train(dataset)
+            results.append((clf.predict(testdata),
+                            clf.ca.predicted_variances,
+                            clf.ca.log_marginal_likelihood,
+                            clf.train_cv(dataset, [np.arange(30) % 3 == i
+                                                   for i in range(3)])))
+            if k.low_rank:
+                ok_(clf._km_train_train is None)
+                ok_(len(clf._L) <= 30)
+        for res in results[1:]:
+            for r0, r1 in zip(results[0], res):
+                assert_array_almost_equal(r0, r1, decimal=4)
+
 
 def suite():
     return unittest.makeSuite(GPRTests)
@@ -8,6 +8,10 @@
 ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 """Unit tests for PyMVPA kernels"""
 
+import os
+import shutil
+import tempfile
+
 import numpy as np
 
 from mvpa.testing import *
@@ -19,7 +23,9 @@ from mvpa.clfs.distance import squared_euclidean_distance, \
      pnorm_w, pnorm_w_python
 
 import mvpa.kernels.np as npK
-from mvpa.kernels.base import PrecomputedKernel, CachedKernel
+from mvpa.kernels.base import Kernel, PrecomputedKernel, CachedKernel, \
+     NystroemKernel, precache_kernel
+from mvpa.misc.sampleslookup import SamplesLookup
 try:
     import mvpa.kernels.sg as sgK
     _has_sg = True
@@ -164,6 +170,233 @@ class KernelTests(unittest.TestCase):
                         "CachedKernel did not recompute old data which had\n" +\
                         "previously been computed, but had the cache overriden")
 
+    def test_precache_kernel(self):
+        d = datasets['uni2small'].copy(deep=True)
+        # classifiers without a cached kernel are left alone
+        from mvpa.clfs.knn import kNN
+        self.failIf(precache_kernel(kNN(), d))
+        from mvpa.clfs.gpr import GPR
+        self.failIf(precache_kernel(GPR(), d))
+        if exists('libsvm'):
+            from mvpa.clfs.libsvmc import SVM
+            self.failIf(precache_kernel(SVM(), d))
+
+    def test_precache_kernel_cv(self):
+        skip_if_no_external('libsvm')
+        from mvpa.clfs.libsvmc import SVM
+        from mvpa.clfs.transerror import TransferError
+        from mvpa.algorithms.cvtranserror import CrossValidatedTransferError
+        from mvpa.datasets.splitters import NFoldSplitter
+
+        class CountingLinearKernel(npK.LinearKernel):
+            ncomputed = 0
+            def _compute(self, d1, d2):
+                self.ncomputed += 1
+                npK.LinearKernel._compute(self, d1, d2)
+
+        ds = datasets['uni2medium']
+        base = CountingLinearKernel()
+        ck = CachedKernel(base)
+        clf = SVM(kernel=ck, C=1.)
+        cve = CrossValidatedTransferError(TransferError(clf), NFoldSplitter())
+        errors = cve(ds)
+        # kernel is computed only once on the whole dataset
+        assert_equal(base.ncomputed, 1)
+        assert_equal(ck._kfull.shape, (len(ds), len(ds)))
+        # and is still cached for it
+        self.failUnless(precache_kernel(clf, ds))
+        self.failIf(ck._recomputed)
+        assert_equal(base.ncomputed, 1)
+
+        # same results as without caching
+        cve_ = CrossValidatedTransferError(
+            TransferError(SVM(kernel=npK.LinearKernel(), C=1.)),
+            NFoldSplitter())
+        assert_array_equal(errors, cve_(ds))
+
+    def test_distance_kernel_cache(self):
+        d = np.random.normal(size=(30, 4))
+        # no caching by default
+        k = npK.SquaredExponentialKernel(length_scale=2.)
+        k.compute(d)
+        ok_(not k.cache_sqdist)
+        ok_(k._DistanceKernel__sqdist is None)
+        k = npK.SquaredExponentialKernel(length_scale=2., cache_sqdist=True)
+        k.compute(d)
+        sqdist = k._DistanceKernel__sqdist
+        ok_(sqdist is not None)
+        # only the hyperparameter changes -- distances are reused
+        k.set_hyperparameters(np.array([1.5, 3.]))
+        k.compute(d.copy())
+        ok_(k._DistanceKernel__sqdist is sqdist)
+        assert_array_almost_equal(
+            k.as_raw_np(),
+            1.5**2 * np.exp(-0.5 * squared_euclidean_distance(d) / 9.))
+        # new data -- new distances
+        d[0, 0] += 1
+        k.compute(d)
+        ok_(not k._DistanceKernel__sqdist is sqdist)
+        # per feature length scales
+        ls = np.arange(1, 5.)
+        k.set_hyperparameters(np.hstack(([1.], ls)))
+        k.compute(d)
+        assert_array_almost_equal(
+            k.as_raw_np(),
+            np.exp(-0.5 * squared_euclidean_distance(d, weight=ls**-2)))
+        k.cleanup()
+        ok_(k._DistanceKernel__sqdist is None)
+
+    def test_kernel_diag(self):
+        d = np.random.normal(size=(15, 4))
+        for k in (npK.LinearKernel(), npK.PolyKernel(degree=3, coef0=1.),
+                  npK.RbfKernel(sigma=2.), npK.ConstantKernel(sigma_0=3.),
+                  npK.GeneralizedLinearKernel(sigma_0=2.,
+                                              Sigma_p=np.arange(1, 5.)),
+                  npK.ExponentialKernel(length_scale=2.),
+                  npK.SquaredExponentialKernel(sigma_f=2.),
+                  npK.Matern_3_2Kernel(sigma_f=.5),
+                  npK.RationalQuadraticKernel(sigma_f=2.)):
+            k.compute(d)
+            full = k.as_raw_np()
+            assert_array_almost_equal(k.diag(d), np.diag(full))
+            # the generic blockwise implementation agrees
+            assert_array_almost_equal(Kernel._diag(k, d), np.diag(full))
+            # and leaves the computed kernel intact
+            assert_array_equal(k.as_raw_np(), full)
+        ds = Dataset(d)
+        k = CachedKernel(npK.RbfKernel(sigma=2.))
+        k.compute(ds)
+        assert_array_almost_equal(k.diag(ds), np.diag(k.as_raw_np()))
+
+    def test_low_rank_kernels(self):
+        d = np.random.normal(size=(40, 3))
+        se = npK.SquaredExponentialKernel(length_scale=2.)
+        kfull = se.computed(d).as_raw_np()
+        # with all samples as landmarks Nystroem approximation is exact
+        k = NystroemKernel(se, nlandmarks=100)
+        k.compute(d)
+        assert_equal(len(k.landmarks), len(d))
+        assert_array_almost_equal(k.as_raw_np(), kfull)
+        f = k.features(d)
+        assert_equal(f.shape[0], len(d))
+        ok_(f.shape[1] <= len(d))
+        assert_array_almost_equal(k.diag(d), np.ones(len(d)))
+        # landmarks are kept, but changed kernel gets reflected
+        landmarks = k.landmarks
+        se.length_scale = 1.
+        k.compute(d[:10], d)
+        ok_(k.landmarks is landmarks)
+        assert_array_almost_equal(k.as_raw_np(),
+                                  se.computed(d[:10], d).as_raw_np(),
+                                  decimal=5)
+        # low-rank approximations with fewer landmarks
+        for selection in ('random', 'kmeans'):
+            k = NystroemKernel(se, nlandmarks=10,
+                               landmarks_selection=selection)
+            k.compute(d)
+            assert_equal(k.features(d).shape, (len(d), 10))
+            assert_equal(np.linalg.matrix_rank(k.as_raw_np()), 10)
+
+        # random fourier features converge to squared exponential kernel
+        k = npK.RandomFourierKernel(length_scale=2., sigma_f=1.5,
+                                    nfrequencies=20000)
+        k.compute(d)
+        assert_equal(k.features(d).shape, (len(d), 40000))
+        se = npK.SquaredExponentialKernel(length_scale=2., sigma_f=1.5)
+        ok_(np.abs(k.as_raw_np() - se.computed(d).as_raw_np()).max() < 0.1)
+        assert_array_almost_equal(k.diag(d), 1.5**2 * np.ones(len(d)))
+        # frequencies are kept when length scale changes
+        frequencies = k.frequencies
+        k.params.length_scale = np.array([1., 2., 3.])
+        k.compute(d)
+        ok_(k.frequencies is frequencies)
+        se.length_scale = np.array([1., 2., 3.])
+        ok_(np.abs(k.as_raw_np() - se.computed(d).as_raw_np()).max() < 0.1)
+
+        # only features get cached
+        ds = Dataset(d)
+        ck = CachedKernel(NystroemKernel(npK.LinearKernel(), nlandmarks=5))
+        ck.compute(ds)
+        ok_(ck.low_rank)
+        ok_(ck._kfull is None)
+        assert_equal(ck._lhsfeatures.shape, (len(ds), 3))
+        # n x n matrix is not formed unless accessed
+        ok_(ck._k is None)
+        assert_array_equal(ck.features(ds[3:7]), ck._lhsfeatures[3:7])
+        assert_array_almost_equal(ck.features(d[:4]), ck._lhsfeatures[:4])
+        kcached = ck.as_raw_np()
+        assert_array_almost_equal(kcached, np.dot(d, d.T))
+        ck.compute(ds[5:10], ds[:20])
+        assert_array_almost_equal(ck.as_raw_np(), kcached[5:10, :20])
+        ok_(not CachedKernel(npK.LinearKernel()).low_rank)
+        self.failUnlessRaises(ValueError,
+                              CachedKernel(npK.LinearKernel()).features, ds)
+
+    def test_samples_lookup(self):
+        ds = Dataset(np.random.normal(size=(30, 2)))
+        for origids in (None,                        # generated strings
+                        np.random.permutation(30) + 5, # dense integers
+                        np.arange(30) * 3):          # sparse integers
+            if origids is not None:
+                ds.sa['origids'] = origids
+            sl = SamplesLookup(ds)
+            ids = np.random.permutation(30)[:10]
+            assert_array_equal(sl(ds[ids]), ids)
+            assert_array_equal(sl(ds[ids], allow_slice=True), ids)
+            assert_equal(sl(ds[7:19], allow_slice=True), slice(7, 19))
+            assert_array_equal(sl(ds[7:19]), np.arange(7, 19))
+            assert_array_equal(sl(ds[::-1], allow_slice=True),
+                               np.arange(29, -1, -1))
+            # unknown samples
+            ds2 = ds[:3].copy()
+            ds2.sa.origids = ds2.sa.origids[::-1]
+            if origids is None:
+                ds2.sa.origids[0] = 'unknown'
+            else:
+                ds2.sa.origids[0] = origids.max() + 1
+            self.failUnlessRaises(KeyError, sl, ds2)
+        ds.sa.origids[1] = ds.sa.origids[0]
+        self.failUnlessRaises(ValueError, SamplesLookup, ds)
+
+    def test_blockwise_kernel(self):
+        d1 = np.random.normal(size=(23, 4))
+        d2 = np.random.normal(size=(17, 4))
+        k = npK.RbfKernel(sigma=2.)
+        for args in ((d1,), (d1, d2)):
+            kfull = k.computed(*args).as_raw_np()
+            k.compute_blockwise(*args, **dict(block_size=5))
+            assert_array_almost_equal(k.as_raw_np(), kfull)
+
+    def test_cached_kernel_on_disk(self):
+        ds = Dataset(np.random.normal(size=(23, 4)))
+        cache_dir = tempfile.mkdtemp()
+        try:
+            ck = CachedKernel(npK.RbfKernel(sigma=2.), block_size=5,
+                              cache_dir=cache_dir)
+            ck.compute(ds)
+            assert_equal(len(os.listdir(cache_dir)), 1)
+            ok_(isinstance(ck._kfull, np.memmap))
+            kfull = npK.RbfKernel(sigma=2.).computed(ds).as_raw_np()
+            assert_array_almost_equal(ck.as_raw_np(), kfull)
+            ck.compute(ds[3:9], ds[:7])
+            assert_array_almost_equal(ck.as_raw_np(), kfull[3:9, :7])
+            # the same kernel on the same data -- just loaded
+            ck2 = CachedKernel(npK.RbfKernel(sigma=2.), cache_dir=cache_dir)
+            ck2.compute(ds.copy())
+            assert_equal(len(os.listdir(cache_dir)), 1)
+            assert_array_almost_equal(ck2.as_raw_np(), kfull)
+            # other parameters -- other file
+            ck2 = CachedKernel(npK.SquaredExponentialKernel(length_scale=2.),
+                               cache_dir=cache_dir)
+            ck2.compute(ds)
+            ck3 = CachedKernel(npK.SquaredExponentialKernel(length_scale=3.),
+                               cache_dir=cache_dir)
+            ck3.compute(ds)
+            assert_equal(len(os.listdir(cache_dir)), 3)
+            ok_(np.abs(ck2.as_raw_np() - ck3.as_raw_np()).max() > 0.01)
+        finally:
+            shutil.rmtree(cache_dir)
+
     if _has_sg:
         # Unit tests which require shogun kernels
         # Note - there is a loss of precision from double to float32 in SG
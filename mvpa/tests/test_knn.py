@@ -63,6 +63,67 @@ class KNNTests(unittest.TestCase):
         self.failUnless(clf.ca.distances.fa['chunks'] is train.sa['chunks'])
         self.failUnless(clf.ca.distances.fa.chunks is train.sa.chunks)
 
+
+    @sweepargs(voting=('weighted', 'majority'))
+    def test_knn_chunks(self, voting):
+        train = pure_multivariate_signal( 40, 3 )
+        test = pure_multivariate_signal( 20, 3 )
+
+        results = []
+        for clf in (kNN(k=10, voting=voting),
+                    kNN(k=10, voting=voting, chunk_size=7)):
+            clf.ca.enable(['estimates', 'distances'])
+            clf.train(train)
+            results.append((clf.predict(test.samples), clf.ca.estimates,
+                            clf.ca.distances.samples))
+        assert_array_equal(results[0][0], results[1][0])
+        assert_array_equal(results[0][1], results[1][1])
+        assert_array_equal(results[0][2], results[1][2])
+        # votes are counted for the k nearest neighbors only
+        if voting == 'majority':
+            assert_array_equal(results[0][1].sum(axis=1), 10)
+        # each vote agrees with the vote for individual neighbors
+        dists = results[0][2]
+        for i in xrange(0, len(dists), 10):
+            vote = clf.get_majority_vote(np.argsort(dists[i])[:10])
+            assert_array_equal(np.array(vote[1]),
+                               np.bincount(
+                                   train.targets[np.argsort(dists[i])[:10]],
+                                   minlength=2))
+
+        # more neighbors than training samples
+        clf = kNN(k=200, voting=voting)
+        clf.train(train)
+        clf.ca.enable(['estimates'])
+        clf.predict(test.samples)
+        assert_equal(clf.ca.estimates.shape, (80, 2))
+
+
+    @sweepargs(k=(1, 10, 200))
+    def test_knn_search(self, k):
+        skip_if_no_external('scipy')
+        train = pure_multivariate_signal( 40, 3 )
+        test = pure_multivariate_signal( 20, 3 )
+
+        results = []
+        for search in ('brute', 'kdtree', 'auto'):
+            clf = kNN(k=k, search=search, enable_ca=['estimates'])
+            clf.train(train)
+            results.append((clf.predict(test.samples), clf.ca.estimates))
+            expected = ('brute', 'kdtree', 'kdtree')[len(results) - 1]
+            ok_(clf.summary().endswith('neighbor search: %s' % expected))
+        for r in results[1:]:
+            assert_array_equal(results[0][0], r[0])
+            assert_array_equal(results[0][1], r[1])
+
+        # non-euclidean distances are searched exhaustively
+        clf = kNN(k=k, dfx=one_minus_correlation)
+        clf.train(train)
+        ok_(clf.summary().endswith('neighbor search: brute'))
+        self.failUnlessRaises(ValueError, kNN, dfx=one_minus_correlation,
+                              search='kdtree')
+        self.failUnlessRaises(ValueError, kNN, search='balltree')
+
 def suite():
     return unittest.makeSuite(KNNTests)
 
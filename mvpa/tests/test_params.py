@@ -79,6 +79,10 @@ class ParamsTests(unittest.TestCase):
         self.failUnlessEqual(simple.params.C, 1.0)
         self.failUnlessRaises(AttributeError, simple.params.__getattribute__, 'B')
 
+        # additional attributes are available in the instance's collection
+        self.failUnlessEqual(simple.params['C'].min, 0)
+        self.failUnlessRaises(ValueError, simple.params.__setattr__, 'C', -1.)
+
     def test_mixed(self):
         mixed  = MixedClass()
 
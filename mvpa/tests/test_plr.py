@@ -11,6 +11,7 @@
 import numpy as np
 
 from mvpa.clfs.plr import PLR
+from mvpa.datasets import Dataset
 from mvpa.testing import *
 from mvpa.testing.datasets import datasets
 
@@ -43,6 +44,23 @@ class PLRTests(unittest.TestCase):
         self.failUnless(np.array(clf.ca.estimates).shape == np.array(p).shape)
 
 
+    def test_plr_optimality(self):
+        # primal (more samples than features) and dual (more features
+        # than samples) fits
+        for nsamples, nfeatures in ((40, 5), (20, 100)):
+            X = np.random.normal(size=(nsamples, nfeatures))
+            y = (X[:, 0] + np.random.normal(size=nsamples) > 0).astype(int)
+            y[:2] = [0, 1]
+            clf = PLR(lm=2., criterion=1e-12, enable_ca=['iterations_time'])
+            clf.train(Dataset(X, sa={'targets': y}))
+            ok_(clf.ca.niterations > 0)
+            assert_equal(len(clf.ca.iterations_time), clf.ca.niterations)
+            # gradient of the penalized log-likelihood vanishes
+            r = y - 1. / (1 + np.exp(-(np.dot(X, clf.w) + clf.offset)))
+            assert_array_almost_equal(np.dot(X.T, r), 2. * clf.w)
+            assert_almost_equal(r.sum(), 0)
+
+
 def suite():
     return unittest.makeSuite(PLRTests)
 
@@ -8,8 +8,12 @@
 ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 """Unit tests for PyMVPA ridge regression classifier"""
 
+import numpy as np
+
 from mvpa.clfs.ridge import RidgeReg
+from mvpa.datasets import Dataset
 from scipy.stats import pearsonr
+from scipy.linalg import lstsq
 from mvpa.testing import *
 from mvpa.testing.datasets import datasets
 
@@ -54,6 +58,34 @@ class RidgeRegTests(unittest.TestCase):
         self.failUnless((p == clf.ca.predictions).all())
 
 
+    def test_ridge_reg_path(self):
+        lms = [10., 0.1, 1.]
+        # primal and dual forms
+        for nsamples, nfeatures in ((40, 5), (10, 60)):
+            data = Dataset(np.random.normal(size=(nsamples, nfeatures)) + 2,
+                           sa={'targets': np.random.normal(size=nsamples)})
+            clf = RidgeReg(lm=3.)
+            path = clf.train_path(data, lms)
+            assert_equal([lm for lm, w in path], lms)
+            for lm, w in path + [(3., clf.w)]:
+                # reference solution of the augmented least squares problem
+                a = np.vstack(
+                    (np.hstack((data.samples, np.ones((nsamples, 1)))),
+                     np.hstack((lm * np.eye(nfeatures),
+                                np.zeros((nfeatures, 1))))))
+                b = np.hstack((data.targets, np.zeros(nfeatures)))
+                assert_array_almost_equal(w, lstsq(a, b)[0])
+            predictions = clf.predict_path(data)
+            assert_equal(len(predictions), len(lms))
+            for lm, p in zip(lms, predictions):
+                clf_ = RidgeReg(lm=lm)
+                clf_.train(data)
+                assert_array_almost_equal(clf_.predict(data), p)
+
+        clf.untrain()
+        self.failUnlessRaises(ValueError, clf.predict_path, data)
+
+
 def suite():
     return unittest.makeSuite(RidgeRegTests)
 
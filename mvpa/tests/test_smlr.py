@@ -13,7 +13,10 @@ import numpy as np
 from mvpa.testing import *
 from mvpa.testing.datasets import datasets
 
-from mvpa.clfs.smlr import SMLR
+from mvpa.clfs.smlr import SMLR, SMLRPathError
+from mvpa.clfs.transerror import TransferError
+from mvpa.algorithms.cvtranserror import CrossValidatedTransferError
+from mvpa.datasets.splitters import NFoldSplitter
 from mvpa.misc.data_generators import normal_feature_dataset
 
 
@@ -68,6 +71,79 @@ class SMLRTests(unittest.TestCase):
         self.failUnless(sens.shape == (len(data.UT) - 1, data.nfeatures))
 
 
+    def test_smlr_c_samples_layout(self):
+        if SMLR().params.implementation != 'C':
+            raise SkipTest, "C implementation of SMLR is not available"
+        data = normal_feature_dataset(perlabel=150, nlabels=3, nfeatures=10,
+                                      nonbogus_features=[0, 1, 2], snr=3)
+        clf = SMLR(seed=3)
+        clf.train(data)
+        weights = np.vstack((clf.weights, clf.biases))
+
+        samples = data.samples
+        for nthreads in (1, 2):
+            for X, decimal in ((samples, 10),
+                               # non-contiguous view of the samples
+                               (np.hstack((samples, samples))[:, :10], 10),
+                               (np.asfortranarray(samples), 10),
+                               (samples.astype(np.float32), 4)):
+                ds = data.copy()
+                ds.samples = X
+                clf_ = SMLR(seed=3, nthreads=nthreads)
+                clf_.train(ds)
+                assert_array_almost_equal(
+                    np.vstack((clf_.weights, clf_.biases)), weights,
+                    decimal=decimal)
+                # samples were not copied
+                ok_(ds.samples is X)
+
+
+    @sweepargs(fit_all_weights=(True, False))
+    def test_smlr_path(self, fit_all_weights):
+        data = datasets['uni4small']
+        lms = [0.1, 3., 1., 10.]
+
+        clf = SMLR(fit_all_weights=fit_all_weights, convergence_tol=1e-6)
+        path = clf.train_path(data, lms)
+        assert_array_equal([lm for lm, w in path], sorted(lms, reverse=True))
+        # stronger penalty -- sparser weights
+        nnz = [(w != 0).sum() for lm, w in path]
+        ok_(nnz[0] <= nnz[-1])
+        # classifier is trained with the smallest penalty
+        assert_array_equal(clf.predict(data), clf.predict_path(data)[-1])
+
+        # path agrees with individual fits
+        for (lm, w), predictions in zip(path, clf.predict_path(data)):
+            clf_ = SMLR(lm=lm, fit_all_weights=fit_all_weights,
+                        convergence_tol=1e-6)
+            clf_.train(data)
+            if not fit_all_weights:
+                # with all weights fit the solution is not unique
+                w_ = np.vstack((clf_.weights, clf_.biases))
+                ok_(np.abs(w_ - w).max() <= 0.05 * np.abs(w_).max())
+            ok_(np.mean(clf_.predict(data) == predictions) >= 0.9)
+
+        clf.untrain()
+        ok_(clf.path is None)
+        self.failUnlessRaises(ValueError, clf.predict_path, data)
+
+        # errors for all penalties in a single cross-validation
+        cv = CrossValidatedTransferError(
+            SMLRPathError(SMLR(fit_all_weights=fit_all_weights), lms),
+            NFoldSplitter(), enable_ca=['confusion'])
+        errors = cv(data)
+        assert_equal(errors.shape, (len(data.UC), len(lms)))
+        # confusion is of the smallest penalty
+        cv_ = CrossValidatedTransferError(
+            TransferError(SMLR(lm=min(lms),
+                               fit_all_weights=fit_all_weights)),
+            NFoldSplitter())
+        ok_(np.abs(np.mean(errors.samples[:, -1])
+                   - np.mean(cv_(data).samples)) <= 0.1)
+        assert_almost_equal(cv.ca.confusion.error,
+                            np.mean(errors.samples[:, -1]))
+
+
 def suite():
     return unittest.makeSuite(SMLRTests)
 
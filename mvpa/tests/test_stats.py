@@ -13,7 +13,9 @@ from mvpa.testing.datasets import datasets
 
 from mvpa import cfg
 from mvpa.base import externals
-from mvpa.clfs.stats import MCNullDist, FixedNullDist, NullDist
+from mvpa.clfs.stats import MCNullDist, FixedNullDist, NullDist, \
+     Nonparametric, FeaturewiseNonparametric, SequentialMCNullDist, \
+     MCMaxStatNullDist
 from mvpa.datasets import Dataset
 from mvpa.measures.glm import GLM
 from mvpa.measures.anova import OneWayAnova, CompoundOneWayAnova
@@ -77,6 +79,153 @@ class StatsTests(unittest.TestCase):
             self.failUnlessRaises(ValueError, null.p, [5, 3, 4])
 
 
+    def test_mc_null_dist_seed(self):
+        ds = datasets['uni2small']
+        null = MCNullDist(permutations=10, seed=11,
+                          enable_ca=['dist_samples'])
+        null.fit(OneWayAnova(), ds)
+        samples = null.ca.dist_samples
+        assert_equal(samples.shape[0], 10)
+        # same seed -- same distribution
+        null.fit(OneWayAnova(), ds)
+        assert_array_equal(samples, null.ca.dist_samples)
+        # and it is independent from the number of processes
+        if externals.exists('pprocess'):
+            pnull = MCNullDist(permutations=10, seed=11, nproc=3,
+                               enable_ca=['dist_samples'])
+            pnull.fit(OneWayAnova(), ds)
+            assert_array_equal(samples, pnull.ca.dist_samples)
+
+
+    def test_featurewise_nonparametric(self):
+        samples = np.random.normal(size=(20, 50))
+        samples[2, 3] = np.nan
+        x = np.random.normal(size=50)
+        # hit some values exactly
+        x[:5] = samples[4, :5]
+        x[6] = np.nan
+        for correction in ('clip', None):
+            fdist = FeaturewiseNonparametric(samples, correction=correction)
+            assert_equal(len(fdist), 50)
+            assert_array_almost_equal(
+                fdist.cdf(x),
+                [Nonparametric(s, correction=correction).cdf(v)
+                 for s, v in zip(samples.T, x)])
+        self.failUnlessRaises(ValueError, fdist.cdf, x[:10])
+
+        # MCNullDist uses it for all features at once
+        null = MCNullDist(permutations=10)
+        null.fit(OneWayAnova(), datasets['uni2small'])
+        ok_(isinstance(null._dist, FeaturewiseNonparametric))
+
+
+    @sweepargs(featurewise=(False, True))
+    def test_sequential_mc_null_dist(self, featurewise):
+        skip_if_no_external('scipy')
+        ds = datasets['uni4large']
+        null = SequentialMCNullDist(permutations=500, tail='right',
+                                    featurewise=featurewise,
+                                    enable_ca=['dist_samples'])
+        null.fit(OneWayAnova(), ds)
+        nsamples = null.ca.nsamples
+        assert_equal(nsamples.shape, (1, ds.nfeatures))
+        assert_equal(null.ca.dist_samples.shape[0], nsamples.max())
+        ok_(nsamples.max() <= 500)
+        # samples which were not drawn for decided elements are NaN
+        dist_samples = null.ca.dist_samples.reshape((nsamples.max(), -1))
+        drawn = np.arange(nsamples.max())[:, None] < nsamples.ravel()
+        ok_(not np.isnan(dist_samples[drawn]).any())
+        ok_(np.isnan(dist_samples[~drawn]).all())
+        # bogus features get decided quickly
+        bogus = np.setdiff1d(np.arange(ds.nfeatures),
+                             ds.a.nonbogus_features)
+        ok_(np.median(nsamples[0, bogus]) < 100)
+        prob = null.p(OneWayAnova()(ds).samples)
+        assert_equal(prob.shape, (1, ds.nfeatures))
+        if cfg.getboolean('tests', 'labile', default='yes'):
+            ok_((prob[0, ds.a.nonbogus_features] < 0.05).all())
+
+
+    def test_max_stat_null_dist(self):
+        ds = datasets['uni4large']
+        ref = MCNullDist(permutations=50, seed=3, tail='right',
+                         enable_ca=['dist_samples'])
+        ref.fit(OneWayAnova(), ds)
+        null = MCMaxStatNullDist(permutations=50, seed=3, step=7,
+                                 enable_ca=['uncorrected_p'])
+        null.fit(OneWayAnova(), ds)
+        ok_(not null.ca.is_set('dist_samples'))
+        dist_samples = ref.ca.dist_samples
+        assert_array_equal(null.ca.max_samples,
+                           dist_samples.reshape((50, -1)).max(axis=1))
+
+        observed = OneWayAnova()(ds).samples
+        exceed = (dist_samples >= observed).sum(axis=0)
+        assert_array_almost_equal(null.ca.uncorrected_p, (exceed + 1) / 51.0)
+        # corrected p-values are never smaller than uncorrected ones
+        ok_((null.p(observed) >= ref.p(observed)).all())
+        # threshold controls FWE
+        thr = null.threshold(0.1)
+        ok_((null.ca.max_samples > thr).mean() <= 0.1)
+        ok_(null.p(thr + 1e-6) <= 0.1)
+
+        self.failUnlessRaises(ValueError, MCMaxStatNullDist, tail='both')
+
+
+    def test_max_stat_null_dist_ties(self):
+        ds = datasets['uni2small']
+        for tail, values in (('right', [3., 1.]), ('left', [3., 5.])):
+            # all maxima (minima) of the permutations are tied
+            null = MCMaxStatNullDist(permutations=20, tail=tail)
+            null.fit(lambda ds_: np.array(values), ds)
+            assert_array_equal(null.ca.max_samples, [3.] * 20)
+            # reaching the statistic of every permutation is not significant
+            assert_equal(null.p(3.), 1.0)
+            assert_array_equal(null.p(np.array(values)), [1.0, 1.0])
+            # only going beyond it is
+            more = tail == 'right' and 3.5 or 2.5
+            assert_almost_equal(null.p(more), 1 / 21.0)
+            thr = null.threshold(0.1)
+            assert_equal(thr, 3.)
+            ok_(null.p(thr) > 0.1)
+            ok_(null.p(more) <= 0.1)
+            # not enough permutations for such alpha
+            assert_equal(null.threshold(0.01),
+                         tail == 'right' and np.inf or -np.inf)
+
+
+    def test_mc_null_dist_retrain(self):
+        skip_if_no_external('scipy')
+        from mvpa.clfs.gpr import GPR
+        from mvpa.clfs.transerror import TransferError
+
+        class NonRetrainableGPR(GPR):
+            __tags__ = [t for t in GPR.__tags__ if t != 'retrainable']
+
+        ds = datasets['chirp_linear']
+        wdata, vdata = ds[:200], ds[200:]
+        dist_samples = []
+        for clf in (GPR(), NonRetrainableGPR()):
+            retrained = []
+            retrain = clf.retrain
+            def retrain_(*args, **kwargs):
+                retrained.append(kwargs)
+                return retrain(*args, **kwargs)
+            clf.retrain = retrain_
+            null = MCNullDist(permutations=10, seed=1,
+                              enable_ca=['dist_samples'])
+            null.fit(TransferError(clf), wdata, vdata)
+            dist_samples.append(null.ca.dist_samples)
+            if 'retrainable' in clf.__tags__:
+                # all but the first permutation only retrain on new targets
+                assert_equal(retrained, [dict(targets=True)] * 9)
+                # and retrainable flag got restored
+                ok_(not clf.params.retrainable)
+            else:
+                assert_equal(retrained, [])
+        assert_array_almost_equal(dist_samples[0], dist_samples[1])
+
+
     def test_anova(self):
         """Do some extended testing of OneWayAnova
 
@@ -176,6 +176,71 @@ class SVMTests(unittest.TestCase):
             self.failUnlessRaises(TypeError, sg.SVM, C=10, kernel_type='RBF',
                                   coef0=3)
 
+    def test_libsvm_precomputed_kernel(self):
+        skip_if_no_external('libsvm')
+        from mvpa.kernels.base import CachedKernel, PrecomputedKernel
+        from mvpa.kernels.np import LinearKernel
+        from mvpa.clfs.libsvmc.sens import LinearSVMWeights
+
+        ds = datasets['uni3medium']
+        train, test = ds[ds.sa.chunks != 0], ds[ds.sa.chunks == 0]
+        results = []
+        for kernel in (None, LinearKernel(), CachedKernel(LinearKernel())):
+            if kernel is None:
+                clf = libsvm.SVM(C=1.)
+            else:
+                clf = libsvm.SVM(kernel=kernel, C=1.)
+            clf.ca.enable('estimates')
+            clf.train(train)
+            results.append((clf.predict(test), clf.ca.estimates,
+                            LinearSVMWeights(clf)(train).samples))
+        for res in results[1:]:
+            assert_array_equal(res[0], results[0][0])
+            for e, e0 in zip(res[1], results[0][1]):
+                for k in e0:
+                    assert_almost_equal(e[k], e0[k])
+            assert_array_almost_equal(res[2], results[0][2])
+
+        # matrices can be given explicitly
+        clf = libsvm.SVM(C=1., kernel=PrecomputedKernel(
+            matrix=np.dot(train.samples, train.samples.T)))
+        clf.train(train)
+        clf.params.kernel = PrecomputedKernel(
+            matrix=np.dot(test.samples, train.samples.T))
+        assert_array_equal(clf.predict(test), results[0][0])
+
+        # cross-validation slices the cached kernel
+        ck = CachedKernel(LinearKernel())
+        cve = CrossValidatedTransferError(
+            TransferError(libsvm.SVM(C=1.)), NFoldSplitter())
+        cve_ = CrossValidatedTransferError(
+            TransferError(libsvm.SVM(kernel=ck, C=1.)), NFoldSplitter())
+        assert_array_equal(cve(ds), cve_(ds))
+        ok_(not ck._recomputed)
+        assert_equal(ck._kfull.shape, (len(ds), len(ds)))
+
+
+    def test_libsvm_model_pickling(self):
+        skip_if_no_external('libsvm')
+        import cPickle
+        from mvpa.clfs.libsvmc._svm import SVMModel
+        from mvpa.kernels.libsvm import RbfLSKernel
+
+        ds = datasets['uni3medium']
+        for clf in (libsvm.SVM(C=1.), libsvm.SVM(kernel=RbfLSKernel(), C=1.),
+                    libsvm.SVM(C=1., probability=1)):
+            clf.train(ds)
+            model = clf.model
+            model_ = cPickle.loads(cPickle.dumps(model, 2))
+            ok_(isinstance(model_, SVMModel))
+            # everything is restored at full precision
+            assert_array_equal(model_.get_sv(), model.get_sv())
+            assert_array_equal(model_.get_sv_coef(), model.get_sv_coef())
+            assert_array_equal(model_.get_rho(), model.get_rho())
+            for sample in ds.samples:
+                assert_equal(model_.predict_values_raw(sample),
+                             model.predict_values_raw(sample))
+
 def suite():
     return unittest.makeSuite(SVMTests)
 
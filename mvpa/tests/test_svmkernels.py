@@ -160,6 +160,33 @@ class SVMKernelTests(unittest.TestCase):
         # were just ints, and then non-unique after vstack
         assert_array_equal(errs.samples, errs_.samples)
 
+    def test_cvte_precaches_kernel(self):
+        skip_if_no_external('shogun', ver_dep='shogun:rev', min_version=4455)
+
+        k  = LinearSGKernel(normalizer_cls=False)
+        ck = CachedKernel(LinearSGKernel(normalizer_cls=False))
+
+        clf = sgSVM(svm_impl='libsvm', kernel=k, C=-1)
+        clf_ = sgSVM(svm_impl='libsvm', kernel=ck, C=-1)
+
+        cvte = CrossValidatedTransferError(
+            TransferError(clf), NFoldSplitter())
+        cvte_ = CrossValidatedTransferError(
+            TransferError(clf_), NFoldSplitter())
+
+        ds = datasets['uni2medium'].copy(deep=True)
+        errs = cvte(ds)
+        # no explicit ck.compute(ds) -- CVTE must cache the full dataset
+        errs_ = cvte_(ds)
+        ok_(not ck._recomputed)
+        assert_equal(ck._kfull.shape, (len(ds), len(ds)))
+        assert_array_equal(errs, errs_)
+
+        # and must not recompute it whenever called again
+        errs_ = cvte_(ds)
+        ok_(not ck._recomputed)
+        assert_array_equal(errs, errs_)
+
 def suite():
     return unittest.makeSuite(SVMKernelTests)
 
@@ -50,6 +50,15 @@ if sys.argv.count('--no-libsvm'):
     sys.argv.remove('--no-libsvm')
     bind_libsvm = None
 
+# multithreaded SMLR requires OpenMP support of the compiler
+smlrc_extra_compile_args = []
+smlrc_extra_link_args = []
+if sys.argv.count('--with-openmp'):
+    # clean argv if necessary (or distutils will complain)
+    sys.argv.remove('--with-openmp')
+    smlrc_extra_compile_args += ['-fopenmp']
+    smlrc_extra_link_args += ['-fopenmp']
+
 # if requested:
 if bind_libsvm == 'local':
     # we will provide libsvm sources later on # if libsvm.a is available locally -- use it
@@ -94,7 +103,8 @@ smlrc_ext = Extension(
     #library_dirs = library_dirs,
     libraries = ['m'],
     # extra_compile_args = ['-O0'],
-    extra_link_args = extra_link_args,
+    extra_compile_args = smlrc_extra_compile_args,
+    extra_link_args = extra_link_args + smlrc_extra_link_args,
     language = 'c')
 
 ext_modules = [smlrc_ext]